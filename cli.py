@@ -0,0 +1,120 @@
+"""
+Single entry point for the transaction processing system
+Each subcommand imports what it needs when it runs, so quick commands
+(status, monitor) never load pandas, boto3 or the Google API client.
+
+Usage:
+    python cli.py run-all               # X and Y (RUNNER=processes for the supervisor)
+    python cli.py run-x | run-y
+    python cli.py status                # one line from the stats tables
+    python cli.py monitor [--continuous N] [--rebuild-stats] [--rebuild-rollups]
+    python cli.py reset [--yes]
+    python cli.py setup-check
+    python cli.py bench [performance_test.py args]
+    python cli.py replay|export|plan-check|soak [script args]
+"""
+import argparse
+import sys
+
+def run_all(args):
+    import main
+    return main.main()
+
+def run_x(args):
+    import database
+    from mechanism_x import MechanismX
+    database.init_database()
+    MechanismX().run()
+
+def run_y(args):
+    import database
+    from mechanism_y import MechanismY
+    database.init_database()
+    MechanismY().run()
+
+def status(args):
+    import monitor
+    monitor.print_status()
+
+def monitor_command(args):
+    import database
+    import monitor
+
+    if args.rebuild_stats:
+        database.rebuild_system_stats()
+        print("Stats tables rebuilt from base tables")
+    elif args.rebuild_rollups:
+        database.rebuild_rollups()
+        print("Analytics rollups rebuilt from base tables")
+    elif args.continuous:
+        monitor.monitor_continuous(args.continuous)
+    else:
+        monitor.print_dashboard()
+
+def reset(args):
+    import reset_system
+
+    if args.yes:
+        reset_system.reset_database()
+    else:
+        reset_system.main()
+
+def setup_check(args):
+    import test_setup
+    return test_setup.main()
+
+def run_script(module_name, script_args):
+    """Run a script's own main() with script_args as its argv"""
+    import importlib
+    module = importlib.import_module(module_name)
+    sys.argv = [f"{module_name}.py"] + script_args
+    return module.main()
+
+PASSTHROUGH = {
+    'bench': ('performance_test', "Performance tests (performance_test.py)"),
+    'replay': ('replay', "Offline replay/backtest (replay.py)"),
+    'export': ('export_parquet', "Parquet export (export_parquet.py)"),
+    'plan-check': ('plan_check', "Query plan regression check (plan_check.py)"),
+    'soak': ('soak_test', "Soak test against local stand-ins (soak_test.py)"),
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Transaction processing system")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('run-all', help="Run Mechanism X and Y").set_defaults(func=run_all)
+    commands.add_parser('run-x', help="Run Mechanism X only").set_defaults(func=run_x)
+    commands.add_parser('run-y', help="Run Mechanism Y only").set_defaults(func=run_y)
+    commands.add_parser('status', help="One-line system status").set_defaults(func=status)
+
+    monitor_parser = commands.add_parser('monitor', help="Monitoring dashboard")
+    monitor_parser.add_argument('--continuous', type=int, metavar='SECONDS',
+                                help="Refresh every SECONDS")
+    monitor_parser.add_argument('--rebuild-stats', action='store_true')
+    monitor_parser.add_argument('--rebuild-rollups', action='store_true')
+    monitor_parser.set_defaults(func=monitor_command)
+
+    reset_parser = commands.add_parser('reset', help="Drop and recreate all tables")
+    reset_parser.add_argument('--yes', action='store_true', help="Skip the confirmation prompt")
+    reset_parser.set_defaults(func=reset)
+
+    commands.add_parser('setup-check', help="Verify packages, config, database and S3").set_defaults(
+        func=setup_check
+    )
+
+    # Listed for --help only, main() hands their arguments to the script untouched
+    for name, (_, help_text) in PASSTHROUGH.items():
+        commands.add_parser(name, help=help_text, add_help=False)
+
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in PASSTHROUGH:
+        return run_script(PASSTHROUGH[argv[0]][0], argv[1:]) or 0
+
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+Export transactions or detections to date-partitioned Parquet
+Streams the table out of Postgres with COPY ... TO STDOUT, parses it in
+bounded blocks with pyarrow and writes one Parquet file per day:
+    <output>/<table>/date=YYYY-MM-DD/part-<run>.parquet
+locally or under EXPORT_S3_PREFIX in the S3 bucket. Memory stays around one
+row group per run regardless of table size; rows are sorted by date in
+Postgres so only one partition file is open at a time.
+
+Usage:
+    python export_parquet.py transactions [--start 2024-01-01] [--end 2024-02-01]
+        [--merchant M001,M002] [--output DIR | --s3]
+    python export_parquet.py detections [--pattern PatId1] [...]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+import config
+import database
+import s3_handler
+
+TIMESTAMP = pa.timestamp('us')
+
+# table -> (date column, [(column, SQL expression, arrow type)])
+TABLES = {
+    'transactions': ('transaction_date', [
+        ('transaction_id', 'transaction_id', pa.string()),
+        ('customer_id', 'customer_id', pa.string()),
+        ('customer_name', 'customer_name', pa.string()),
+        ('gender', 'gender', pa.string()),
+        ('merchant_id', 'merchant_id', pa.string()),
+        ('transaction_type', 'transaction_type', pa.string()),
+        ('transaction_amount', 'transaction_amount::DECIMAL(15, 2)', pa.decimal128(15, 2)),
+        ('transaction_date', 'transaction_date', TIMESTAMP),
+        ('processed_at', 'processed_at', TIMESTAMP),
+    ]),
+    'detections': ('detection_time', [
+        ('id', 'id', pa.int64()),
+        ('y_start_time', 'y_start_time', TIMESTAMP),
+        ('detection_time', 'detection_time', TIMESTAMP),
+        ('pattern_id', 'pattern_id', pa.string()),
+        ('action_type', 'action_type', pa.string()),
+        ('customer_name', 'customer_name', pa.string()),
+        ('merchant_id', 'merchant_id', pa.string()),
+        ('uploaded_to_s3', 'uploaded_to_s3', pa.bool_()),
+        ('created_at', 'created_at', TIMESTAMP),
+    ]),
+}
+
+def build_query(table, start=None, end=None, merchants=None, patterns=None):
+    """SELECT for the export, filtered and ordered by the partition date"""
+    date_column, columns = TABLES[table]
+    source = table
+    if table == 'transactions' and config.SCHEMA_MODE == 'compact':
+        source = 'transactions_decoded'
+
+    conditions, params = [], []
+    if start:
+        conditions.append(f"{date_column} >= %s")
+        params.append(start)
+    if end:
+        conditions.append(f"{date_column} < %s")
+        params.append(end)
+    if merchants:
+        conditions.append("merchant_id = ANY(%s)")
+        params.append(list(merchants))
+    if patterns:
+        conditions.append("pattern_id = ANY(%s)")
+        params.append(list(patterns))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    select = ', '.join(expression for _, expression, _ in columns)
+    return f"SELECT {select} FROM {source} {where} ORDER BY {date_column}", params
+
+def stream_batches(query, params, columns, block_size):
+    """
+    Yield arrow record batches of the query result. COPY writes CSV into a
+    pipe from a helper thread while pyarrow parses it block by block.
+    """
+    conn = database.get_db_connection()
+    cur = conn.cursor()
+    copy_sql = cur.mogrify(
+        f"COPY ({query}) TO STDOUT WITH (FORMAT csv, NULL '\\N')", params
+    ).decode('utf-8')
+
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def copy_out():
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe:
+                cur.copy_expert(copy_sql, pipe)
+        except BrokenPipeError:
+            pass  # reader stopped early
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=copy_out, name="CopyOut", daemon=True)
+    thread.start()
+
+    opened = False
+    parse_error = None
+    try:
+        with os.fdopen(read_fd, 'rb') as pipe:
+            try:
+                reader = pv.open_csv(
+                    pipe,
+                    read_options=pv.ReadOptions(
+                        column_names=[name for name, _, _ in columns], block_size=block_size
+                    ),
+                    # Quoted customer names may contain newlines spanning blocks
+                    parse_options=pv.ParseOptions(newlines_in_values=True),
+                    convert_options=pv.ConvertOptions(
+                        column_types={name: arrow_type for name, _, arrow_type in columns},
+                        null_values=['\\N'], strings_can_be_null=True,
+                        quoted_strings_can_be_null=False,
+                        true_values=['t'], false_values=['f'],
+                    ),
+                )
+                opened = True
+                for batch in reader:
+                    yield batch
+            except pa.ArrowInvalid as e:
+                # No rows at all (open fails), a bad value, or a COPY failure that
+                # cut the stream mid-row; raised once the pipe is closed (below)
+                parse_error = e
+        # Read end closed: a COPY still writing gets BrokenPipeError and ends
+    finally:
+        thread.join()
+        cur.close()
+        conn.close()
+
+    if errors:
+        raise errors[0]
+    if parse_error is not None and opened:
+        raise parse_error
+
+def split_by_day(batch, date_column):
+    """Split a date-ordered batch into (YYYY-MM-DD, slice) runs"""
+    days = pc.cast(batch.column(date_column), pa.date32())
+    # Nulls sort last; -1 keeps them in their own run
+    values = pc.fill_null(pc.cast(days, pa.int32()), -1).to_numpy()
+    boundaries = [0, *(np.flatnonzero(np.diff(values)) + 1), len(values)]
+    for start, end in zip(boundaries, boundaries[1:]):
+        day = days[start].as_py()
+        yield (day.isoformat() if day else 'unknown'), batch.slice(start, end - start)
+
+class PartitionWriter:
+    """Parquet file for one date partition, written in row groups of row_group_rows"""
+
+    def __init__(self, schema, path, to_s3, row_group_rows):
+        self.path = path
+        self.to_s3 = to_s3
+        self.row_group_rows = row_group_rows
+        self.pending = []
+        self.pending_rows = 0
+        self.rows = 0
+
+        if to_s3:
+            self.sink = s3_handler.S3StreamWriter(
+                s3_handler.get_s3_client(), path, content_type='application/vnd.apache.parquet'
+            )
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.sink = open(path + '.tmp', 'wb')
+        self.writer = pq.ParquetWriter(self.sink, schema, compression='zstd')
+
+    def write(self, batch):
+        self.pending.append(batch)
+        self.pending_rows += batch.num_rows
+        if self.pending_rows >= self.row_group_rows:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.writer.write_table(pa.Table.from_batches(self.pending),
+                                    row_group_size=self.row_group_rows)
+            self.rows += self.pending_rows
+        self.pending = []
+        self.pending_rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        self.sink.close()
+        if not self.to_s3:
+            os.replace(self.path + '.tmp', self.path)
+
+def export_table(table, output=None, to_s3=False, start=None, end=None, merchants=None,
+                 patterns=None, row_group_rows=None, block_size=None):
+    """Export one table, returns a summary dict"""
+    date_column, columns = TABLES[table]
+    row_group_rows = row_group_rows or config.EXPORT_ROW_GROUP_ROWS
+    block_size = block_size or config.EXPORT_BLOCK_SIZE
+    base = f"{config.EXPORT_S3_PREFIX}{table}" if to_s3 else os.path.join(output or config.EXPORT_PATH, table)
+    run_id = time.strftime('%Y%m%d_%H%M%S')
+
+    query, params = build_query(table, start, end, merchants, patterns)
+    started = time.time()
+    files = []
+    rows = 0
+    current_day, writer = None, None
+
+    for batch in stream_batches(query, params, columns, block_size):
+        for day, part in split_by_day(batch, date_column):
+            if day != current_day:
+                if writer is not None:
+                    writer.close()
+                path = f"{base}/date={day}/part-{run_id}.parquet"
+                writer = PartitionWriter(batch.schema, path, to_s3, row_group_rows)
+                files.append(path)
+                current_day = day
+            writer.write(part)
+            rows += part.num_rows
+
+    if writer is not None:
+        writer.close()
+
+    return {
+        'table': table,
+        'rows': rows,
+        'files': files,
+        'seconds': time.time() - started,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a table to date-partitioned Parquet")
+    parser.add_argument('table', choices=sorted(TABLES))
+    parser.add_argument('--start', help="First date to export (inclusive)")
+    parser.add_argument('--end', help="Date to stop at (exclusive)")
+    parser.add_argument('--merchant', help="Comma-separated merchant ids")
+    parser.add_argument('--pattern', help="Comma-separated pattern ids (detections only)")
+    parser.add_argument('--output', help=f"Local output directory (default {config.EXPORT_PATH})")
+    parser.add_argument('--s3', action='store_true', help=f"Write to s3://{config.S3_BUCKET}/{config.EXPORT_S3_PREFIX}")
+    parser.add_argument('--row-group-rows', type=int, help="Rows per Parquet row group")
+    args = parser.parse_args()
+
+    if args.pattern and args.table != 'detections':
+        parser.error("--pattern only applies to detections")
+
+    print("=" * 60)
+    print(f"Parquet Export: {args.table}")
+    print("=" * 60)
+
+    summary = export_table(
+        args.table, output=args.output, to_s3=args.s3, start=args.start, end=args.end,
+        merchants=args.merchant.split(',') if args.merchant else None,
+        patterns=args.pattern.split(',') if args.pattern else None,
+        row_group_rows=args.row_group_rows,
+    )
+
+    rate = summary['rows'] / summary['seconds'] if summary['seconds'] else 0
+    print(f"\n✅ Exported {summary['rows']:,} rows to {len(summary['files'])} files "
+          f"in {summary['seconds']:.1f}s ({rate:,.0f} rows/second)")
+    for path in summary['files'][:10]:
+        print(f"  {path}")
+    if len(summary['files']) > 10:
+        print(f"  ... {len(summary['files']) - 10} more")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
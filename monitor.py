@@ -3,49 +3,31 @@
 Monitoring and dashboard script for the transaction processing system
 """
 import database
-import s3_handler
 import time
 from datetime import datetime
-import psycopg2
 
 def get_system_stats():
-    """Get current system statistics"""
-    conn = database.get_db_connection()
-    cur = conn.cursor()
+    """Get current system statistics from the incrementally maintained stats tables"""
+    counters, sketches, detection_counts = database.get_system_counters()
     
     stats = {}
     
-    # Total transactions processed
-    cur.execute("SELECT COUNT(*) FROM transactions")
-    stats['total_transactions'] = cur.fetchone()[0]
-    
-    # Unique customers
-    cur.execute("SELECT COUNT(DISTINCT customer_id) FROM transactions")
-    stats['unique_customers'] = cur.fetchone()[0]
+    # Counters are updated at ingest/detection time, so no full-table scans here
+    stats['total_transactions'] = counters.get('total_transactions', 0)
+    stats['unique_customers'] = sketches.get('customers', 0)
+    stats['unique_merchants'] = sketches.get('merchants', 0)
+    stats['detections'] = detection_counts
+    stats['pending_detections'] = counters.get('pending_detections', 0)
     
-    # Unique merchants
-    cur.execute("SELECT COUNT(DISTINCT merchant_id) FROM transactions")
-    stats['unique_merchants'] = cur.fetchone()[0]
+    conn = database.get_db_connection()
+    cur = conn.cursor()
     
     # Last processed row
     cur.execute("SELECT last_processed_row FROM processing_state ORDER BY id DESC LIMIT 1")
     result = cur.fetchone()
     stats['last_processed_row'] = result[0] if result else 0
     
-    # Detection counts by pattern
-    cur.execute("""
-        SELECT pattern_id, action_type, COUNT(*) as count
-        FROM detections
-        GROUP BY pattern_id, action_type
-        ORDER BY pattern_id
-    """)
-    stats['detections'] = cur.fetchall()
-    
-    # Pending detections (not uploaded)
-    cur.execute("SELECT COUNT(*) FROM detections WHERE uploaded_to_s3 = FALSE")
-    stats['pending_detections'] = cur.fetchone()[0]
-    
-    # Recent detections
+    # Recent detections (served by idx_detections_time)
     cur.execute("""
         SELECT detection_time, pattern_id, action_type, customer_name, merchant_id
         FROM detections
@@ -70,8 +52,8 @@ def print_dashboard():
         
         print("\n📊 PROCESSING STATS")
         print(f"  Total Transactions Processed: {stats['total_transactions']:,}")
-        print(f"  Unique Customers: {stats['unique_customers']:,}")
-        print(f"  Unique Merchants: {stats['unique_merchants']:,}")
+        print(f"  Unique Customers (approx): {stats['unique_customers']:,}")
+        print(f"  Unique Merchants (approx): {stats['unique_merchants']:,}")
         print(f"  Last Processed Row: {stats['last_processed_row']:,}")
         
         print("\n🎯 DETECTION SUMMARY")
@@ -92,10 +74,11 @@ def print_dashboard():
         else:
             print("  No detections yet")
         
-        # S3 files count
+        # S3 chunk count from the manifest head (single GET, no LIST)
         try:
-            input_files = s3_handler.list_s3_transaction_files()
-            print(f"\n☁️  S3 INPUT FILES: {len(input_files)} chunks uploaded")
+            import s3_handler  # boto3 and pandas, only needed here
+            manifest = s3_handler.load_manifest()
+            print(f"\n☁️  S3 INPUT FILES: {manifest['chunk_count']} chunks uploaded")
         except Exception as e:
             print(f"\n☁️  S3 INPUT FILES: Unable to fetch ({str(e)[:50]})")
         
@@ -115,10 +98,24 @@ def monitor_continuous(interval=5):
     except KeyboardInterrupt:
         print("\n\nMonitoring stopped.")
 
+def print_status():
+    """One-line status from the stats tables (no S3, no table scans)"""
+    counters, sketches, detection_counts = database.get_system_counters()
+    detections = sum(count for _, _, count in detection_counts)
+    print(f"transactions={counters.get('total_transactions', 0)} "
+          f"customers~{sketches.get('customers', 0)} merchants~{sketches.get('merchants', 0)} "
+          f"detections={detections} pending_uploads={counters.get('pending_detections', 0)}")
+
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) > 1 and sys.argv[1] == "--continuous":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rebuild-stats":
+        database.rebuild_system_stats()
+        print("Stats tables rebuilt from base tables")
+    elif len(sys.argv) > 1 and sys.argv[1] == "--rebuild-rollups":
+        database.rebuild_rollups()
+        print("Analytics rollups rebuilt from base tables")
+    elif len(sys.argv) > 1 and sys.argv[1] == "--continuous":
         interval = int(sys.argv[2]) if len(sys.argv) > 2 else 5
         monitor_continuous(interval)
     else:
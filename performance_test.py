@@ -2,6 +2,7 @@
 """
 Performance testing script
 """
+import sys
 import time
 import database
 import random
@@ -60,31 +61,346 @@ def test_pattern_detection():
     
     start = time.time()
     
-    detections_1 = mechanism_y.detect_pattern_1()
+    count_1 = mechanism_y.detect_pattern_1()
     time_1 = time.time() - start
     
     start = time.time()
-    detections_2 = mechanism_y.detect_pattern_2()
+    count_2 = mechanism_y.detect_pattern_2()
     time_2 = time.time() - start
     
     start = time.time()
-    detections_3 = mechanism_y.detect_pattern_3()
+    count_3 = mechanism_y.detect_pattern_3()
     time_3 = time.time() - start
     
-    print(f"\n✅ Pattern 1 (UPGRADE): {len(detections_1)} detections in {time_1:.2f}s")
-    print(f"✅ Pattern 2 (CHILD): {len(detections_2)} detections in {time_2:.2f}s")
-    print(f"✅ Pattern 3 (DEI-NEEDED): {len(detections_3)} detections in {time_3:.2f}s")
+    print(f"\n✅ Pattern 1 (UPGRADE): {count_1} detections in {time_1:.2f}s")
+    print(f"✅ Pattern 2 (CHILD): {count_2} detections in {time_2:.2f}s")
+    print(f"✅ Pattern 3 (DEI-NEEDED): {count_3} detections in {time_3:.2f}s")
     
     total_time = time_1 + time_2 + time_3
-    total_detections = len(detections_1) + len(detections_2) + len(detections_3)
+    total_detections = count_1 + count_2 + count_3
     
     print(f"\n📊 Total: {total_detections} detections in {total_time:.2f}s")
 
+def generate_pattern_transactions(count=70000, seed=42):
+    """
+    Generate transactions shaped to trigger all three patterns:
+    one merchant above the 50K threshold, low-amount frequent customers
+    and merchants with a male-skewed customer base.
+    Returns (transactions, customer_importance)
+    """
+    rng = random.Random(seed)
+    start_date = datetime(2024, 1, 1)
+    
+    num_customers = 3000
+    genders = rng.choices(['Male', 'male', 'Female', 'FEMALE', 'Other'],
+                          weights=[35, 15, 25, 10, 15], k=num_customers)
+    child_customers = rng.sample(range(num_customers), 60)
+    child_set = set(child_customers)
+    
+    transactions = []
+    for i in range(count):
+        if rng.random() < 0.1:
+            customer = rng.choice(child_customers)
+        else:
+            customer = rng.randint(0, num_customers - 1)
+        if customer in child_set:
+            # Concentrate low spenders on one merchant so they reach 80 transactions
+            merchant = 'M002'
+            amount = round(rng.uniform(1, 30), 2)
+        else:
+            merchant = 'M001' if rng.random() < 0.9 else f"M{rng.randint(3, 40):03d}"
+            amount = round(rng.uniform(10, 1000), 2)
+        
+        transactions.append((
+            f"PX{seed:03d}{i:09d}",
+            f"C{customer:05d}",
+            f"Customer_{customer}",
+            genders[customer],
+            merchant,
+            rng.choice(['Online', 'POS', 'ATM']),
+            amount,
+            start_date + timedelta(minutes=i)
+        ))
+    
+    importance = [
+        (f"C{customer:05d}", transaction_type, round(rng.uniform(0, 5), 2))
+        for customer in range(num_customers)
+        for transaction_type in ['Online', 'POS', 'ATM']
+        if rng.random() < 0.8
+    ]
+    
+    return transactions, importance
+
+def detection_keys(detections):
+    """Reduce detection tuples to (pattern_id, customer_name, merchant_id)"""
+    return {(d[2], d[4], d[5]) for d in detections}
+
+def test_vector_equivalence():
+    """Check that the in-memory detector matches the SQL detectors on the same data"""
+    print("\n" + "=" * 60)
+    print("Testing Vector Detector Equivalence")
+    print("=" * 60)
+    
+    from mechanism_y import MechanismY
+    from vector_detector import VectorDetector
+    
+    transactions, importance = generate_pattern_transactions()
+    database.insert_customer_importance(importance)
+    database.insert_transactions(transactions)
+    
+    # Mirror the current database state into the in-memory detector
+    conn = database.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT customer_id, transaction_type, weightage FROM customer_importance")
+    importance_rows = cur.fetchall()
+    cur.execute("SELECT id, pattern_id, customer_name, merchant_id FROM detections")
+    existing = cur.fetchall()
+    cur.close()
+    conn.close()
+    last_detection_id = max((row[0] for row in existing), default=0)
+    
+    detector = VectorDetector()
+    detector.load_customer_importance(importance_rows)
+    detector.load_existing_detections([row[1:] for row in existing])
+    
+    # Streamed export: one FETCH_SIZE batch of transactions in memory at a time
+    for rows in database.stream_query("""
+        SELECT transaction_id, customer_id, customer_name, gender, merchant_id,
+               transaction_type, transaction_amount, transaction_date
+        FROM transactions
+    """):
+        detector.add_transactions([row[:6] + (float(row[6]),) + row[7:] for row in rows])
+    
+    now = datetime.now()
+    vector_keys = detection_keys(detector.detect_all_patterns(now, now))
+    
+    mechanism_y = MechanismY(backend='sql')
+    mechanism_y.y_start_time = now
+    mechanism_y.detect_all_patterns()
+    
+    # SQL detectors write straight to the detections table, read back the new rows
+    sql_keys = set()
+    for rows in database.stream_query(
+        "SELECT pattern_id, customer_name, merchant_id FROM detections WHERE id > %s",
+        (last_detection_id,)
+    ):
+        sql_keys.update(rows)
+    
+    for pattern_id in ['PatId1', 'PatId2', 'PatId3']:
+        sql_count = sum(1 for k in sql_keys if k[0] == pattern_id)
+        vector_count = sum(1 for k in vector_keys if k[0] == pattern_id)
+        print(f"  {pattern_id}: SQL {sql_count}, vector {vector_count}")
+    
+    if sql_keys == vector_keys:
+        print(f"\n✅ Vector detector matches SQL detectors ({len(sql_keys)} detections)")
+        return True
+    
+    print("\n❌ Detections differ")
+    print(f"  Only in SQL: {sorted(sql_keys - vector_keys)[:10]}")
+    print(f"  Only in vector: {sorted(vector_keys - sql_keys)[:10]}")
+    return False
+
+def test_vector_throughput(count=3000000, chunk_size=10000):
+    """Benchmark the database-free detector on a few million transactions"""
+    print("\n" + "=" * 60)
+    print("Testing Vector Detector Throughput")
+    print("=" * 60)
+    
+    from vector_detector import VectorDetector
+    
+    transactions, importance = generate_pattern_transactions(count)
+    detector = VectorDetector()
+    detector.load_customer_importance(importance)
+    
+    start = time.time()
+    for i in range(0, len(transactions), chunk_size):
+        detector.add_transactions(transactions[i:i + chunk_size])
+    ingest_time = time.time() - start
+    
+    start = time.time()
+    now = datetime.now()
+    detections = detector.detect_all_patterns(now, now)
+    detect_time = time.time() - start
+    
+    print(f"\n✅ Ingested {count:,} transactions in {ingest_time:.2f}s "
+          f"({count / ingest_time:,.0f} rows/second)")
+    print(f"✅ Full detection pass: {len(detections)} detections in {detect_time:.2f}s "
+          f"({count / detect_time:,.0f} rows/second)")
+
+def test_schema_sizes(count=500000, scratch_schema='schema_sizes_test'):
+    """
+    Load the same data into the legacy and compact schemas and compare sizes.
+    Uses tables in a scratch Postgres schema, dropped afterwards, so the live
+    tables (and their counters and rollups) are left alone.
+    """
+    print("\n" + "=" * 60)
+    print("Comparing Legacy and Compact Schema Sizes")
+    print("=" * 60)
+    
+    database.init_database()
+    
+    conn = database.get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f'DROP SCHEMA IF EXISTS "{scratch_schema}" CASCADE')
+    cur.execute(f'CREATE SCHEMA "{scratch_schema}"')
+    conn.commit()
+    try:
+        cur.execute(f'SET search_path TO "{scratch_schema}"')
+        cur.execute("CREATE TABLE transactions (LIKE public.transactions INCLUDING ALL)")
+        _compare_schema_sizes(cur, count)
+    finally:
+        conn.rollback()
+        cur.execute(f'DROP SCHEMA IF EXISTS "{scratch_schema}" CASCADE')
+        conn.commit()
+        cur.close()
+        conn.close()
+
+def _compare_schema_sizes(cur, count):
+    import compact_schema
+    from psycopg2.extras import execute_values
+    
+    transactions, _ = generate_pattern_transactions(count, seed=7)
+    compact_schema.create_tables(cur)
+    
+    for i in range(0, len(transactions), 10000):
+        chunk = transactions[i:i + 10000]
+        execute_values(cur, """
+            INSERT INTO transactions 
+            (transaction_id, customer_id, customer_name, gender, merchant_id, 
+            transaction_type, transaction_amount, transaction_date)
+            VALUES %s
+            ON CONFLICT (transaction_id) DO NOTHING
+        """, chunk)
+        compact_schema.insert_transactions(cur, chunk)
+    cur.execute("ANALYZE")
+    
+    print(f"\n{'Table':24} {'Rows':>10} {'Table size':>12} {'Index size':>12}")
+    for table in ['transactions', 'transactions_compact', 'customers', 'customer_names',
+                  'genders', 'merchants', 'transaction_types']:
+        cur.execute(f"""
+            SELECT COUNT(*), pg_size_pretty(pg_relation_size('{table}')),
+                   pg_size_pretty(pg_indexes_size('{table}'))
+            FROM {table}
+        """)
+        rows, table_size, index_size = cur.fetchone()
+        print(f"{table:24} {rows:>10,} {table_size:>12} {index_size:>12}")
+    
+    # PatId2-style GROUP BY on both layouts
+    for label, query in [
+        ('legacy', """SELECT customer_name, merchant_id FROM transactions
+                      GROUP BY customer_name, merchant_id
+                      HAVING COUNT(*) >= 80 AND AVG(transaction_amount) < 23"""),
+        ('compact', """SELECT name_key, merchant_key FROM transactions_compact
+                       GROUP BY name_key, merchant_key
+                       HAVING COUNT(*) >= 80 AND AVG(amount_cents) < 2300"""),
+    ]:
+        start = time.time()
+        cur.execute(query)
+        cur.fetchall()
+        print(f"  {label:8} PatId2 GROUP BY: {time.time() - start:.3f}s")
+
+def test_dedup_filter(count=1000000, probes=1000000):
+    """Measure the transaction-id Bloom filter: memory per million ids and false-positive rate"""
+    print("\n" + "=" * 60)
+    print("Testing Transaction-ID Dedup Filter")
+    print("=" * 60)
+    
+    import bloom
+    import config
+    
+    id_filter = bloom.BloomFilter(count, config.DEDUP_FILTER_ERROR_RATE)
+    ids = [f"T{i:012d}" for i in range(count)]
+    
+    start = time.time()
+    for i in range(0, count, 100000):
+        id_filter.update(ids[i:i + 100000])
+    add_time = time.time() - start
+    
+    missed = count - int(id_filter.contains_many(ids).sum())
+    
+    unseen = [f"U{i:012d}" for i in range(probes)]
+    start = time.time()
+    false_positives = int(id_filter.contains_many(unseen).sum())
+    probe_time = time.time() - start
+    
+    print(f"\n✅ {count:,} ids in {id_filter.byte_size / 1024 / 1024:.2f} MB "
+          f"({id_filter.byte_size / count * 1e6 / 1024 / 1024:.2f} MB per million ids, "
+          f"{id_filter.num_hashes} hashes)")
+    print(f"✅ False negatives: {missed}")
+    print(f"✅ False-positive rate: {false_positives / probes:.5f} "
+          f"(target {config.DEDUP_FILTER_ERROR_RATE})")
+    print(f"✅ Add: {count / add_time:,.0f} ids/second, probe: {probes / probe_time:,.0f} ids/second")
+
+def test_local_storage(chunks=30, chunk_size=10000):
+    """Round-trip chunks through the local storage backend: upload, mapped read, streamed read"""
+    print("\n" + "=" * 60)
+    print("Testing Local Storage Backend")
+    print("=" * 60)
+    
+    import shutil
+    import tempfile
+    import pandas as pd
+    import config
+    import s3_handler
+    
+    root = tempfile.mkdtemp(prefix='storage_bench_')
+    config.STORAGE_BACKEND = 'local'
+    config.LOCAL_STORAGE_PATH = root
+    df = pd.DataFrame(generate_test_transactions(chunk_size), columns=[
+        'TransactionId', 'CustomerId', 'CustomerName', 'Gender', 'MerchantId',
+        'TransactionType', 'TransactionAmount', 'TransactionDate'
+    ])
+    
+    try:
+        start = time.time()
+        uploads = [s3_handler.upload_transactions_to_s3(df, i * chunk_size, (i + 1) * chunk_size)
+                   for i in range(chunks)]
+        upload_time = time.time() - start
+        
+        start = time.time()
+        for chunk in uploads:
+            s3_handler.download_s3_file_to_dataframe(chunk['key'], chunk['checksum'])
+        mapped_time = time.time() - start
+        
+        # Same objects through get_object, as on the S3 backend
+        store = s3_handler.get_s3_client()
+        start = time.time()
+        for chunk in uploads:
+            obj = store.get_object(Bucket=config.S3_BUCKET, Key=chunk['key'])
+            with obj['Body'] as body:
+                s3_handler._read_chunk(body, obj.get('ContentEncoding'), chunk['key'], chunk['checksum'])
+        streamed_time = time.time() - start
+    finally:
+        shutil.rmtree(root)
+    
+    rows = chunks * chunk_size
+    print(f"\n✅ Upload: {rows / upload_time:,.0f} rows/second ({config.CHUNK_COMPRESSION})")
+    print(f"✅ Mapped read: {rows / mapped_time:,.0f} rows/second")
+    print(f"✅ Streamed read: {rows / streamed_time:,.0f} rows/second")
+
 def main():
     print("=" * 60)
     print("Performance Testing")
     print("=" * 60)
     
+    if len(sys.argv) > 1 and sys.argv[1] == "--bloom":
+        # Database-free, reports memory and false-positive rate of the dedup filter
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+        test_dedup_filter(count)
+        return
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "--storage":
+        # Uses a temporary local storage directory, no database or S3
+        chunks = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+        test_local_storage(chunks)
+        return
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "--vector":
+        # Database-free benchmark, safe to run anywhere
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 3000000
+        test_vector_throughput(count)
+        return
+    
     print("\n⚠️  This will add test data to your database.")
     response = input("Continue? (yes/no): ")
     
@@ -92,8 +408,15 @@ def main():
         print("Cancelled.")
         return
     
+    if len(sys.argv) > 1 and sys.argv[1] == "--schema-sizes":
+        # Scratch schema, dropped afterwards
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 500000
+        test_schema_sizes(count)
+        return
+    
     test_bulk_insert()
     test_pattern_detection()
+    test_vector_equivalence()
     
     print("\n" + "=" * 60)
     print("Performance testing complete!")
@@ -0,0 +1,206 @@
+"""
+Query plan capture and regression check for the detection and analysis SQL
+Loads a synthetic dataset into a scratch Postgres database, runs
+EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) for the three detection queries and the
+transaction/detection queries in query_examples.sql, and compares plan shape
+and execution time against stored baselines.
+
+Usage:
+    python plan_check.py --save-baseline [--rows N]   # record baselines
+    python plan_check.py [--rows N] [--threshold 0.5] # compare, exit 1 on regression
+    python plan_check.py --skip-load                  # reuse the loaded dataset
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import psycopg2
+import config
+import database
+from mechanism_y import MechanismY, pattern_query
+from performance_test import generate_pattern_transactions
+
+QUERY_EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_examples.sql')
+
+# Analysis queries on catalogs/activity views measure the server, not our SQL
+SKIP_ANALYSIS = re.compile(r'pg_|processing_state|transactions_decoded')
+
+def ensure_database(name):
+    """Create the scratch database if it does not exist"""
+    conn = psycopg2.connect(
+        host=config.DB_HOST, port=config.DB_PORT, database='postgres',
+        user=config.DB_USER, password=config.DB_PASSWORD
+    )
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (name,))
+    if cur.fetchone() is None:
+        cur.execute(f'CREATE DATABASE "{name}"')
+    cur.close()
+    conn.close()
+
+def load_dataset(rows, batch_size=50000):
+    """Reload the scratch database with a synthetic dataset and seed detections"""
+    conn = database.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS transactions, detections, customer_importance, "
+                "system_counters, system_sketches, detection_counters, transactions_compact, "
+                "customers, customer_names, genders, merchants, transaction_types, "
+                "transaction_aggregates, archived_transaction_ids, merchant_daily_rollup, "
+                "customer_merchant_rollup, detection_hourly_rollup, window_buckets, "
+                "ingested_chunks CASCADE")
+    conn.commit()
+    cur.close()
+    conn.close()
+    database.init_database()
+
+    transactions, importance = generate_pattern_transactions(rows)
+    database.insert_customer_importance(importance)
+    for start in range(0, len(transactions), batch_size):
+        database.insert_transactions(transactions[start:start + batch_size])
+
+    # One detection pass so the NOT EXISTS probes run against a populated detections table
+    mechanism_y = MechanismY(backend='sql')
+    mechanism_y.y_start_time = mechanism_y.get_ist_time()
+    detections = mechanism_y.detect_all_patterns()
+
+    conn = database.get_db_connection()
+    conn.autocommit = True
+    conn.cursor().execute("VACUUM ANALYZE")
+    conn.close()
+    print(f"Loaded {len(transactions):,} transactions, {detections} detections")
+
+def analysis_queries():
+    """Named SELECT statements from query_examples.sql (name = preceding comment)"""
+    with open(QUERY_EXAMPLES) as f:
+        text = f.read()
+
+    queries = {}
+    name = None
+    statement = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('--'):
+            if not statement and stripped.strip('-= '):
+                name = stripped.strip('- ')
+            continue
+        if stripped:
+            statement.append(line)
+        if stripped.endswith(';'):
+            sql = '\n'.join(statement).rstrip(';')
+            statement = []
+            if name and not SKIP_ANALYSIS.search(sql):
+                slug = re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+                queries[f"analysis_{slug}"] = sql
+    return queries
+
+def plan_queries():
+    queries = {f"detect_pattern_{n}": pattern_query(n) for n in (1, 2, 3)}
+    queries.update(analysis_queries())
+    return queries
+
+def plan_nodes(plan, depth=0):
+    """Flatten a plan tree into 'depth:Node Type[:relation]' entries, in tree order"""
+    node = f"{depth}:{plan['Node Type']}"
+    if 'Relation Name' in plan:
+        node += f":{plan['Relation Name']}"
+    nodes = [node]
+    for child in plan.get('Plans', []):
+        nodes.extend(plan_nodes(child, depth + 1))
+    return nodes
+
+def capture(cur, sql, repeat):
+    """EXPLAIN ANALYZE a query repeat times, returns the last plan and best timing"""
+    times = []
+    for _ in range(repeat):
+        cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+        result = cur.fetchone()[0][0]
+        times.append(result['Execution Time'])
+
+    plan = result['Plan']
+    return {
+        # Best of N: noise from other activity only ever adds time
+        'execution_ms': round(min(times), 3),
+        'planning_ms': round(result['Planning Time'], 3),
+        'shared_hit_blocks': plan.get('Shared Hit Blocks', 0),
+        'shared_read_blocks': plan.get('Shared Read Blocks', 0),
+        'nodes': plan_nodes(plan),
+        'plan': result,
+    }
+
+def compare(name, current, baseline, threshold, min_ms):
+    """Return a list of regression messages for one query"""
+    problems = []
+    if current['nodes'] != baseline['nodes']:
+        removed = [n for n in baseline['nodes'] if n not in current['nodes']]
+        added = [n for n in current['nodes'] if n not in baseline['nodes']]
+        problems.append(f"{name}: plan changed (removed {removed}, added {added})")
+
+    # Ignore sub-millisecond noise on queries that are fast either way
+    limit = max(baseline['execution_ms'] * (1 + threshold), min_ms)
+    if current['execution_ms'] > limit:
+        problems.append(f"{name}: {current['execution_ms']:.1f}ms vs baseline "
+                        f"{baseline['execution_ms']:.1f}ms (+{threshold:.0%} allowed)")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture query plans and check them against baselines")
+    parser.add_argument('--rows', type=int, default=500000, help="Synthetic transactions to load")
+    parser.add_argument('--database', default='plan_check_db', help="Scratch database (dropped tables!)")
+    parser.add_argument('--baseline-dir', default='plan_baselines')
+    parser.add_argument('--save-baseline', action='store_true', help="Write plans as the new baseline")
+    parser.add_argument('--skip-load', action='store_true', help="Reuse the dataset already loaded")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per query, best time is kept")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Allowed slowdown, 0.5 = +50%%")
+    parser.add_argument('--min-ms', type=float, default=5.0, help="Never flag queries faster than this")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Query Plan Check")
+    print("=" * 60)
+
+    ensure_database(args.database)
+    config.DB_NAME = args.database
+
+    if not args.skip_load:
+        load_dataset(args.rows)
+
+    os.makedirs(args.baseline_dir, exist_ok=True)
+    conn = database.get_db_connection()
+    cur = conn.cursor()
+
+    problems = []
+    for name, sql in plan_queries().items():
+        current = capture(cur, sql, args.repeat)
+        conn.rollback()
+        path = os.path.join(args.baseline_dir, f"{name}.json")
+
+        if args.save_baseline or not os.path.exists(path):
+            with open(path, 'w') as f:
+                json.dump(current, f, indent=2)
+            print(f"  {name}: {current['execution_ms']:.1f}ms, {len(current['nodes'])} nodes (saved)")
+            continue
+
+        with open(path) as f:
+            baseline = json.load(f)
+        query_problems = compare(name, current, baseline, args.threshold, args.min_ms)
+        status = '❌' if query_problems else '✅'
+        print(f"  {status} {name}: {current['execution_ms']:.1f}ms "
+              f"(baseline {baseline['execution_ms']:.1f}ms)")
+        problems.extend(query_problems)
+
+    cur.close()
+    conn.close()
+
+    if problems:
+        print(f"\n❌ {len(problems)} plan regression(s):")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+
+    print("\n✅ No plan regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
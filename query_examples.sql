@@ -280,4 +280,148 @@ WHERE transaction_amount > (
     FROM transactions
 )
 ORDER BY transaction_amount DESC
-LIMIT 20;
\ No newline at end of file
+LIMIT 20;
+-- ============================================
+-- COMPACT SCHEMA (SCHEMA_MODE=compact)
+-- ============================================
+
+-- Table and index sizes, legacy vs compact layout
+SELECT 
+    relname as table_name,
+    pg_size_pretty(pg_relation_size(relid)) as table_size,
+    pg_size_pretty(pg_indexes_size(relid)) as index_size
+FROM pg_stat_user_tables
+WHERE relname IN ('transactions', 'transactions_compact', 'customers',
+                  'customer_names', 'genders', 'merchants', 'transaction_types')
+ORDER BY pg_total_relation_size(relid) DESC;
+
+-- The queries above can be run against the compact schema through the
+-- transactions_decoded view, which joins the dictionary tables back to names
+SELECT 
+    merchant_id,
+    COUNT(*) as total_transactions,
+    SUM(transaction_amount) as total_amount
+FROM transactions_decoded
+GROUP BY merchant_id
+ORDER BY total_transactions DESC
+LIMIT 20;
+
+-- ============================================
+-- ANALYTICS ROLLUPS
+-- ============================================
+
+-- The rollup tables are updated with every inserted batch and detection batch,
+-- so these versions of the queries above never scan transactions or detections
+
+-- Total transactions by merchant (rollup)
+WITH merchant_totals AS (
+    SELECT 
+        merchant_id,
+        SUM(transaction_count) as total_transactions,
+        SUM(amount_sum) as total_amount
+    FROM merchant_daily_rollup
+    GROUP BY merchant_id
+),
+merchant_customers AS (
+    SELECT merchant_id, COUNT(DISTINCT customer_id) as unique_customers
+    FROM customer_merchant_rollup
+    GROUP BY merchant_id
+)
+SELECT 
+    t.merchant_id,
+    t.total_transactions,
+    c.unique_customers,
+    t.total_amount,
+    t.total_amount / t.total_transactions as avg_amount
+FROM merchant_totals t
+JOIN merchant_customers c ON c.merchant_id = t.merchant_id
+ORDER BY total_transactions DESC
+LIMIT 20;
+
+-- Daily transactions per merchant (rollup)
+SELECT 
+    day,
+    merchant_id,
+    transaction_count,
+    amount_sum
+FROM merchant_daily_rollup
+ORDER BY day DESC, transaction_count DESC
+LIMIT 50;
+
+-- Customer transaction summary (rollup)
+SELECT 
+    customer_name,
+    customer_id,
+    SUM(transaction_count) as total_transactions,
+    COUNT(DISTINCT merchant_id) as merchants_used,
+    SUM(amount_sum) as total_spent,
+    SUM(amount_sum) / SUM(transaction_count) as avg_transaction
+FROM customer_merchant_rollup
+GROUP BY customer_name, customer_id
+ORDER BY total_transactions DESC
+LIMIT 20;
+
+-- Merchants eligible for Pattern 1 (rollup)
+SELECT 
+    merchant_id,
+    SUM(transaction_count) as total_transactions
+FROM merchant_daily_rollup
+GROUP BY merchant_id
+HAVING SUM(transaction_count) > 50000
+ORDER BY total_transactions DESC;
+
+-- Customers with low average transaction amount (rollup)
+SELECT 
+    customer_name,
+    merchant_id,
+    SUM(transaction_count) as transaction_count,
+    SUM(amount_sum) / SUM(transaction_count) as avg_amount,
+    MIN(amount_min) as min_amount,
+    MAX(amount_max) as max_amount
+FROM customer_merchant_rollup
+GROUP BY customer_name, merchant_id
+HAVING SUM(transaction_count) >= 80 AND SUM(amount_sum) < 23 * SUM(transaction_count)
+ORDER BY avg_amount ASC;
+
+-- Gender distribution by merchant (rollup)
+SELECT 
+    merchant_id,
+    SUM(transaction_count) FILTER (WHERE UPPER(gender) = 'MALE') as male_count,
+    SUM(transaction_count) FILTER (WHERE UPPER(gender) = 'FEMALE') as female_count,
+    SUM(transaction_count) FILTER (WHERE UPPER(gender) NOT IN ('MALE', 'FEMALE')) as other_count,
+    COUNT(DISTINCT customer_id) as total_unique_customers
+FROM customer_merchant_rollup
+GROUP BY merchant_id
+ORDER BY female_count DESC NULLS LAST;
+
+-- Merchants needing DEI focus (rollup)
+WITH gender_counts AS (
+    SELECT 
+        merchant_id,
+        SUM(CASE WHEN UPPER(gender) = 'FEMALE' THEN 1 ELSE 0 END) as female_count,
+        SUM(CASE WHEN UPPER(gender) = 'MALE' THEN 1 ELSE 0 END) as male_count
+    FROM (
+        SELECT DISTINCT merchant_id, customer_id, gender
+        FROM customer_merchant_rollup
+    ) unique_customers
+    GROUP BY merchant_id
+)
+SELECT 
+    merchant_id,
+    female_count,
+    male_count,
+    male_count - female_count as gender_gap,
+    ROUND(female_count::numeric / NULLIF(male_count, 0) * 100, 2) as female_ratio_pct
+FROM gender_counts
+WHERE female_count > 100
+  AND male_count > female_count
+ORDER BY gender_gap DESC;
+
+-- Detection timeline (hourly, rollup)
+SELECT 
+    hour,
+    pattern_id,
+    SUM(detection_count) as detections
+FROM detection_hourly_rollup
+GROUP BY hour, pattern_id
+ORDER BY hour DESC, pattern_id;
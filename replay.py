@@ -0,0 +1,208 @@
+"""
+Offline replay/backtest of the full pipeline
+Runs a local transactions file through the Mechanism X chunking and Mechanism Y
+ingest/detection stages as fast as possible, using a simulated clock so that
+YStartTime/DetectionTime match what a real-time run would have produced.
+No Google Drive, S3 or network access is needed.
+
+Usage:
+    python replay.py transactions.csv CustomerImportance.csv [--output DIR]
+        [--backend memory|sql] [--chunk-size N] [--start-time "YYYY-MM-DD HH:MM:SS"]
+        [--baseline DIR] [--retention]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+import config
+import s3_handler
+from mechanism_y import MechanismY
+
+class SimulatedClock:
+    """Clock that only moves when advanced, one tick per X processing interval"""
+
+    def __init__(self, start_time, interval_seconds):
+        self.current = start_time
+        self.interval = timedelta(seconds=interval_seconds)
+
+    def now(self):
+        return self.current
+
+    def advance(self):
+        self.current += self.interval
+
+class LocalDetectionWriter:
+    """Writes detection batches to numbered CSV files instead of S3"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.batch_number = 0
+        self.total_detections = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Start from a clean output directory so baselines compare like with like
+        for path in glob.glob(os.path.join(output_dir, 'detections_*.csv')):
+            os.remove(path)
+
+    def __call__(self, detections):
+        self.batch_number += 1
+        self.total_detections += len(detections)
+        path = os.path.join(self.output_dir, f"detections_{self.batch_number:06d}.csv")
+        with open(path, 'w', newline='') as f:
+            s3_handler.write_detections_csv(detections, f)
+        return path
+
+def load_importance(mechanism_y, importance_df):
+    """Load customer importance into the selected backend"""
+    importance_data = list(zip(
+        importance_df['CustomerId'],
+        importance_df['TransactionType'],
+        importance_df['Weightage']
+    ))
+
+    if mechanism_y.detector is not None:
+        mechanism_y.detector.load_customer_importance(importance_data)
+    else:
+        import database
+        database.init_database()
+        database.insert_customer_importance(importance_data)
+
+def ingest_rows(mechanism_y, transactions_data):
+    """Store one chunk through the selected backend"""
+    if mechanism_y.detector is not None:
+        mechanism_y.detector.add_transactions(transactions_data)
+    else:
+        import database
+        database.insert_transactions(transactions_data)
+
+def read_detection_rows(directory):
+    """Read all detection CSV rows in a directory, sorted for comparison"""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(directory, 'detections_*.csv'))):
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        rows.extend(df.itertuples(index=False, name=None))
+    return sorted(rows)
+
+def replay(transactions_path, importance_path, output_dir, backend='memory',
+           chunk_size=None, start_time=None, retention=False):
+    """Run the replay and return a summary dict"""
+    chunk_size = chunk_size or config.CHUNK_SIZE
+    start_time = start_time or datetime.now().replace(microsecond=0)
+
+    wall_start = time.time()
+
+    transactions_df = pd.read_csv(transactions_path)
+    importance_df = pd.read_csv(importance_path)
+    load_time = time.time() - wall_start
+
+    clock = SimulatedClock(start_time, config.PROCESSING_INTERVAL)
+    mechanism_y = MechanismY(backend=backend, clock=clock.now)
+    mechanism_y.y_start_time = clock.now()
+    writer = LocalDetectionWriter(output_dir)
+
+    load_importance(mechanism_y, importance_df)
+
+    ingest_time = 0.0
+    detect_time = 0.0
+    retention_time = 0.0
+    chunks = 0
+    total_rows = len(transactions_df)
+
+    for start_idx in range(0, total_rows, chunk_size):
+        # Mechanism X: next chunk becomes available at this simulated second
+        chunk_df = transactions_df.iloc[start_idx:start_idx + chunk_size]
+        chunks += 1
+
+        # Mechanism Y: ingest, detect, emit
+        stage_start = time.time()
+        ingest_rows(mechanism_y, mechanism_y.chunk_to_rows(chunk_df))
+        ingest_time += time.time() - stage_start
+
+        stage_start = time.time()
+        mechanism_y.detect_all_patterns()
+        mechanism_y.upload_detection_batches(upload=writer)
+        detect_time += time.time() - stage_start
+
+        if retention:
+            # Worst case for retention: every row is archived right after detection
+            import retention as retention_module
+            stage_start = time.time()
+            retention_module.run_retention(horizon_hours=0)
+            retention_time += time.time() - stage_start
+
+        clock.advance()
+
+    wall_time = time.time() - wall_start
+
+    summary = {
+        'backend': backend,
+        'transactions_file': transactions_path,
+        'rows': total_rows,
+        'chunks': chunks,
+        'chunk_size': chunk_size,
+        'detections': writer.total_detections,
+        'detection_files': writer.batch_number,
+        'simulated_start': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'simulated_end': clock.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'load_seconds': round(load_time, 3),
+        'ingest_seconds': round(ingest_time, 3),
+        'detect_seconds': round(detect_time, 3),
+        'retention_seconds': round(retention_time, 3),
+        'wall_seconds': round(wall_time, 3),
+        'rows_per_second': round(total_rows / wall_time) if wall_time else 0,
+    }
+
+    with open(os.path.join(output_dir, 'replay_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a transactions file through X and Y offline")
+    parser.add_argument('transactions', help="Local transactions CSV")
+    parser.add_argument('importance', help="Local CustomerImportance CSV")
+    parser.add_argument('--output', default='replay_output', help="Directory for detection CSVs")
+    parser.add_argument('--backend', choices=['memory', 'sql'], default='memory',
+                        help="Detection backend (sql uses the configured Postgres)")
+    parser.add_argument('--chunk-size', type=int, default=config.CHUNK_SIZE)
+    parser.add_argument('--start-time', help="Simulated Y start time, 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument('--retention', action='store_true',
+                        help="Archive every ingested row after each chunk (sql backend, RETENTION_ENABLED=true)")
+    parser.add_argument('--baseline', help="Directory of a previous replay to compare detections against")
+    args = parser.parse_args()
+
+    start_time = None
+    if args.start_time:
+        start_time = datetime.strptime(args.start_time, '%Y-%m-%d %H:%M:%S')
+
+    print("=" * 60)
+    print("Offline Replay")
+    print("=" * 60)
+
+    summary = replay(args.transactions, args.importance, args.output,
+                     backend=args.backend, chunk_size=args.chunk_size, start_time=start_time,
+                     retention=args.retention)
+
+    print(f"\n✅ Replayed {summary['rows']:,} transactions in {summary['chunks']:,} chunks")
+    print(f"🎯 Detections: {summary['detections']:,} in {summary['detection_files']:,} files")
+    print(f"🕒 Simulated time: {summary['simulated_start']} -> {summary['simulated_end']}")
+    print(f"⏱️  Wall time: {summary['wall_seconds']:.2f}s "
+          f"(load {summary['load_seconds']:.2f}s, ingest {summary['ingest_seconds']:.2f}s, "
+          f"detect {summary['detect_seconds']:.2f}s)")
+    print(f"📊 Throughput: {summary['rows_per_second']:,} transactions/second")
+
+    if args.baseline:
+        if read_detection_rows(args.baseline) == read_detection_rows(args.output):
+            print(f"\n✅ Detections match baseline {args.baseline}")
+        else:
+            print(f"\n❌ Detections differ from baseline {args.baseline}")
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,8 +3,8 @@
 Reset the system to start fresh
 WARNING: This will delete all data!
 """
+import os
 import database
-import s3_handler
 import config
 
 def confirm_reset():
@@ -13,6 +13,7 @@ def confirm_reset():
     print("  - All transactions in database")
     print("  - All detections in database")
     print("  - All processing state")
+    print("  - The transaction-id dedup filter")
     print("  - Will NOT delete S3 files (do manually if needed)")
     
     response = input("\nType 'RESET' to confirm: ")
@@ -27,9 +28,28 @@ def reset_database():
     
     # Drop tables
     cur.execute("DROP TABLE IF EXISTS detections CASCADE")
+    cur.execute("DROP VIEW IF EXISTS transaction_facts CASCADE")
     cur.execute("DROP TABLE IF EXISTS transactions CASCADE")
+    cur.execute("DROP TABLE IF EXISTS transaction_aggregates CASCADE")
+    cur.execute("DROP TABLE IF EXISTS archived_transaction_ids CASCADE")
     cur.execute("DROP TABLE IF EXISTS customer_importance CASCADE")
     cur.execute("DROP TABLE IF EXISTS processing_state CASCADE")
+    cur.execute("DROP TABLE IF EXISTS ingested_chunks CASCADE")
+    cur.execute("DROP TABLE IF EXISTS system_counters CASCADE")
+    cur.execute("DROP TABLE IF EXISTS system_sketches CASCADE")
+    cur.execute("DROP TABLE IF EXISTS detection_counters CASCADE")
+    cur.execute("DROP VIEW IF EXISTS transactions_decoded CASCADE")
+    cur.execute("DROP TABLE IF EXISTS transactions_compact CASCADE")
+    cur.execute("DROP TABLE IF EXISTS customers CASCADE")
+    cur.execute("DROP TABLE IF EXISTS customer_names CASCADE")
+    cur.execute("DROP TABLE IF EXISTS genders CASCADE")
+    cur.execute("DROP TABLE IF EXISTS merchants CASCADE")
+    cur.execute("DROP TABLE IF EXISTS transaction_types CASCADE")
+    cur.execute("DROP TABLE IF EXISTS merchant_daily_rollup CASCADE")
+    cur.execute("DROP TABLE IF EXISTS customer_merchant_rollup CASCADE")
+    cur.execute("DROP TABLE IF EXISTS detection_hourly_rollup CASCADE")
+    cur.execute("DROP VIEW IF EXISTS window_facts CASCADE")
+    cur.execute("DROP TABLE IF EXISTS window_buckets CASCADE")
     
     conn.commit()
     cur.close()
@@ -37,6 +57,10 @@ def reset_database():
     
     # Recreate tables
     database.init_database()
+    
+    # The transaction-id filter would otherwise drop re-sent chunks as duplicates
+    if os.path.exists(config.DEDUP_FILTER_PATH):
+        os.remove(config.DEDUP_FILTER_PATH)
     print("✅ Database reset complete")
 
 def main():
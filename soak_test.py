@@ -0,0 +1,392 @@
+"""
+Soak test: runs main.py (Mechanism X and Y) against local stand-ins for a fixed
+duration and records how it behaves over time.
+    S3            the local storage backend (storage.py) in a temporary directory
+    Google Drive  a synthetic transactions.csv / CustomerImportance.csv in a local folder
+    Postgres      a scratch database on the configured server (its tables are
+                  dropped!), or a throwaway cluster started with initdb/pg_ctl (--initdb)
+
+Every --interval seconds it samples throughput, chunk lag (rows uploaded by X
+but not yet ingested by Y), detection freshness (seconds since Y's last
+detection cycle), RSS of the main.py process tree and Postgres connections
+(open ones and new sessions per minute). After --warmup the lag and RSS samples
+are fitted with a line; the run fails if either grows faster than its
+threshold, or if connections exceed --max-connections. Samples and summary go
+to <report-dir>/soak_<time>.json and .csv.
+
+Usage:
+    python soak_test.py [--duration 600] [--interval 5] [--warmup 60]
+        [--rows N] [--chunk-size 10000] [--runner threads|processes]
+        [--max-lag-growth ROWS_PER_MIN] [--max-rss-growth MB_PER_MIN] [--max-connections 20]
+        [--database soak_db | --initdb [--pg-bin DIR]] [--keep]
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+import psycopg2
+import config
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'source_data', 'main.py')
+
+def write_source(directory, rows, seed=7, block_rows=200000):
+    """
+    Write a synthetic transactions.csv and CustomerImportance.csv, shaped like
+    performance_test.generate_pattern_transactions so all three patterns fire
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    num_customers = 3000
+    genders = rng.choice(['Male', 'male', 'Female', 'FEMALE', 'Other'], size=num_customers,
+                         p=[0.35, 0.15, 0.25, 0.10, 0.15])
+    child_customers = rng.choice(num_customers, size=60, replace=False)
+    is_child = np.zeros(num_customers, dtype=bool)
+    is_child[child_customers] = True
+    start_date = np.datetime64('2024-01-01T00:00')
+
+    path = os.path.join(directory, 'transactions.csv')
+    for offset in range(0, rows, block_rows):
+        count = min(block_rows, rows - offset)
+        customers = np.where(rng.random(count) < 0.1,
+                             rng.choice(child_customers, size=count),
+                             rng.integers(0, num_customers, size=count))
+        child = is_child[customers]
+        merchants = np.where(child, 2, np.where(rng.random(count) < 0.9, 1, rng.integers(3, 41, size=count)))
+        amounts = np.where(child, rng.uniform(1, 30, size=count), rng.uniform(10, 1000, size=count))
+        index = np.arange(offset, offset + count)
+
+        pd.DataFrame({
+            'TransactionId': np.char.add(f"SK{seed:03d}", np.char.zfill(index.astype(str), 10)),
+            'CustomerId': np.char.add('C', np.char.zfill(customers.astype(str), 5)),
+            'CustomerName': np.char.add('Customer_', customers.astype(str)),
+            'Gender': genders[customers],
+            'MerchantId': np.char.add('M', np.char.zfill(merchants.astype(str), 3)),
+            'TransactionType': rng.choice(['Online', 'POS', 'ATM'], size=count),
+            'TransactionAmount': amounts.round(2),
+            'TransactionDate': start_date + index.astype('timedelta64[m]'),
+        }).to_csv(path, mode='w' if offset == 0 else 'a', header=offset == 0, index=False)
+
+    importance = [
+        (f"C{customer:05d}", transaction_type, round(float(rng.uniform(0, 5)), 2))
+        for customer in range(num_customers)
+        for transaction_type in ['Online', 'POS', 'ATM']
+        if rng.random() < 0.8
+    ]
+    pd.DataFrame(importance, columns=['CustomerId', 'TransactionType', 'Weightage']).to_csv(
+        os.path.join(directory, 'CustomerImportance.csv'), index=False
+    )
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class LocalPostgres:
+    """Throwaway Postgres cluster (initdb + pg_ctl) in a temporary directory"""
+
+    def __init__(self, bin_dir=None):
+        self.bin_dir = bin_dir
+        self.directory = tempfile.mkdtemp(prefix='soak_pg_')
+        self.data = os.path.join(self.directory, 'data')
+        self.port = free_port()
+
+    def _bin(self, name):
+        path = shutil.which(name, path=self.bin_dir) if self.bin_dir else shutil.which(name)
+        if path is None:
+            raise RuntimeError(f"{name} not found, pass --pg-bin with the Postgres bin directory")
+        return path
+
+    def start(self):
+        subprocess.run([self._bin('initdb'), '-D', self.data, '-U', 'postgres', '-A', 'trust'],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([
+            self._bin('pg_ctl'), '-D', self.data, '-l', os.path.join(self.directory, 'postgres.log'),
+            '-o', f"-p {self.port} -k {self.directory} -c listen_addresses=127.0.0.1",
+            '-w', 'start'
+        ], check=True, stdout=subprocess.DEVNULL)
+        print(f"✅ Started local Postgres on port {self.port}")
+
+    def stop(self):
+        subprocess.run([self._bin('pg_ctl'), '-D', self.data, '-m', 'fast', 'stop'],
+                       stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class MainProcess:
+    """main.py in its own process group, its output teed to a log and scanned for detection cycles"""
+
+    def __init__(self, env, workdir):
+        self.log = open(os.path.join(workdir, 'main.log'), 'w')
+        self.process = subprocess.Popen(
+            [sys.executable, MAIN_SCRIPT], cwd=workdir, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, start_new_session=True
+        )
+        self.last_detection = None
+        self.detection_cycles = 0
+        self.errors = 0
+        self.stopping = False
+        self.reader = threading.Thread(target=self._read, name="MainOutput", daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.log.write(line)
+            if line.startswith('Detection cycle'):
+                self.last_detection = time.monotonic()
+                self.detection_cycles += 1
+            elif self.stopping:
+                # Interrupted threads fail on their way out, not a soak finding
+                continue
+            elif line.startswith('Error in Mechanism') or 'Traceback' in line:
+                self.errors += 1
+
+    def rss_bytes(self):
+        """Resident memory of main.py and its children"""
+        try:
+            import psutil
+        except ImportError:
+            # Linux without psutil: main process only
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+            return 0
+
+        try:
+            process = psutil.Process(self.process.pid)
+            return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+        except psutil.NoSuchProcess:
+            return 0
+
+    def stop(self, timeout=15):
+        """SIGINT (the supervisor drains on it), then SIGKILL whatever is left"""
+        self.stopping = True
+        if self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGINT)
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                # Threads runner: X and Y threads outlive the interrupted main thread
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+        self.reader.join(5)
+        self.log.close()
+
+def sample(cur, main, started, previous):
+    """One row of measurements"""
+    cur.execute("SELECT last_processed_row FROM processing_state ORDER BY id DESC LIMIT 1")
+    row = cur.fetchone()
+    uploaded = row[0] if row else 0
+
+    cur.execute("SELECT name, value FROM system_counters")
+    counters = dict(cur.fetchall())
+    ingested = counters.get('total_transactions', 0)
+
+    cur.execute("""
+        SELECT COUNT(*) FROM pg_stat_activity
+        WHERE datname = current_database() AND pid <> pg_backend_pid()
+    """)
+    connections = cur.fetchone()[0]
+
+    sessions = None
+    if cur.connection.server_version >= 140000:
+        cur.execute("SELECT sessions FROM pg_stat_database WHERE datname = current_database()")
+        sessions = cur.fetchone()[0]
+
+    now = time.monotonic()
+    elapsed = now - started
+    interval = elapsed - previous['elapsed'] if previous else elapsed
+    return {
+        'elapsed': round(elapsed, 1),
+        'uploaded_rows': uploaded,
+        'ingested_rows': ingested,
+        'lag_rows': max(0, uploaded - ingested),
+        'rows_per_second': round((ingested - (previous['ingested_rows'] if previous else 0)) / interval, 1),
+        'detection_age': round(now - (main.last_detection or started), 1),
+        'detection_cycles': main.detection_cycles,
+        'pending_detections': counters.get('pending_detections', 0),
+        'rss_mb': round(main.rss_bytes() / 1024 / 1024, 1),
+        'connections': connections,
+        'sessions_per_minute': (round((sessions - previous['sessions']) / interval * 60, 1)
+                                if previous and sessions is not None and previous['sessions'] is not None
+                                else None),
+        'sessions': sessions,
+    }
+
+def slope_per_minute(samples, field):
+    """Least-squares growth of a field per minute"""
+    if len(samples) < 2:
+        return 0.0
+    elapsed = np.array([s['elapsed'] for s in samples])
+    values = np.array([s[field] for s in samples], dtype=np.float64)
+    return float(np.polyfit(elapsed / 60, values, 1)[0])
+
+def summarize(samples, args):
+    """Summary numbers and pass/fail checks of a run"""
+    steady = [s for s in samples if s['elapsed'] >= args.warmup] or samples
+    churn = [s['sessions_per_minute'] for s in steady if s['sessions_per_minute'] is not None]
+
+    summary = {
+        'duration': samples[-1]['elapsed'],
+        'rows_ingested': samples[-1]['ingested_rows'],
+        'rows_per_second': round(samples[-1]['ingested_rows'] / samples[-1]['elapsed'], 1),
+        'lag_rows_final': samples[-1]['lag_rows'],
+        'lag_rows_max': max(s['lag_rows'] for s in samples),
+        'lag_growth_per_minute': round(slope_per_minute(steady, 'lag_rows'), 1),
+        'detection_age_max': max(s['detection_age'] for s in steady),
+        'detection_cycles': samples[-1]['detection_cycles'],
+        'rss_mb_start': steady[0]['rss_mb'],
+        'rss_mb_end': samples[-1]['rss_mb'],
+        'rss_growth_mb_per_minute': round(slope_per_minute(steady, 'rss_mb'), 2),
+        'connections_max': max(s['connections'] for s in samples),
+        'sessions_per_minute': round(sum(churn) / len(churn), 1) if churn else None,
+    }
+
+    checks = [
+        ('lag growth (rows/min)', summary['lag_growth_per_minute'], args.max_lag_growth),
+        ('RSS growth (MB/min)', summary['rss_growth_mb_per_minute'], args.max_rss_growth),
+        ('connections', summary['connections_max'], args.max_connections),
+    ]
+    return summary, [
+        {'check': name, 'value': value, 'limit': limit, 'passed': value <= limit}
+        for name, value, limit in checks
+    ]
+
+def write_report(report_dir, samples, summary, checks, args):
+    os.makedirs(report_dir, exist_ok=True)
+    base = os.path.join(report_dir, f"soak_{time.strftime('%Y%m%d_%H%M%S')}")
+
+    with open(base + '.json', 'w') as f:
+        json.dump({'arguments': vars(args), 'summary': summary, 'checks': checks,
+                   'samples': samples}, f, indent=2)
+    with open(base + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(samples[0]))
+        writer.writeheader()
+        writer.writerows(samples)
+    return base
+
+def run(args):
+    """Prepare the stand-ins and run main.py for the duration, returns (samples, workdir, exited early)"""
+    workdir = tempfile.mkdtemp(prefix='soak_')
+    rows = args.rows or int(args.duration * args.chunk_size / config.PROCESSING_INTERVAL * 1.2)
+    print(f"Writing {rows:,} synthetic transactions...")
+    write_source(os.path.join(workdir, 'source'), rows)
+
+    import reset_system
+    from plan_check import ensure_database
+    config.DB_NAME = args.database
+    ensure_database(args.database)
+    reset_system.reset_database()
+
+    env = dict(
+        os.environ,
+        PYTHONUNBUFFERED='1',
+        STORAGE_BACKEND='local', LOCAL_STORAGE_PATH=os.path.join(workdir, 'storage'),
+        SOURCE_BACKEND='local', SOURCE_PATH=os.path.join(workdir, 'source'),
+        DB_HOST=config.DB_HOST, DB_PORT=str(config.DB_PORT), DB_NAME=args.database,
+        DB_USER=config.DB_USER, DB_PASSWORD=config.DB_PASSWORD,
+        CHUNK_SIZE=str(args.chunk_size), RUNNER=args.runner,
+    )
+
+    conn = psycopg2.connect(host=config.DB_HOST, port=config.DB_PORT, database=args.database,
+                            user=config.DB_USER, password=config.DB_PASSWORD)
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    print(f"Running main.py for {args.duration}s (work directory {workdir})")
+    main = MainProcess(env, workdir)
+    started = time.monotonic()
+    samples = []
+    exited = False
+    try:
+        while time.monotonic() - started < args.duration:
+            time.sleep(args.interval)
+            if main.process.poll() is not None:
+                print(f"❌ main.py exited with code {main.process.returncode}")
+                exited = True
+                break
+            samples.append(sample(cur, main, started, samples[-1] if samples else None))
+            s = samples[-1]
+            print(f"  {s['elapsed']:7.0f}s  {s['rows_per_second']:9,.0f} rows/s  lag {s['lag_rows']:7,}  "
+                  f"detection age {s['detection_age']:5.1f}s  RSS {s['rss_mb']:6.1f} MB  "
+                  f"connections {s['connections']}")
+    finally:
+        main.stop()
+        cur.close()
+        conn.close()
+
+    if main.errors:
+        print(f"⚠️  {main.errors} errors in main.py output, see {workdir}/main.log")
+    return samples, workdir, exited
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test main.py against local S3/Drive/Postgres stand-ins")
+    parser.add_argument('--duration', type=int, default=600, help="Seconds to run")
+    parser.add_argument('--interval', type=float, default=5, help="Seconds between samples")
+    parser.add_argument('--warmup', type=float, default=60, help="Seconds left out of the trend checks")
+    parser.add_argument('--rows', type=int, help="Synthetic transactions (default: enough for the duration)")
+    parser.add_argument('--chunk-size', type=int, default=config.CHUNK_SIZE, help="Rows per chunk (X sends one per second)")
+    parser.add_argument('--runner', choices=['threads', 'processes'], default=config.RUNNER)
+    parser.add_argument('--max-lag-growth', type=float, help="Allowed lag growth in rows/minute (default one chunk)")
+    parser.add_argument('--max-rss-growth', type=float, default=2.0, help="Allowed RSS growth in MB/minute")
+    parser.add_argument('--max-connections', type=int, default=20)
+    parser.add_argument('--database', default='soak_db', help="Scratch database (dropped tables!)")
+    parser.add_argument('--initdb', action='store_true', help="Start a throwaway Postgres cluster instead")
+    parser.add_argument('--pg-bin', help="Directory with initdb and pg_ctl (default: PATH)")
+    parser.add_argument('--report-dir', default='soak_reports')
+    parser.add_argument('--keep', action='store_true', help="Keep the work directory (log, storage, source)")
+    args = parser.parse_args()
+    if args.max_lag_growth is None:
+        args.max_lag_growth = float(args.chunk_size)
+
+    print("=" * 60)
+    print("Soak Test")
+    print("=" * 60)
+
+    postgres = None
+    if args.initdb:
+        postgres = LocalPostgres(args.pg_bin)
+        postgres.start()
+        config.DB_HOST, config.DB_PORT, config.DB_USER = '127.0.0.1', postgres.port, 'postgres'
+
+    try:
+        samples, workdir, exited = run(args)
+    finally:
+        if postgres is not None:
+            postgres.stop()
+
+    if not samples:
+        print("❌ No samples recorded")
+        return 1
+
+    summary, checks = summarize(samples, args)
+    base = write_report(args.report_dir, samples, summary, checks, args)
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\n" + "=" * 60)
+    print("SUMMARY")
+    print("=" * 60)
+    for name, value in summary.items():
+        print(f"  {name:28} {value}")
+    print()
+    for check in checks:
+        status = "✅ PASS" if check['passed'] else "❌ FAIL"
+        print(f"  {status}: {check['check']} {check['value']} (limit {check['limit']})")
+    print(f"\nReport: {base}.json / {base}.csv")
+
+    passed = all(check['passed'] for check in checks) and not exited
+    return 0 if passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# bloom.py
+"""
+Bloom filter over transaction ids, used by Mechanism Y to skip re-delivered rows
+before they reach the database
+"""
+import hashlib
+import math
+import os
+import struct
+import numpy as np
+
+HEADER = struct.Struct('<QdQ')  # capacity, error rate, items added
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.count = count
+        if bits is None:
+            self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        else:
+            self.bits = np.frombuffer(bits, dtype=np.uint8).copy()
+            if len(self.bits) != (self.num_bits + 7) // 8:
+                raise ValueError("Bit array does not match filter size")
+
+    def _positions(self, values):
+        """Bit positions for each value, shape (len(values), num_hashes)"""
+        digests = b''.join(
+            hashlib.blake2b(str(v).encode('utf-8'), digest_size=16).digest() for v in values
+        )
+        hashes = np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+        # Double hashing: h1 + i * h2 (odd h2, uint64 arithmetic wraps)
+        h1 = hashes[:, 0:1]
+        h2 = hashes[:, 1:2] | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1 + steps * h2) % np.uint64(self.num_bits)
+
+    def update(self, values):
+        """Add many values"""
+        if len(values) == 0:
+            return
+        positions = self._positions(values).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(values)
+
+    def contains_many(self, values):
+        """Boolean array: False means definitely not added, True means probably added"""
+        if len(values) == 0:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(values)
+        bits = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+    def __contains__(self, value):
+        return bool(self.contains_many([value])[0])
+
+    def merge(self, other):
+        """Union with a filter of the same size"""
+        if other.num_bits != self.num_bits or other.num_hashes != self.num_hashes:
+            raise ValueError("Cannot merge filters of different size")
+        np.bitwise_or(self.bits, other.bits, out=self.bits)
+        self.count = max(self.count, other.count)
+
+    @property
+    def byte_size(self):
+        return self.bits.nbytes
+
+    def to_bytes(self):
+        return HEADER.pack(self.capacity, self.error_rate, self.count) + self.bits.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        capacity, error_rate, count = HEADER.unpack_from(data)
+        return cls(capacity, error_rate, data[HEADER.size:], count)
+
+    def save(self, path):
+        """Write atomically, merged with whatever another process saved there meanwhile"""
+        existing = load(path)
+        if existing is not None and existing.num_bits == self.num_bits:
+            self.merge(existing)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(path + '.tmp', path)
+
+def load(path):
+    """Read a saved filter, None if there is none"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return BloomFilter.from_bytes(f.read())
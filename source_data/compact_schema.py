@@ -0,0 +1,333 @@
+# compact_schema.py
+"""
+Normalised transactions schema (SCHEMA_MODE=compact): dictionary tables map
+customers, customer names, genders, merchants and transaction types to
+integer keys and amounts are stored as integer cents. Genders keep their raw
+spelling (classified with UPPER() at query time like the legacy schema), so
+every mode counts the same distinct values.
+"""
+from collections import ChainMap
+from decimal import Decimal, ROUND_HALF_UP
+from psycopg2.extras import execute_values
+
+# (table, key column, value column) for each dictionary
+DICTIONARIES = {
+    'customer_id': ('customers', 'customer_key', 'customer_id'),
+    'customer_name': ('customer_names', 'name_key', 'customer_name'),
+    'gender': ('genders', 'gender_key', 'gender'),
+    'merchant_id': ('merchants', 'merchant_key', 'merchant_id'),
+    'transaction_type': ('transaction_types', 'type_key', 'transaction_type'),
+}
+
+# Keys never change once assigned, so they can be cached for the process lifetime
+_key_cache = {column: {} for column in DICTIONARIES}
+
+def create_tables(cur):
+    """Create the dictionary tables, compact transactions table and decoding view"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS customers (
+            customer_key SERIAL PRIMARY KEY,
+            customer_id VARCHAR(100) UNIQUE NOT NULL
+        );
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS customer_names (
+            name_key SERIAL PRIMARY KEY,
+            customer_name VARCHAR(200) UNIQUE NOT NULL
+        );
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS genders (
+            gender_key SMALLSERIAL PRIMARY KEY,
+            gender VARCHAR(10) UNIQUE NOT NULL
+        );
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS merchants (
+            merchant_key SERIAL PRIMARY KEY,
+            merchant_id VARCHAR(100) UNIQUE NOT NULL
+        );
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS transaction_types (
+            type_key SMALLSERIAL PRIMARY KEY,
+            transaction_type VARCHAR(50) UNIQUE NOT NULL
+        );
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS transactions_compact (
+            transaction_id VARCHAR(100) PRIMARY KEY,
+            customer_key INTEGER NOT NULL,
+            name_key INTEGER NOT NULL,
+            merchant_key INTEGER NOT NULL,
+            type_key SMALLINT NOT NULL,
+            gender_key SMALLINT NOT NULL,
+            amount_cents BIGINT,
+            transaction_date TIMESTAMP,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_compact_customer
+        ON transactions_compact(customer_key, merchant_key);
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_compact_merchant
+        ON transactions_compact(merchant_key);
+    """)
+
+    _migrate_gender_enum(cur)
+
+    # Decoded view with the legacy column layout for ad-hoc analysis
+    cur.execute("""
+        CREATE OR REPLACE VIEW transactions_decoded AS
+        SELECT
+            t.transaction_id,
+            c.customer_id,
+            cn.customer_name,
+            g.gender,
+            m.merchant_id,
+            tt.transaction_type,
+            t.amount_cents / 100.0 AS transaction_amount,
+            t.transaction_date,
+            t.processed_at
+        FROM transactions_compact t
+        JOIN customers c ON c.customer_key = t.customer_key
+        JOIN customer_names cn ON cn.name_key = t.name_key
+        JOIN genders g ON g.gender_key = t.gender_key
+        JOIN merchants m ON m.merchant_key = t.merchant_key
+        JOIN transaction_types tt ON tt.type_key = t.type_key;
+    """)
+
+def _migrate_gender_enum(cur):
+    """
+    Move tables created with the earlier gender enum (0 other, 1 female,
+    2 male) to gender_key. Their raw spelling is gone, so enum rows decode as
+    'OTHER', 'FEMALE' or 'MALE'.
+    """
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'transactions_compact' AND column_name = 'gender'
+    """)
+    if cur.fetchone() is None:
+        return
+
+    # The old view decodes the enum column, it is recreated by the caller
+    cur.execute("DROP VIEW IF EXISTS transactions_decoded")
+    cur.execute("""
+        INSERT INTO genders (gender) VALUES ('OTHER'), ('FEMALE'), ('MALE')
+        ON CONFLICT (gender) DO NOTHING
+    """)
+    cur.execute("ALTER TABLE transactions_compact ADD COLUMN IF NOT EXISTS gender_key SMALLINT")
+    cur.execute("""
+        UPDATE transactions_compact t
+        SET gender_key = g.gender_key
+        FROM genders g
+        WHERE g.gender = CASE t.gender WHEN 1 THEN 'FEMALE' WHEN 2 THEN 'MALE' ELSE 'OTHER' END
+    """)
+    cur.execute("ALTER TABLE transactions_compact ALTER COLUMN gender_key SET NOT NULL")
+    cur.execute("ALTER TABLE transactions_compact DROP COLUMN gender")
+
+def to_cents(amount):
+    """Round an amount to integer cents like DECIMAL(15, 2)"""
+    return int(Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100)
+
+def get_keys(cur, column, values, new_keys):
+    """
+    Return a value -> key mapping, inserting unseen values in bulk.
+    Newly looked-up keys go into new_keys rather than the cache, since the
+    dictionary rows only exist once the caller's transaction commits.
+    """
+    cache = _key_cache[column]
+    missing = sorted({v for v in values if v not in cache})
+    found = {}
+
+    if missing:
+        table, key_column, value_column = DICTIONARIES[column]
+        cur.execute(f"""
+            INSERT INTO {table} ({value_column})
+            SELECT unnest(%s::text[])
+            ON CONFLICT ({value_column}) DO NOTHING
+        """, (missing,))
+        cur.execute(f"""
+            SELECT {value_column}, {key_column}
+            FROM {table}
+            WHERE {value_column} = ANY(%s)
+        """, (missing,))
+        found = dict(cur.fetchall())
+        new_keys[column] = found
+
+    return ChainMap(found, cache)
+
+def remember_keys(new_keys):
+    """Add keys to the process cache after the transaction that created them committed"""
+    for column, keys in new_keys.items():
+        _key_cache[column].update(keys)
+
+def insert_transactions(cur, transactions_data):
+    """
+    Encode and insert transaction tuples (database.insert_transactions layout).
+    Returns the (transaction_id, customer_key, merchant_key) of rows actually inserted and the
+    newly assigned dictionary keys, to pass to remember_keys() after commit.
+    """
+    new_keys = {}
+    if not transactions_data:
+        return [], new_keys
+
+    columns = list(zip(*transactions_data))
+    customer_keys = get_keys(cur, 'customer_id', columns[1], new_keys)
+    name_keys = get_keys(cur, 'customer_name', columns[2], new_keys)
+    gender_keys = get_keys(cur, 'gender', columns[3], new_keys)
+    merchant_keys = get_keys(cur, 'merchant_id', columns[4], new_keys)
+    type_keys = get_keys(cur, 'transaction_type', columns[5], new_keys)
+
+    encoded = [
+        (
+            transaction_id,
+            customer_keys[customer_id],
+            name_keys[customer_name],
+            merchant_keys[merchant_id],
+            type_keys[transaction_type],
+            gender_keys[gender],
+            to_cents(amount),
+            transaction_date
+        )
+        for (transaction_id, customer_id, customer_name, gender, merchant_id,
+             transaction_type, amount, transaction_date) in transactions_data
+    ]
+
+    inserted = execute_values(cur, """
+        INSERT INTO transactions_compact
+        (transaction_id, customer_key, name_key, merchant_key, type_key,
+        gender_key, amount_cents, transaction_date)
+        VALUES %s
+        ON CONFLICT (transaction_id) DO NOTHING
+        RETURNING transaction_id, customer_key, merchant_key;
+    """, encoded, fetch=True)
+
+    return inserted, new_keys
+
+# Detection queries: all grouping happens on integer keys, names are joined
+# back only for the rows that are emitted.
+
+PATTERN_1_QUERY = """
+WITH merchant_stats AS (
+    SELECT merchant_key
+    FROM transactions_compact
+    GROUP BY merchant_key
+    HAVING COUNT(*) > 50000
+),
+importance AS (
+    SELECT c.customer_key, tt.type_key, ci.weightage
+    FROM customer_importance ci
+    JOIN customers c ON c.customer_id = ci.customer_id
+    JOIN transaction_types tt ON tt.transaction_type = ci.transaction_type
+),
+customer_merchant_stats AS (
+    SELECT
+        t.customer_key,
+        t.name_key,
+        t.merchant_key,
+        t.type_key,
+        COUNT(*) as transaction_count,
+        COALESCE(ci.weightage, 0) as weightage
+    FROM transactions_compact t
+    LEFT JOIN importance ci
+        ON t.customer_key = ci.customer_key
+        AND t.type_key = ci.type_key
+    WHERE t.merchant_key IN (SELECT merchant_key FROM merchant_stats)
+    GROUP BY t.customer_key, t.name_key, t.merchant_key, t.type_key, ci.weightage
+),
+customer_avg_weight AS (
+    SELECT
+        customer_key,
+        name_key,
+        merchant_key,
+        SUM(transaction_count) as total_transactions,
+        AVG(weightage) as avg_weightage
+    FROM customer_merchant_stats
+    GROUP BY customer_key, name_key, merchant_key
+),
+merchant_percentiles AS (
+    SELECT
+        merchant_key,
+        PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY total_transactions) as tx_90th,
+        PERCENTILE_CONT(0.1) WITHIN GROUP (ORDER BY avg_weightage) as weight_10th
+    FROM customer_avg_weight
+    GROUP BY merchant_key
+),
+matches AS (
+    SELECT DISTINCT caw.name_key, caw.merchant_key
+    FROM customer_avg_weight caw
+    JOIN merchant_percentiles mp ON caw.merchant_key = mp.merchant_key
+    WHERE caw.total_transactions >= mp.tx_90th
+      AND caw.avg_weightage <= mp.weight_10th
+)
+SELECT cn.customer_name, m.merchant_id
+FROM matches
+JOIN customer_names cn ON cn.name_key = matches.name_key
+JOIN merchants m ON m.merchant_key = matches.merchant_key
+WHERE NOT EXISTS (
+    SELECT 1 FROM detections d
+    WHERE d.pattern_id = 'PatId1'
+      AND d.customer_name = cn.customer_name
+      AND d.merchant_id = m.merchant_id
+)
+"""
+
+PATTERN_2_QUERY = """
+WITH matches AS (
+    SELECT
+        name_key,
+        merchant_key,
+        AVG(amount_cents) / 100.0 as avg_amount,
+        COUNT(*) as transaction_count
+    FROM transactions_compact
+    GROUP BY name_key, merchant_key
+    HAVING COUNT(*) >= 80
+      AND AVG(amount_cents) < 2300
+)
+SELECT cn.customer_name, m.merchant_id, matches.avg_amount, matches.transaction_count
+FROM matches
+JOIN customer_names cn ON cn.name_key = matches.name_key
+JOIN merchants m ON m.merchant_key = matches.merchant_key
+WHERE NOT EXISTS (
+    SELECT 1 FROM detections d
+    WHERE d.pattern_id = 'PatId2'
+      AND d.customer_name = cn.customer_name
+      AND d.merchant_id = m.merchant_id
+)
+"""
+
+PATTERN_3_QUERY = """
+WITH gender_counts AS (
+    SELECT
+        merchant_key,
+        SUM(CASE WHEN UPPER(g.gender) = 'FEMALE' THEN 1 ELSE 0 END) as female_count,
+        SUM(CASE WHEN UPPER(g.gender) = 'MALE' THEN 1 ELSE 0 END) as male_count
+    FROM (
+        SELECT DISTINCT merchant_key, customer_key, gender_key
+        FROM transactions_compact
+    ) unique_customers
+    JOIN genders g ON g.gender_key = unique_customers.gender_key
+    GROUP BY merchant_key
+)
+SELECT m.merchant_id
+FROM gender_counts
+JOIN merchants m ON m.merchant_key = gender_counts.merchant_key
+WHERE female_count > 100
+  AND male_count > female_count
+  AND NOT EXISTS (
+      SELECT 1 FROM detections d
+      WHERE d.pattern_id = 'PatId3'
+        AND d.merchant_id = m.merchant_id
+  )
+"""
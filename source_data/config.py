@@ -11,6 +11,37 @@ AWS_REGION = os.getenv('AWS_REGION', 'us-east-1')
 S3_BUCKET = os.getenv('S3_BUCKET', 'transaction-processing-bucket')
 S3_INPUT_PREFIX = 'input/transactions/'
 S3_OUTPUT_PREFIX = 'output/detections/'
+S3_MANIFEST_PREFIX = 'input/manifest/'
+MANIFEST_COMPACT_EVERY = 1000  # head entries before they are folded into an immutable segment
+
+# Storage backends: STORAGE_BACKEND 's3' or 'local' (objects under LOCAL_STORAGE_PATH/<bucket>/),
+# SOURCE_BACKEND 'gdrive' or 'local' (transactions.csv and CustomerImportance.csv in SOURCE_PATH)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 's3')
+LOCAL_STORAGE_PATH = os.getenv('LOCAL_STORAGE_PATH', 'storage')
+SOURCE_BACKEND = os.getenv('SOURCE_BACKEND', 'gdrive')
+SOURCE_PATH = os.getenv('SOURCE_PATH', 'source')
+
+# Object encoding: 'gzip', 'zstd' (needs the zstandard package) or 'none'
+CHUNK_COMPRESSION = os.getenv('CHUNK_COMPRESSION', 'gzip')
+OUTPUT_COMPRESSION = os.getenv('OUTPUT_COMPRESSION', 'none')
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', '6'))
+S3_PART_SIZE = 8 * 1024 * 1024  # multipart part size, bounds upload buffer memory
+
+# Detection output: 'partitioned' (pattern_id=.../date=.../ with one _manifest/ entry
+# per object) or 'flat' (one detections_<run>_<id range> object per batch); 'csv' or 'parquet'
+DETECTION_OUTPUT_LAYOUT = os.getenv('DETECTION_OUTPUT_LAYOUT', 'partitioned')
+DETECTION_OUTPUT_FORMAT = os.getenv('DETECTION_OUTPUT_FORMAT', 'csv')
+
+# Retries and circuit breakers for S3, Postgres and Google Drive calls (resilience.py)
+RETRY_ATTEMPTS = int(os.getenv('RETRY_ATTEMPTS', '5'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.2'))  # seconds, doubled per retry
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '5'))
+RETRY_DEADLINE = float(os.getenv('RETRY_DEADLINE', '30'))  # give up retrying one call after this
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '15'))
+S3_CONNECT_TIMEOUT = 5
+S3_READ_TIMEOUT = 30
+DB_CONNECT_TIMEOUT = 10
 
 # PostgreSQL Configuration
 DB_HOST = os.getenv('DB_HOST', 'localhost')
@@ -23,8 +54,86 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', 'password')
 GDRIVE_FOLDER_ID = '1qryhdlgNsmecWRy2haI8S3uC63wKk5X-'
 CREDENTIALS_FILE = 'credentials.json'
 TOKEN_FILE = 'token.json'
+# Source files are downloaded with concurrent range requests into GDRIVE_DOWNLOAD_PATH;
+# an interrupted download resumes, a finished one is reused while its Drive MD5 is unchanged
+GDRIVE_DOWNLOAD_PATH = os.getenv('GDRIVE_DOWNLOAD_PATH', 'state/downloads')
+GDRIVE_DOWNLOAD_WORKERS = int(os.getenv('GDRIVE_DOWNLOAD_WORKERS', '8'))
+GDRIVE_RANGE_SIZE = int(os.getenv('GDRIVE_RANGE_SIZE', str(16 * 1024 * 1024)))
 
 # Processing Configuration
-CHUNK_SIZE = 10000
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '10000'))
 DETECTION_BATCH_SIZE = 50
-PROCESSING_INTERVAL = 1  # seconds
\ No newline at end of file
+PROCESSING_INTERVAL = 1  # seconds
+FETCH_SIZE = int(os.getenv('FETCH_SIZE', '5000'))  # rows per server-side cursor fetch in detection/export
+
+# Y micro-batching: queued chunks are ingested together up to these budgets, and
+# detection runs once per batch (at least every DETECTION_MAX_INTERVAL while behind)
+INGEST_BATCH_MAX_ROWS = int(os.getenv('INGEST_BATCH_MAX_ROWS', '100000'))
+INGEST_BATCH_MAX_BYTES = int(os.getenv('INGEST_BATCH_MAX_BYTES', str(64 * 1024 * 1024)))  # compressed chunk bytes
+DETECTION_MAX_INTERVAL = float(os.getenv('DETECTION_MAX_INTERVAL', '10'))  # seconds
+
+# The three SQL detectors read one exported snapshot; in parallel on their own pooled
+# connections (wall time is the slowest detector), or one after another on one connection
+DETECTION_PARALLEL = os.getenv('DETECTION_PARALLEL', 'true').lower() == 'true'
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '3'))  # idle connections kept for detection cycles
+
+# Transaction-id Bloom filter in Y (sql backend): definitely-new rows go straight to
+# the insert, possible duplicates are checked in bulk, fully known chunks are dropped
+DEDUP_FILTER = os.getenv('DEDUP_FILTER', 'true').lower() == 'true'
+DEDUP_FILTER_PATH = os.getenv('DEDUP_FILTER_PATH', 'state/transaction_ids.bloom')
+DEDUP_FILTER_CAPACITY = int(os.getenv('DEDUP_FILTER_CAPACITY', '10000000'))  # ids before it is rebuilt twice as large
+DEDUP_FILTER_ERROR_RATE = float(os.getenv('DEDUP_FILTER_ERROR_RATE', '0.001'))
+DEDUP_FILTER_SAVE_INTERVAL = 60  # seconds between saves of the filter file
+
+# Sliding-window detection: PatId1/2/3 over the last N days of transaction_date only,
+# from incrementally maintained day buckets (sliding_window.py); 0 uses all history (sql backend)
+DETECTION_WINDOW_DAYS = int(os.getenv('DETECTION_WINDOW_DAYS', '0'))
+
+# Detection backend: 'sql' (Postgres) or 'memory' (vector_detector, no database)
+DETECTION_BACKEND = os.getenv('DETECTION_BACKEND', 'sql')
+CUSTOMER_IMPORTANCE_PATH = os.getenv('CUSTOMER_IMPORTANCE_PATH', '')
+
+# Transactions schema: 'legacy' (VARCHAR columns) or 'compact' (integer keys, see compact_schema.py)
+SCHEMA_MODE = os.getenv('SCHEMA_MODE', 'legacy')
+
+# Mechanism X catch-up: upload backlog chunks concurrently before resuming the 1/second pace
+CATCHUP_WORKERS = int(os.getenv('CATCHUP_WORKERS', '0'))  # 0 disables catch-up mode
+CATCHUP_MAX_ROWS = int(os.getenv('CATCHUP_MAX_ROWS', '0'))  # 0 means up to the end of the file
+
+# Chunk notifications: X publishes uploaded chunks on a Postgres channel, Y blocks on it
+CHUNK_NOTIFICATIONS = os.getenv('CHUNK_NOTIFICATIONS', 'true').lower() == 'true'
+CHUNK_NOTIFY_CHANNEL = 'transaction_chunks'
+CHUNK_NOTIFY_TIMEOUT = 30  # seconds without a notification before falling back to an S3 LIST
+
+# Retention: rows older than the horizon are archived to Parquet, folded into
+# transaction_aggregates and deleted from the hot table (legacy schema only)
+RETENTION_ENABLED = os.getenv('RETENTION_ENABLED', 'false').lower() == 'true'
+RETENTION_HORIZON_HOURS = float(os.getenv('RETENTION_HORIZON_HOURS', '24'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '5000'))
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', '60'))  # seconds between retention passes
+# Archived transaction ids are kept this long for dedup; must exceed the longest re-delivery delay
+RETENTION_DEDUP_HOURS = float(os.getenv('RETENTION_DEDUP_HOURS', '168'))
+ARCHIVE_PATH = os.getenv('ARCHIVE_PATH', 'archive/transactions')
+ARCHIVE_S3_PREFIX = os.getenv('ARCHIVE_S3_PREFIX', '')  # e.g. 'archive/transactions/', overrides ARCHIVE_PATH
+
+# Parquet export (export_parquet.py)
+EXPORT_PATH = os.getenv('EXPORT_PATH', 'exports')
+EXPORT_S3_PREFIX = os.getenv('EXPORT_S3_PREFIX', 'output/exports/')
+EXPORT_ROW_GROUP_ROWS = int(os.getenv('EXPORT_ROW_GROUP_ROWS', '250000'))
+EXPORT_BLOCK_SIZE = int(os.getenv('EXPORT_BLOCK_SIZE', str(8 * 1024 * 1024)))  # CSV bytes parsed per batch
+
+# Profiling (see profiling.py); SIGUSR1/SIGUSR2 toggle stage profiling/sampler at runtime
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() == 'true'
+PROFILE_STAGES = os.getenv('PROFILE_STAGES', 'all')  # e.g. 'y_ingest,y_detect'
+PROFILE_EVERY_N = int(os.getenv('PROFILE_EVERY_N', '1'))  # profile every Nth run of a stage
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', '25'))  # allocation lines per report
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0'))  # seconds, 0 disables the sampler
+
+# Multiprocess runner (supervisor.py, or RUNNER=processes with main.py)
+RUNNER = os.getenv('RUNNER', 'threads')
+Y_WORKERS = int(os.getenv('Y_WORKERS', str(max(1, (os.cpu_count() or 2) - 2))))  # ingest processes
+HANDOFF_SHARED_MEMORY = os.getenv('HANDOFF_SHARED_MEMORY', 'true').lower() == 'true'
+SUPERVISOR_BACKOFF_BASE = 1  # seconds before the first restart, doubled per consecutive crash
+SUPERVISOR_BACKOFF_MAX = 60
+SUPERVISOR_BACKOFF_RESET = 60  # seconds of uptime after which a crash counts as the first again
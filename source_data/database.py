@@ -1,8 +1,21 @@
 # database.py
+import itertools
+import json
+import select
+import threading
+from collections import Counter
+from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_batch, execute_values
 import config
+import compact_schema
+import retention
+import resilience
+import rollups
+import sliding_window
+from hll import HyperLogLog
 
+@resilience.retry('postgres')
 def get_db_connection():
     """Create and return a database connection"""
     return psycopg2.connect(
@@ -10,9 +23,11 @@ def get_db_connection():
         port=config.DB_PORT,
         database=config.DB_NAME,
         user=config.DB_USER,
-        password=config.DB_PASSWORD
+        password=config.DB_PASSWORD,
+        connect_timeout=config.DB_CONNECT_TIMEOUT
     )
 
+@resilience.retry('postgres')
 def init_database():
     """Initialize database tables"""
     conn = get_db_connection()
@@ -55,6 +70,14 @@ def init_database():
         SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM processing_state);
     """)
     
+    # Chunk keys Mechanism Y has ingested, reconciled against the manifest on restart
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingested_chunks (
+            chunk_key VARCHAR(255) PRIMARY KEY,
+            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    
     cur.execute("""
         CREATE TABLE IF NOT EXISTS detections (
             id SERIAL PRIMARY KEY,
@@ -85,6 +108,563 @@ def init_database():
         ON detections(uploaded_to_s3);
     """)
     
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_detections_time 
+        ON detections(detection_time DESC);
+    """)
+    
+    if config.SCHEMA_MODE == 'compact':
+        compact_schema.create_tables(cur)
+    elif config.RETENTION_ENABLED:
+        retention.create_tables(cur)
+    
+    rollups_created = rollups.create_tables(cur)
+    window_created = config.DETECTION_WINDOW_DAYS and sliding_window.create_tables(cur)
+    
+    # Incrementally maintained stats for monitoring
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS system_counters (
+            name VARCHAR(100) PRIMARY KEY,
+            value BIGINT DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS system_sketches (
+            name VARCHAR(100) PRIMARY KEY,
+            registers BYTEA,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS detection_counters (
+            pattern_id VARCHAR(20),
+            action_type VARCHAR(50),
+            detection_count BIGINT DEFAULT 0,
+            PRIMARY KEY (pattern_id, action_type)
+        );
+    """)
+    
+    if config.DETECTION_WINDOW_DAYS:
+        window_stale = window_created or sliding_window.needs_rebuild(cur)
+    else:
+        # Buckets miss every insert from now on, rebuilt when re-enabled
+        window_stale = False
+        sliding_window.record_window_days(cur, 0)
+    
     conn.commit()
+    
+    # Seed stats from existing data the first time the tables are created
+    cur.execute("SELECT 1 FROM system_counters WHERE name = 'total_transactions'")
+    if cur.fetchone() is None:
+        rebuild_system_stats(conn)
+    if rollups_created:
+        rebuild_rollups(conn)
+    elif window_stale:
+        rebuild_window(conn)
+    
     cur.close()
-    conn.close()
\ No newline at end of file
+    conn.close()
+    print("Database initialized successfully")
+
+def _increment_counters(cur, counters):
+    """Add deltas to named counters within the caller's transaction"""
+    counters = [(name, delta) for name, delta in counters.items() if delta]
+    if not counters:
+        return
+    
+    execute_values(cur, """
+        INSERT INTO system_counters (name, value)
+        VALUES %s
+        ON CONFLICT (name)
+        DO UPDATE SET value = system_counters.value + EXCLUDED.value,
+                      updated_at = CURRENT_TIMESTAMP
+    """, sorted(counters))
+
+def _update_sketch(cur, name, values):
+    """Merge values into a stored HyperLogLog sketch within the caller's transaction"""
+    if not values:
+        return
+    
+    cur.execute(
+        "SELECT registers FROM system_sketches WHERE name = %s FOR UPDATE",
+        (name,)
+    )
+    row = cur.fetchone()
+    sketch = HyperLogLog.from_bytes(row[0] if row else None)
+    
+    if not sketch.update(values) and row is not None:
+        return
+    
+    cur.execute("""
+        INSERT INTO system_sketches (name, registers)
+        VALUES (%s, %s)
+        ON CONFLICT (name)
+        DO UPDATE SET registers = EXCLUDED.registers, updated_at = CURRENT_TIMESTAMP
+    """, (name, psycopg2.Binary(sketch.to_bytes())))
+
+def rebuild_system_stats(conn=None):
+    """Recompute all stats tables from the base tables (one-off full scan)"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cur = conn.cursor()
+    
+    # window_days describes the window buckets, not the base tables
+    cur.execute("DELETE FROM system_counters WHERE name <> 'window_days'")
+    cur.execute("DELETE FROM system_sketches")
+    cur.execute("DELETE FROM detection_counters")
+    
+    count_expression = 'COUNT(*)'
+    if config.SCHEMA_MODE == 'compact':
+        table, key_columns = 'transactions_compact', ('customer_key', 'merchant_key')
+    elif config.RETENTION_ENABLED:
+        # Archived rows only survive as aggregates
+        table, key_columns = 'transaction_facts', ('customer_id', 'merchant_id')
+        count_expression = 'COALESCE(SUM(transaction_count), 0)'
+    else:
+        table, key_columns = 'transactions', ('customer_id', 'merchant_id')
+    
+    cur.execute(f"SELECT {count_expression} FROM {table}")
+    total_transactions = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*) FROM detections WHERE uploaded_to_s3 = FALSE")
+    pending_detections = cur.fetchone()[0]
+    
+    cur.execute("""
+        INSERT INTO system_counters (name, value)
+        VALUES ('total_transactions', %s), ('pending_detections', %s)
+    """, (total_transactions, pending_detections))
+    
+    cur.execute("""
+        INSERT INTO detection_counters (pattern_id, action_type, detection_count)
+        SELECT pattern_id, action_type, COUNT(*)
+        FROM detections
+        GROUP BY pattern_id, action_type
+    """)
+    
+    for sketch_name, column in zip(('customers', 'merchants'), key_columns):
+        sketch = HyperLogLog()
+        for rows in stream_query(f"SELECT DISTINCT {column} FROM {table}", conn=conn):
+            sketch.update(row[0] for row in rows)
+        cur.execute(
+            "INSERT INTO system_sketches (name, registers) VALUES (%s, %s)",
+            (sketch_name, psycopg2.Binary(sketch.to_bytes()))
+        )
+    
+    conn.commit()
+    cur.close()
+    if own_conn:
+        conn.close()
+
+def _transactions_source():
+    """Relation with the legacy transactions column layout for the current schema"""
+    return 'transactions_decoded' if config.SCHEMA_MODE == 'compact' else 'transactions'
+
+def rebuild_rollups(conn=None):
+    """
+    Recompute the analytics rollups (and the detection window, if enabled) from
+    the base tables (one-off full scan).
+    Under retention, archived transactions are no longer in the base tables.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cur = conn.cursor()
+    rollups.rebuild(cur, _transactions_source())
+    if config.DETECTION_WINDOW_DAYS:
+        sliding_window.rebuild(cur, _transactions_source())
+    conn.commit()
+    cur.close()
+    if own_conn:
+        conn.close()
+
+def rebuild_window(conn=None):
+    """Recompute the sliding detection window from the base tables (one-off scan)"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cur = conn.cursor()
+    sliding_window.rebuild(cur, _transactions_source())
+    conn.commit()
+    cur.close()
+    if own_conn:
+        conn.close()
+
+@resilience.retry('postgres')
+def insert_transactions(transactions_data):
+    """Insert transaction data into database"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    new_keys = {}
+    if config.SCHEMA_MODE == 'compact':
+        # Bulk dictionary encoding, returns integer keys of inserted rows
+        inserted, new_keys = compact_schema.insert_transactions(cur, transactions_data)
+    else:
+        query = """
+            INSERT INTO transactions 
+            (transaction_id, customer_id, customer_name, gender, merchant_id, 
+            transaction_type, transaction_amount, transaction_date)
+            VALUES %s
+            ON CONFLICT (transaction_id) DO NOTHING
+            RETURNING transaction_id, customer_id, merchant_id;
+        """
+        if config.RETENTION_ENABLED:
+            # Archived ids are gone from transactions, skip them explicitly
+            query = """
+                INSERT INTO transactions 
+                (transaction_id, customer_id, customer_name, gender, merchant_id, 
+                transaction_type, transaction_amount, transaction_date)
+                SELECT v.transaction_id, v.customer_id, v.customer_name, v.gender, v.merchant_id,
+                       v.transaction_type, v.transaction_amount::DECIMAL(15, 2),
+                       v.transaction_date::TIMESTAMP
+                FROM (VALUES %s) AS v (transaction_id, customer_id, customer_name, gender,
+                                       merchant_id, transaction_type, transaction_amount,
+                                       transaction_date)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM archived_transaction_ids a
+                    WHERE a.transaction_id = v.transaction_id
+                )
+                ON CONFLICT (transaction_id) DO NOTHING
+                RETURNING transaction_id, customer_id, merchant_id;
+            """
+        inserted = execute_values(cur, query, transactions_data, fetch=True)
+    
+    # Maintain monitoring stats and analytics rollups in the same transaction
+    _increment_counters(cur, {'total_transactions': len(inserted)})
+    _update_sketch(cur, 'customers', {row[1] for row in inserted})
+    _update_sketch(cur, 'merchants', {row[2] for row in inserted})
+    inserted_ids = {row[0] for row in inserted}
+    rollups.apply_transactions(cur, transactions_data, inserted_ids)
+    if config.DETECTION_WINDOW_DAYS:
+        sliding_window.apply_transactions(cur, transactions_data, inserted_ids)
+    
+    conn.commit()
+    compact_schema.remember_keys(new_keys)
+    cur.close()
+    conn.close()
+
+@resilience.retry('postgres')
+def insert_customer_importance(importance_data):
+    """Insert customer importance data into database"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    query = """
+        INSERT INTO customer_importance 
+        (customer_id, transaction_type, weightage)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (customer_id, transaction_type) 
+        DO UPDATE SET weightage = EXCLUDED.weightage;
+    """
+    
+    execute_batch(cur, query, importance_data)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+@resilience.retry('postgres')
+def get_last_processed_row():
+    """Get the last processed row number"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT last_processed_row FROM processing_state ORDER BY id DESC LIMIT 1")
+    result = cur.fetchone()
+    cur.close()
+    conn.close()
+    return result[0] if result else 0
+
+@resilience.retry('postgres')
+def update_last_processed_row(row_number):
+    """Update the last processed row number"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE processing_state 
+        SET last_processed_row = %s, updated_at = CURRENT_TIMESTAMP 
+        WHERE id = (SELECT id FROM processing_state ORDER BY id DESC LIMIT 1)
+    """, (row_number,))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+@resilience.retry('postgres')
+def mark_chunks_ingested(chunk_keys):
+    """Record chunk keys whose rows are stored"""
+    if not chunk_keys:
+        return
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    execute_values(cur, """
+        INSERT INTO ingested_chunks (chunk_key)
+        VALUES %s
+        ON CONFLICT (chunk_key) DO NOTHING
+    """, [(key,) for key in sorted(chunk_keys)])
+    conn.commit()
+    cur.close()
+    conn.close()
+
+@resilience.retry('postgres')
+def get_ingested_chunk_keys():
+    """Return the set of chunk keys already ingested"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT chunk_key FROM ingested_chunks")
+    keys = {row[0] for row in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return keys
+
+def insert_detection(detection_data):
+    """Insert detection data into database"""
+    insert_detections([detection_data])
+
+# Not retried: a lost COMMIT acknowledgement would insert the batch twice
+@resilience.retry('postgres', idempotent=False)
+def insert_detections(detections):
+    """Insert a batch of detections in one transaction"""
+    if not detections:
+        return
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    query = """
+        INSERT INTO detections 
+        (y_start_time, detection_time, pattern_id, action_type, customer_name, merchant_id)
+        VALUES %s
+    """
+    
+    execute_values(cur, query, detections)
+    
+    pattern_counts = Counter((d[2], d[3]) for d in detections)
+    execute_values(cur, """
+        INSERT INTO detection_counters (pattern_id, action_type, detection_count)
+        VALUES %s
+        ON CONFLICT (pattern_id, action_type)
+        DO UPDATE SET detection_count = detection_counters.detection_count + EXCLUDED.detection_count
+    """, sorted((pattern_id, action_type, count)
+                for (pattern_id, action_type), count in pattern_counts.items()))
+    _increment_counters(cur, {'pending_detections': len(detections)})
+    rollups.apply_detections(cur, detections)
+    
+    conn.commit()
+    cur.close()
+    conn.close()
+
+_cursor_names = itertools.count(1)
+
+def stream_query(query, params=None, fetch_size=None, conn=None):
+    """
+    Yield the result of a query in lists of at most fetch_size rows, read from
+    a named (server-side) cursor so the full result never sits in memory.
+    """
+    fetch_size = fetch_size or config.FETCH_SIZE
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cur = conn.cursor(name=f"stream_{next(_cursor_names)}")
+    cur.itersize = fetch_size
+    
+    try:
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+        if own_conn:
+            conn.rollback()
+            conn.close()
+
+# Idle connections kept for snapshot_connections(), which runs on every detection cycle
+_idle_connections = []
+_idle_lock = threading.Lock()
+
+def _checkout_connection():
+    """An idle pooled connection, or a new one"""
+    with _idle_lock:
+        while _idle_connections:
+            conn = _idle_connections.pop()
+            if not conn.closed:
+                return conn
+    return get_db_connection()
+
+def _checkin_connection(conn):
+    """End the connection's transaction and keep it for reuse; broken ones are dropped"""
+    if conn.closed:
+        return
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+        return
+    with _idle_lock:
+        if len(_idle_connections) < config.DB_POOL_SIZE:
+            _idle_connections.append(conn)
+            return
+    conn.close()
+
+@contextmanager
+def snapshot_connections(count):
+    """
+    Yield count pooled connections whose REPEATABLE READ, READ ONLY transactions
+    share one snapshot: the first exports it with pg_export_snapshot() and the
+    others import it, so queries run in parallel on them read identical data.
+    """
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(_checkout_connection())
+        
+        cur = connections[0].cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        cur.execute("SELECT pg_export_snapshot()")
+        snapshot_id = cur.fetchone()[0]
+        cur.close()
+        
+        # The exporting transaction stays open until every import is done
+        for conn in connections[1:]:
+            cur = conn.cursor()
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+            cur.close()
+        
+        yield connections
+    finally:
+        for conn in connections:
+            _checkin_connection(conn)
+
+def _transaction_id_query():
+    """SELECT of every stored transaction id, including archived ones under retention"""
+    if config.SCHEMA_MODE == 'compact':
+        return "SELECT transaction_id FROM transactions_compact"
+    query = "SELECT transaction_id FROM transactions"
+    if config.RETENTION_ENABLED:
+        query += " UNION ALL SELECT transaction_id FROM archived_transaction_ids"
+    return query
+
+@resilience.retry('postgres')
+def existing_transaction_ids(transaction_ids):
+    """Return the subset of the given transaction ids that is already stored"""
+    if not transaction_ids:
+        return set()
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT transaction_id FROM ({_transaction_id_query()}) ids "
+        f"WHERE transaction_id = ANY(%s)",
+        (list(transaction_ids),)
+    )
+    existing = {row[0] for row in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return existing
+
+def stream_transaction_ids(fetch_size=None):
+    """Yield all stored transaction ids in batches (server-side cursor)"""
+    for rows in stream_query(_transaction_id_query(), fetch_size=fetch_size):
+        yield [row[0] for row in rows]
+
+@resilience.retry('postgres')
+def get_unuploaded_detections(limit=50):
+    """Get detections that haven't been uploaded to S3"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute("""
+        SELECT id, y_start_time, detection_time, pattern_id, 
+            action_type, customer_name, merchant_id
+        FROM detections
+        WHERE uploaded_to_s3 = FALSE
+        ORDER BY created_at
+        LIMIT %s
+    """, (limit,))
+    
+    results = cur.fetchall()
+    cur.close()
+    conn.close()
+    return results
+
+@resilience.retry('postgres')
+def mark_detections_uploaded(detection_ids):
+    """Mark detections as uploaded to S3"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute("""
+        UPDATE detections 
+        SET uploaded_to_s3 = TRUE 
+        WHERE id = ANY(%s) AND uploaded_to_s3 = FALSE
+    """, (detection_ids,))
+    
+    _increment_counters(cur, {'pending_detections': -cur.rowcount})
+    
+    conn.commit()
+    cur.close()
+    conn.close()
+
+@resilience.retry('postgres')
+def get_system_counters():
+    """Read the incrementally maintained monitoring stats"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute("SELECT name, value FROM system_counters")
+    counters = dict(cur.fetchall())
+    
+    cur.execute("SELECT name, registers FROM system_sketches")
+    sketches = {
+        name: HyperLogLog.from_bytes(registers).count()
+        for name, registers in cur.fetchall()
+    }
+    
+    cur.execute("""
+        SELECT pattern_id, action_type, detection_count
+        FROM detection_counters
+        ORDER BY pattern_id
+    """)
+    detection_counts = cur.fetchall()
+    
+    cur.close()
+    conn.close()
+    return counters, sketches, detection_counts
+
+@resilience.retry('postgres')
+def notify_chunk_uploaded(chunk_info):
+    """Publish an uploaded chunk (key, row range, checksum) on the chunk channel"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT pg_notify(%s, %s)", (config.CHUNK_NOTIFY_CHANNEL, json.dumps(chunk_info)))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+@resilience.retry('postgres')
+def listen_for_chunks():
+    """Open a dedicated connection listening on the chunk channel"""
+    conn = get_db_connection()
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    cur = conn.cursor()
+    cur.execute(f"LISTEN {config.CHUNK_NOTIFY_CHANNEL}")
+    cur.close()
+    return conn
+
+def wait_for_chunk_notifications(conn, timeout):
+    """Block up to timeout seconds for chunk notifications, returns their payloads"""
+    if not conn.notifies:
+        ready, _, _ = select.select([conn], [], [], timeout)
+        if ready:
+            conn.poll()
+    
+    payloads = []
+    while conn.notifies:
+        notify = conn.notifies.pop(0)
+        payloads.append(json.loads(notify.payload))
+    return payloads
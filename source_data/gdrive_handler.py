@@ -1,19 +1,27 @@
 # gdrive_handler.py
-import io
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 import os
 import pickle
+import time
 import config
+import resilience
+import storage
 
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 
 def get_gdrive_service():
-    """Authenticate and return Google Drive service"""
+    """Authenticate and return Google Drive service (a local folder with SOURCE_BACKEND=local)"""
+    if config.SOURCE_BACKEND == 'local':
+        return storage.LocalSourceFolder(config.SOURCE_PATH)
+    
     creds = None
     
     if os.path.exists(config.TOKEN_FILE):
@@ -33,21 +41,151 @@ def get_gdrive_service():
     
     return build('drive', 'v3', credentials=creds)
 
-def download_csv_from_gdrive(service, file_id):
-    """Download CSV file from Google Drive"""
+def download_csv_from_gdrive(service, file_id, service_factory=None):
+    """
+    Download CSV file from Google Drive (see download_file) and parse it.
+    service_factory creates the per-thread services for range requests.
+    """
+    if isinstance(service, storage.LocalSourceFolder):
+        # Parsed straight from the file's memory mapping
+        return pd.read_csv(service.file_path(file_id), memory_map=True)
+    
+    path = download_file(
+        service, file_id, os.path.join(config.GDRIVE_DOWNLOAD_PATH, f"{file_id}.csv"), service_factory
+    )
+    return pd.read_csv(path, memory_map=True)
+
+@resilience.retry('gdrive')
+def get_file_metadata(service, file_id):
+    """Name, size and MD5 checksum of a Drive file"""
+    return service.files().get(fileId=file_id, fields='id, name, size, md5Checksum').execute()
+
+@resilience.retry('gdrive')
+def _fetch_range(service, file_id, start, end):
+    """Bytes start..end (inclusive) of a Drive file"""
     request = service.files().get_media(fileId=file_id)
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
+    request.headers['Range'] = f'bytes={start}-{end}'
+    data = request.execute()
+    
+    if len(data) != end - start + 1:
+        # OSError, so a truncated response is retried like a dropped connection
+        raise IOError(f"Range {start}-{end} of {file_id} returned {len(data)} bytes")
+    return data
+
+def _read_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+def _file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        while block := f.read(8 * 1024 * 1024):
+            md5.update(block)
+    return md5.hexdigest()
+
+def download_file(service, file_id, path, service_factory=None, workers=None, range_size=None):
+    """
+    Download a Drive file to path with concurrent range requests, returns path.
+    
+    Ranges are written into a preallocated <path>.part and recorded in
+    <path>.part.json as they complete, so a failed download resumes with the
+    missing ranges only. The result is verified against the Drive MD5
+    checksum, and reused by later calls while that checksum is unchanged.
+    Each worker thread gets its own service from service_factory (default
+    get_gdrive_service), as Drive services are not thread-safe.
+    """
+    service_factory = service_factory or get_gdrive_service
+    workers = workers or config.GDRIVE_DOWNLOAD_WORKERS
+    range_size = range_size or config.GDRIVE_RANGE_SIZE
+    
+    metadata = get_file_metadata(service, file_id)
+    size = int(metadata['size'])
+    checksum = metadata.get('md5Checksum')
+    identity = {'size': size, 'md5Checksum': checksum}
+    
+    if checksum and os.path.exists(path) and _read_json(path + '.json') == identity:
+        print(f"Using downloaded {metadata['name']} ({path}), unchanged on Drive")
+        return path
+    
+    part_path = path + '.part'
+    progress_path = part_path + '.json'
+    progress = _read_json(progress_path)
+    if (not progress or not os.path.exists(part_path)
+            or {k: progress[k] for k in identity} != identity or progress['range_size'] != range_size):
+        # New download (or the file changed on Drive since the last attempt)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+        progress = dict(identity, range_size=range_size, done=[])
+        _write_json(progress_path, progress)
     
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
+    done = set(progress['done'])
+    starts = [start for start in range(0, size, range_size) if start not in done]
+    if done:
+        print(f"Resuming download of {metadata['name']}: {len(done)} ranges already done")
+    print(f"Downloading {metadata['name']} ({size / 1024 / 1024:.1f} MB) in {len(starts)} ranges "
+          f"with {min(workers, len(starts) or 1)} workers")
     
-    fh.seek(0)
-    return pd.read_csv(fh)
+    local = threading.local()
+    lock = threading.Lock()
+    started = time.time()
+    fd = os.open(part_path, os.O_WRONLY)
+    
+    def fetch(start):
+        if not hasattr(local, 'service'):
+            local.service = service_factory()
+        data = _fetch_range(local.service, file_id, start, min(start + range_size, size) - 1)
+        os.pwrite(fd, data, start)
+        with lock:
+            done.add(start)
+            progress['done'] = sorted(done)
+            _write_json(progress_path, progress)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(fetch, start) for start in starts]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:  # Ctrl-C too: do not run the queued ranges
+                for future in futures:
+                    future.cancel()
+                print(f"Download of {metadata['name']} stopped, {len(done)} ranges kept for resume")
+                raise
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    
+    if checksum:
+        if _file_md5(part_path) != checksum:
+            # Start from scratch next time rather than resume corrupt data
+            os.remove(part_path)
+            os.remove(progress_path)
+            raise ValueError(f"Checksum mismatch for Drive file {metadata['name']}")
+    else:
+        print(f"⚠️  {metadata['name']} has no Drive checksum, not verified")
+    
+    os.replace(part_path, path)
+    _write_json(path + '.json', identity)
+    os.remove(progress_path)
+    
+    elapsed = time.time() - started
+    print(f"Downloaded {metadata['name']} in {elapsed:.1f}s "
+          f"({size / 1024 / 1024 / elapsed if elapsed else 0:.1f} MB/s)")
+    return path
 
 def list_files_in_folder(service, folder_id):
     """List all files in a Google Drive folder"""
+    if isinstance(service, storage.LocalSourceFolder):
+        return service.list_files()
+    
     results = service.files().list(
         q=f"'{folder_id}' in parents",
         fields="files(id, name, mimeType)"
@@ -63,4 +201,14 @@ def get_transactions_file_id(service):
         if file['name'].lower() == 'transactions.csv':
             return file['id']
     
-    return None
\ No newline at end of file
+    return None
+
+def get_customer_importance_file_id(service):
+    """Get the file ID for CustomerImportance.csv"""
+    files = list_files_in_folder(service, config.GDRIVE_FOLDER_ID)
+    
+    for file in files:
+        if file['name'].lower() == 'customerimportance.csv':
+            return file['id']
+    
+    return None
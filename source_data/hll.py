@@ -0,0 +1,76 @@
+# hll.py
+"""
+Minimal HyperLogLog sketch used for approximate distinct counts in the stats tables
+"""
+import hashlib
+import math
+
+DEFAULT_PRECISION = 14  # 16384 registers, ~0.8% standard error
+
+class HyperLogLog:
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.num_registers)
+        else:
+            if len(registers) != self.num_registers:
+                raise ValueError("Register array does not match sketch precision")
+            self.registers = bytearray(registers)
+
+    @staticmethod
+    def _hash(value):
+        """Return a 64-bit hash of the value"""
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+    def add(self, value):
+        """Add a single value to the sketch, returns True if a register changed"""
+        h = self._hash(value)
+        index = h >> (64 - self.precision)
+        remainder = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def update(self, values):
+        """Add many values, returns True if any register changed"""
+        changed = False
+        for value in values:
+            if self.add(value):
+                changed = True
+        return changed
+
+    def merge(self, other):
+        """Merge another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        self.registers = bytearray(
+            max(a, b) for a, b in zip(self.registers, other.registers)
+        )
+
+    def count(self):
+        """Estimate the number of distinct values added"""
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # Small range correction (linear counting)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """Serialise registers for storage"""
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data, precision=DEFAULT_PRECISION):
+        """Restore a sketch from stored registers"""
+        if data is None:
+            return cls(precision)
+        return cls(precision, bytes(data))
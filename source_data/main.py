@@ -1,17 +1,19 @@
 # main.py
 """
 Main entry point for the transaction processing system
-Runs both Mechanism X and Y concurrently
+Runs both Mechanism X and Y concurrently (threads; RUNNER=processes uses supervisor.py)
 """
 import threading
 import time
+import config
 import database
-from mechanism_x import MechanismX
-from mechanism_y import MechanismY
+import profiling
+import retention
 
 def run_mechanism_x():
     """Run Mechanism X in a separate thread"""
     try:
+        from mechanism_x import MechanismX
         mechanism_x = MechanismX()
         mechanism_x.run()
     except Exception as e:
@@ -24,6 +26,7 @@ def run_mechanism_y():
     try:
         # Wait a bit for Mechanism X to start uploading files
         time.sleep(2)
+        from mechanism_y import MechanismY
         mechanism_y = MechanismY()
         mechanism_y.run()
     except Exception as e:
@@ -31,12 +34,29 @@ def run_mechanism_y():
         import traceback
         traceback.print_exc()
 
+def run_retention():
+    """Run the retention loop in a separate thread"""
+    try:
+        retention.run_forever()
+    except Exception as e:
+        print(f"Retention failed: {e}")
+        import traceback
+        traceback.print_exc()
+
 def main():
     """Initialize system and start both mechanisms"""
+    if config.RUNNER == 'processes':
+        # One process per mechanism/worker, see supervisor.py
+        import supervisor
+        return supervisor.main()
+    
     print("=" * 60)
     print("Transaction Processing System Starting...")
     print("=" * 60)
     
+    # Profiling toggles (signals must be registered from the main thread)
+    profiling.install()
+    
     # Initialize database
     print("\nInitializing database...")
     database.init_database()
@@ -50,6 +70,11 @@ def main():
     thread_x.start()
     thread_y.start()
     
+    if config.RETENTION_ENABLED:
+        # Daemon: never holds up shutdown once X and Y have stopped
+        thread_retention = threading.Thread(target=run_retention, name="Retention", daemon=True)
+        thread_retention.start()
+    
     # Wait for both to complete
     try:
         thread_x.join()
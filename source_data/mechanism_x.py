@@ -2,19 +2,31 @@
 """
 Mechanism X: Reads transactions from Google Drive and uploads chunks to S3 every second
 """
+import io
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 from datetime import datetime
 import database
 import gdrive_handler
 import s3_handler
 import config
+import profiling
+import resilience
 
 class MechanismX:
-    def __init__(self):
-        self.service = gdrive_handler.get_gdrive_service()
+    def __init__(self, service_factory=None):
+        # service_factory() returns a Drive service (or a fake in tests); one is
+        # created per download thread
+        self.service_factory = service_factory or gdrive_handler.get_gdrive_service
+        self.service = self.service_factory()
         self.transactions_df = None
         self.chunk_number = 0
+        self.manifest = None
+        # Optional handoff(chunk_info, data) called with each published chunk's
+        # uploaded bytes, e.g. to pass them to colocated Y workers (supervisor.py)
+        self.handoff = None
+        self.handoff_data = {}
         
     def load_initial_data(self):
         """Load transactions and customer importance data"""
@@ -26,7 +38,7 @@ class MechanismX:
             raise Exception("transactions.csv not found in Google Drive folder")
         
         self.transactions_df = gdrive_handler.download_csv_from_gdrive(
-            self.service, trans_file_id
+            self.service, trans_file_id, self.service_factory
         )
         print(f"Loaded {len(self.transactions_df)} transactions")
         
@@ -34,7 +46,7 @@ class MechanismX:
         importance_file_id = gdrive_handler.get_customer_importance_file_id(self.service)
         if importance_file_id:
             importance_df = gdrive_handler.download_csv_from_gdrive(
-                self.service, importance_file_id
+                self.service, importance_file_id, self.service_factory
             )
             
             # Store in database
@@ -57,11 +69,11 @@ class MechanismX:
         # Get next chunk
         start_idx = last_row
         end_idx = min(start_idx + config.CHUNK_SIZE, len(self.transactions_df))
-        chunk_df = self.transactions_df.iloc[start_idx:end_idx].copy()
         
         # Upload to S3
         self.chunk_number += 1
-        s3_handler.upload_transactions_to_s3(chunk_df, self.chunk_number)
+        chunk_info = self.upload_chunk(start_idx, end_idx)
+        self.publish_chunk(chunk_info)
         
         # Update processing state
         database.update_last_processed_row(end_idx)
@@ -69,6 +81,93 @@ class MechanismX:
         print(f"Processed chunk {self.chunk_number}: rows {start_idx} to {end_idx}")
         return True
     
+    def upload_chunk(self, start_idx, end_idx, s3_client=None):
+        """Upload rows [start_idx, end_idx) as one chunk, returns its chunk info"""
+        chunk_df = self.transactions_df.iloc[start_idx:end_idx]
+        if self.handoff is None:
+            return s3_handler.upload_transactions_to_s3(chunk_df, start_idx, end_idx, s3_client)
+        
+        copy = io.BytesIO()
+        chunk_info = s3_handler.upload_transactions_to_s3(
+            chunk_df, start_idx, end_idx, s3_client, copy_to=copy
+        )
+        self.handoff_data[chunk_info['key']] = copy.getvalue()
+        return chunk_info
+    
+    def publish_chunk(self, chunk_info, s3_client=None):
+        """Record an uploaded chunk in the manifest, then notify Y"""
+        if self.manifest is None:
+            self.manifest = s3_handler.load_manifest(s3_client)
+        self.manifest = s3_handler.append_to_manifest(self.manifest, chunk_info, s3_client)
+        
+        if config.CHUNK_NOTIFICATIONS:
+            try:
+                database.notify_chunk_uploaded(chunk_info)
+            except Exception as e:
+                # Y falls back to reading the manifest, so a lost notification only adds latency
+                print(f"Could not publish chunk notification: {e}")
+        
+        if self.handoff is not None:
+            self.handoff(chunk_info, self.handoff_data.pop(chunk_info['key']))
+    
+    def catch_up(self):
+        """
+        Upload the backlog concurrently through a thread pool.
+        last_processed_row only advances through a contiguous watermark of
+        completed chunks, so a crash never skips rows (at worst chunks past
+        the watermark are uploaded again and dropped by ON CONFLICT in Y).
+        """
+        start_row = database.get_last_processed_row()
+        target_row = len(self.transactions_df)
+        if config.CATCHUP_MAX_ROWS:
+            target_row = min(target_row, start_row + config.CATCHUP_MAX_ROWS)
+        
+        if start_row >= target_row:
+            return
+        
+        ranges = [
+            (start_idx, min(start_idx + config.CHUNK_SIZE, target_row))
+            for start_idx in range(start_row, target_row, config.CHUNK_SIZE)
+        ]
+        print(f"Catching up {target_row - start_row} rows in {len(ranges)} chunks "
+              f"with {config.CATCHUP_WORKERS} workers")
+        
+        # boto3 clients are thread-safe, client creation is not
+        s3_client = s3_handler.get_s3_client()
+        started = time.time()
+        completed = {}
+        watermark = start_row
+        
+        with ThreadPoolExecutor(max_workers=config.CATCHUP_WORKERS) as pool:
+            futures = {
+                pool.submit(self.upload_chunk, start_idx, end_idx, s3_client): start_idx
+                for start_idx, end_idx in ranges
+            }
+            self.chunk_number += len(ranges)
+            
+            try:
+                for future in as_completed(futures):
+                    chunk_info = future.result()
+                    # Manifest writes stay on this thread (single writer)
+                    self.publish_chunk(chunk_info, s3_client)
+                    completed[futures[future]] = chunk_info['end_row']
+                    
+                    # Advance the watermark over contiguous completed chunks
+                    previous = watermark
+                    while watermark in completed:
+                        watermark = completed.pop(watermark)
+                    if watermark != previous:
+                        database.update_last_processed_row(watermark)
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                print(f"Catch-up stopped at row {watermark}")
+                raise
+        
+        elapsed = time.time() - started
+        print(f"Caught up to row {watermark} in {elapsed:.2f}s "
+              f"({(watermark - start_row) / elapsed:.0f} rows/second)")
+    
     def run(self):
         """Main execution loop"""
         print("Starting Mechanism X...")
@@ -76,14 +175,33 @@ class MechanismX:
         # Load initial data
         self.load_initial_data()
         
+        # Upload any backlog at full bandwidth before pacing
+        if config.CATCHUP_WORKERS > 0:
+            try:
+                self.catch_up()
+            except Exception as e:
+                # The paced loop resumes from the contiguous watermark
+                print(f"Error in Mechanism X catch-up: {e}")
+        
         # Process chunks every second
         while True:
             try:
-                has_more = self.process_next_chunk()
+                with profiling.stage('x_chunk'):
+                    has_more = self.process_next_chunk()
                 
                 if not has_more:
                     print("Mechanism X completed processing all transactions")
                     break
                 
                 # Wait for next second
-                time.sleep(config.PROCESSING_INTERVAL)
\ No newline at end of file
+                time.sleep(config.PROCESSING_INTERVAL)
+                
+            except KeyboardInterrupt:
+                print("\nMechanism X stopped by user")
+                break
+            except resilience.CircuitOpenError as e:
+                print(f"Mechanism X waiting: {e}")
+                time.sleep(max(e.retry_after, 0.1))
+            except Exception as e:
+                print(f"Error in Mechanism X: {e}")
+                time.sleep(config.PROCESSING_INTERVAL)
@@ -3,433 +3,549 @@
 Mechanism Y: Ingests S3 transaction chunks, detects patterns, and uploads detections
 """
 import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from datetime import datetime
 import pytz
 import database
 import s3_handler
 import config
+import profiling
+import resilience
+import bloom
+import compact_schema
+import retention
+import sliding_window
+
+# Detection queries over the legacy transactions table
+
+PATTERN_1_QUERY = """
+WITH merchant_stats AS (
+    SELECT 
+        merchant_id,
+        COUNT(*) as total_transactions
+    FROM transactions
+    GROUP BY merchant_id
+    HAVING COUNT(*) > 50000
+),
+customer_merchant_stats AS (
+    SELECT 
+        t.customer_id,
+        t.customer_name,
+        t.merchant_id,
+        t.transaction_type,
+        COUNT(*) as transaction_count,
+        COALESCE(ci.weightage, 0) as weightage
+    FROM transactions t
+    LEFT JOIN customer_importance ci 
+        ON t.customer_id = ci.customer_id 
+        AND t.transaction_type = ci.transaction_type
+    WHERE t.merchant_id IN (SELECT merchant_id FROM merchant_stats)
+    GROUP BY t.customer_id, t.customer_name, t.merchant_id, 
+             t.transaction_type, ci.weightage
+),
+customer_avg_weight AS (
+    SELECT 
+        customer_id,
+        customer_name,
+        merchant_id,
+        SUM(transaction_count) as total_transactions,
+        AVG(weightage) as avg_weightage
+    FROM customer_merchant_stats
+    GROUP BY customer_id, customer_name, merchant_id
+),
+merchant_percentiles AS (
+    SELECT 
+        merchant_id,
+        PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY total_transactions) as tx_90th,
+        PERCENTILE_CONT(0.1) WITHIN GROUP (ORDER BY avg_weightage) as weight_10th
+    FROM customer_avg_weight
+    GROUP BY merchant_id
+)
+SELECT DISTINCT
+    caw.customer_name,
+    caw.merchant_id
+FROM customer_avg_weight caw
+JOIN merchant_percentiles mp ON caw.merchant_id = mp.merchant_id
+WHERE caw.total_transactions >= mp.tx_90th
+  AND caw.avg_weightage <= mp.weight_10th
+  AND NOT EXISTS (
+      SELECT 1 FROM detections d
+      WHERE d.pattern_id = 'PatId1'
+        AND d.customer_name = caw.customer_name
+        AND d.merchant_id = caw.merchant_id
+  )
+"""
+
+PATTERN_2_QUERY = """
+SELECT 
+    t.customer_name,
+    t.merchant_id,
+    AVG(t.transaction_amount) as avg_amount,
+    COUNT(*) as transaction_count
+FROM transactions t
+GROUP BY t.customer_name, t.merchant_id
+HAVING COUNT(*) >= 80
+  AND AVG(t.transaction_amount) < 23
+  AND NOT EXISTS (
+      SELECT 1 FROM detections d
+      WHERE d.pattern_id = 'PatId2'
+        AND d.customer_name = t.customer_name
+        AND d.merchant_id = t.merchant_id
+  )
+"""
+
+PATTERN_3_QUERY = """
+WITH gender_counts AS (
+    SELECT 
+        merchant_id,
+        SUM(CASE WHEN UPPER(gender) = 'FEMALE' THEN 1 ELSE 0 END) as female_count,
+        SUM(CASE WHEN UPPER(gender) = 'MALE' THEN 1 ELSE 0 END) as male_count
+    FROM (
+        SELECT DISTINCT merchant_id, customer_id, gender
+        FROM transactions
+    ) unique_customers
+    GROUP BY merchant_id
+)
+SELECT merchant_id
+FROM gender_counts
+WHERE female_count > 100
+  AND male_count > female_count
+  AND NOT EXISTS (
+      SELECT 1 FROM detections d
+      WHERE d.pattern_id = 'PatId3'
+        AND d.merchant_id = gender_counts.merchant_id
+  )
+"""
+
+def pattern_query(number):
+    """Detection SQL for pattern 1-3 under the configured window, schema and retention mode"""
+    if config.DETECTION_WINDOW_DAYS:
+        # Last N days only, from the day buckets in sliding_window.py
+        return getattr(sliding_window, f"PATTERN_{number}_QUERY")
+    if config.SCHEMA_MODE == 'compact':
+        # Same pattern over integer keys, see compact_schema.py
+        return getattr(compact_schema, f"PATTERN_{number}_QUERY")
+    if config.RETENTION_ENABLED:
+        # Hot rows plus archived aggregates, see retention.py
+        return getattr(retention, f"PATTERN_{number}_QUERY")
+    return globals()[f"PATTERN_{number}_QUERY"]
 
 class MechanismY:
-    def __init__(self):
+    def __init__(self, backend=None, clock=None):
         self.processed_files = set()
         self.y_start_time = None
+        self.backend = backend or config.DETECTION_BACKEND
+        self.clock = clock
+        self.detector = None
+        self.listen_conn = None
+        self.listen_retry_at = 0
+        self.needs_listing = True
+        self.chunk_checksums = {}
+        self.chunk_sizes = {}
+        self.manifest_segments = {}
+        self.pending_files = []
+        self.last_detection = time.monotonic()
+        self.id_filter = None
+        self.id_filter_saved_at = 0  # first insert saves the filter
+        
+        if self.backend == 'memory':
+            from vector_detector import VectorDetector
+            self.detector = VectorDetector()
+            if config.CUSTOMER_IMPORTANCE_PATH:
+                importance_df = pd.read_csv(config.CUSTOMER_IMPORTANCE_PATH)
+                self.detector.load_customer_importance(list(zip(
+                    importance_df['CustomerId'],
+                    importance_df['TransactionType'],
+                    importance_df['Weightage']
+                )))
         
     def get_ist_time(self):
-        """Get current time in IST"""
+        """Get current time in IST (or the injected clock's time, e.g. during replay)"""
+        if self.clock is not None:
+            return self.clock()
         ist = pytz.timezone('Asia/Kolkata')
         return datetime.now(ist).replace(tzinfo=None)
     
-    def process_transaction_chunk(self, s3_key):
-        """Process a single transaction chunk from S3"""
-        print(f"Processing file: {s3_key}")
+    def chunk_to_rows(self, chunk_df):
+        """Convert a chunk DataFrame into transaction tuples for insertion"""
+        def text_column(name):
+            if name not in chunk_df:
+                return [''] * len(chunk_df)
+            return chunk_df[name].map(str).tolist()
         
-        # Download and parse
-        chunk_df = s3_handler.download_s3_file_to_dataframe(s3_key)
+        # Column-wise conversion, equivalent to per-row str()/float()/to_datetime()
+        if 'TransactionAmount' in chunk_df:
+            amounts = chunk_df['TransactionAmount'].astype(float).tolist()
+        else:
+            amounts = [0.0] * len(chunk_df)
         
-        # Store in database
+        if 'TransactionDate' in chunk_df:
+            dates = pd.to_datetime(chunk_df['TransactionDate'], format='mixed').tolist()
+        else:
+            dates = [pd.Timestamp(datetime.now())] * len(chunk_df)
+        
+        return list(zip(
+            text_column('TransactionId'),
+            text_column('CustomerId'),
+            text_column('CustomerName'),
+            text_column('Gender'),
+            text_column('MerchantId'),
+            text_column('TransactionType'),
+            amounts,
+            dates
+        ))
+    
+    def process_transaction_chunk(self, s3_key, chunk_df=None):
+        """Process a single transaction chunk from S3 (or already parsed, if given)"""
+        self.process_transaction_batch([s3_key], [chunk_df])
+    
+    def process_transaction_batch(self, s3_keys, chunk_dfs=None):
+        """
+        Ingest several chunks with a single insert (one database transaction).
+        chunk_dfs may hold already parsed chunks, None entries are downloaded.
+        """
+        chunk_dfs = chunk_dfs or [None] * len(s3_keys)
         transactions_data = []
-        for _, row in chunk_df.iterrows():
-            transactions_data.append((
-                str(row.get('TransactionId', '')),
-                str(row.get('CustomerId', '')),
-                str(row.get('CustomerName', '')),
-                str(row.get('Gender', '')),
-                str(row.get('MerchantId', '')),
-                str(row.get('TransactionType', '')),
-                float(row.get('TransactionAmount', 0)),
-                pd.to_datetime(row.get('TransactionDate', datetime.now()))
-            ))
-        
-        database.insert_transactions(transactions_data)
-        print(f"Inserted {len(transactions_data)} transactions into database")
+        
+        if self.detector is None and config.DEDUP_FILTER and self.id_filter is None:
+            self.id_filter = self.load_id_filter()
+        
+        for s3_key, chunk_df in zip(s3_keys, chunk_dfs):
+            print(f"Processing file: {s3_key}")
+            if chunk_df is None:
+                # Download and parse (verified against the checksum X published, if any)
+                chunk_df = s3_handler.download_s3_file_to_dataframe(
+                    s3_key, self.chunk_checksums.get(s3_key)
+                )
+            rows = self.chunk_to_rows(chunk_df)
+            if self.id_filter is not None:
+                rows = self.drop_known_rows(s3_key, rows)
+            transactions_data.extend(rows)
+        
+        if self.detector is not None:
+            self.detector.add_transactions(transactions_data)
+            print(f"Stored {len(transactions_data)} transactions in memory")
+        elif transactions_data:
+            # Store in database
+            database.insert_transactions(transactions_data)
+            print(f"Inserted {len(transactions_data)} transactions into database")
+            if self.id_filter is not None:
+                self.remember_ids([row[0] for row in transactions_data])
+        
+        if self.detector is None:
+            database.mark_chunks_ingested(s3_keys)
+        
+        for s3_key in s3_keys:
+            self.chunk_checksums.pop(s3_key, None)
+            self.chunk_sizes.pop(s3_key, None)
+    
+    def load_id_filter(self, capacity=None):
+        """Load the saved transaction-id filter, or build one from the stored ids"""
+        capacity = capacity or config.DEDUP_FILTER_CAPACITY
+        id_filter = bloom.load(config.DEDUP_FILTER_PATH)
+        if (id_filter is not None and id_filter.capacity >= capacity
+                and id_filter.error_rate == config.DEDUP_FILTER_ERROR_RATE
+                and id_filter.count <= id_filter.capacity):
+            return id_filter
+        
+        id_filter = bloom.BloomFilter(capacity, config.DEDUP_FILTER_ERROR_RATE)
+        for transaction_ids in database.stream_transaction_ids():
+            id_filter.update(transaction_ids)
+        print(f"Built transaction-id filter from {id_filter.count} stored ids "
+              f"({id_filter.byte_size / 1024 / 1024:.1f} MB)")
+        return id_filter
+    
+    def drop_known_rows(self, s3_key, rows):
+        """
+        Remove rows whose transaction_id is already stored. Ids the filter has
+        never seen are new; possible duplicates are checked with one query,
+        even when every id hits the filter, so a new id that is a false
+        positive in an otherwise re-delivered chunk is still kept.
+        """
+        transaction_ids = [row[0] for row in rows]
+        maybe_known = self.id_filter.contains_many(transaction_ids)
+        
+        if not maybe_known.any():
+            return rows
+        
+        candidates = [transaction_ids[i] for i in maybe_known.nonzero()[0]]
+        existing = database.existing_transaction_ids(candidates)
+        if len(existing) == len(set(transaction_ids)):
+            print(f"Skipping {s3_key}: all {len(rows)} transactions already ingested")
+            return []
+        if existing:
+            print(f"Dropping {len(existing)} already ingested transactions from {s3_key}")
+        return [row for row in rows if row[0] not in existing]
     
-    def detect_pattern_1(self):
+    def remember_ids(self, transaction_ids):
+        """Add inserted ids to the filter; grow it when full and save it periodically"""
+        self.id_filter.update(transaction_ids)
+        
+        if self.id_filter.count > self.id_filter.capacity:
+            # Past capacity the false-positive rate climbs, rebuild twice as large
+            self.id_filter = self.load_id_filter(self.id_filter.capacity * 2)
+            self.id_filter_saved_at = 0
+        
+        if time.monotonic() - self.id_filter_saved_at >= config.DEDUP_FILTER_SAVE_INTERVAL:
+            self.id_filter.save(config.DEDUP_FILTER_PATH)
+            self.id_filter_saved_at = time.monotonic()
+    
+    def detect_pattern_1(self, conn=None):
         """
         Pattern 1: Customer in top 10 percentile for transactions with bottom 10% weight
         Action: UPGRADE
         Only when merchant has >50K transactions
         """
-        conn = database.get_db_connection()
-        cur = conn.cursor()
-        
-        query = """
-        WITH merchant_stats AS (
-            SELECT 
-                merchant_id,
-                COUNT(*) as total_transactions
-            FROM transactions
-            GROUP BY merchant_id
-            HAVING COUNT(*) > 50000
-        ),
-        customer_merchant_stats AS (
-            SELECT 
-                t.customer_id,
-                t.customer_name,
-                t.merchant_id,
-                t.transaction_type,
-                COUNT(*) as transaction_count,
-                COALESCE(ci.weightage, 0) as weightage
-            FROM transactions t
-            LEFT JOIN customer_importance ci 
-                ON t.customer_id = ci.customer_id 
-                AND t.transaction_type = ci.transaction_type
-            WHERE t.merchant_id IN (SELECT merchant_id FROM merchant_stats)
-            GROUP BY t.customer_id, t.customer_name, t.merchant_id, 
-                     t.transaction_type, ci.weightage
-        ),
-        customer_avg_weight AS (
-            SELECT 
-                customer_id,
-                customer_name,
-                merchant_id,
-                SUM(transaction_count) as total_transactions,
-                AVG(weightage) as avg_weightage
-            FROM customer_merchant_stats
-            GROUP BY customer_id, customer_name, merchant_id
-        ),
-        merchant_percentiles AS (
-            SELECT 
-                merchant_id,
-                PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY total_transactions) as tx_90th,
-                PERCENTILE_CONT(0.1) WITHIN GROUP (ORDER BY avg_weightage) as weight_10th
-            FROM customer_avg_weight
-            GROUP BY merchant_id
-        )
-        SELECT DISTINCT
-            caw.customer_name,
-            caw.merchant_id
-        FROM customer_avg_weight caw
-        JOIN merchant_percentiles mp ON caw.merchant_id = mp.merchant_id
-        WHERE caw.total_transactions >= mp.tx_90th
-          AND caw.avg_weightage <= mp.weight_10th
-          AND NOT EXISTS (
-              SELECT 1 FROM detections d
-              WHERE d.pattern_id = 'PatId1'
-                AND d.customer_name = caw.customer_name
-                AND d.merchant_id = caw.merchant_id
-          )
-        """
-        
-        cur.execute(query)
-        results = cur.fetchall()
+        query = pattern_query(1)
         
-        detections = []
         detection_time = self.get_ist_time()
+        detection_count = 0
         
-        for customer_name, merchant_id in results:
-            detection = (
-                self.y_start_time,
-                detection_time,
-                'PatId1',
-                'UPGRADE',
-                customer_name,
-                merchant_id
-            )
-            database.insert_detection(detection)
-            detections.append(detection)
-        
-        cur.close()
-        conn.close()
+        # Server-side cursor: at most FETCH_SIZE result rows are held at a time
+        for results in database.stream_query(query, conn=conn):
+            detections = [
+                (self.y_start_time, detection_time, 'PatId1', 'UPGRADE', customer_name, merchant_id)
+                for customer_name, merchant_id in results
+            ]
+            database.insert_detections(detections)
+            detection_count += len(detections)
         
-        if detections:
-            print(f"Pattern 1: Detected {len(detections)} UPGRADE cases")
+        if detection_count:
+            print(f"Pattern 1: Detected {detection_count} UPGRADE cases")
         
-        return detections
+        return detection_count
     
-    def detect_pattern_2(self):
+    def detect_pattern_2(self, conn=None):
         """
         Pattern 2: Customer with avg transaction < 23 and >= 80 transactions
         Action: CHILD
         """
-        conn = database.get_db_connection()
-        cur = conn.cursor()
-        
-        query = """
-        SELECT 
-            t.customer_name,
-            t.merchant_id,
-            AVG(t.transaction_amount) as avg_amount,
-            COUNT(*) as transaction_count
-        FROM transactions t
-        GROUP BY t.customer_name, t.merchant_id
-        HAVING COUNT(*) >= 80
-          AND AVG(t.transaction_amount) < 23
-          AND NOT EXISTS (
-              SELECT 1 FROM detections d
-              WHERE d.pattern_id = 'PatId2'
-                AND d.customer_name = t.customer_name
-                AND d.merchant_id = t.merchant_id
-          )
-        """
-        
-        cur.execute(query)
-        results = cur.fetchall()
+        query = pattern_query(2)
         
-        detections = []
         detection_time = self.get_ist_time()
+        detection_count = 0
         
-        for customer_name, merchant_id, avg_amount, tx_count in results:
-            detection = (
-                self.y_start_time,
-                detection_time,
-                'PatId2',
-                'CHILD',
-                customer_name,
-                merchant_id
-            )
-            database.insert_detection(detection)
-            detections.append(detection)
-        
-        cur.close()
-        conn.close()
+        # Server-side cursor: at most FETCH_SIZE result rows are held at a time
+        for results in database.stream_query(query, conn=conn):
+            detections = [
+                (self.y_start_time, detection_time, 'PatId2', 'CHILD', customer_name, merchant_id)
+                for customer_name, merchant_id, avg_amount, tx_count in results
+            ]
+            database.insert_detections(detections)
+            detection_count += len(detections)
         
-        if detections:
-            print(f"Pattern 2: Detected {len(detections)} CHILD cases")
+        if detection_count:
+            print(f"Pattern 2: Detected {detection_count} CHILD cases")
         
-        return detections
+        return detection_count
     
-    def detect_pattern_3(self):
+    def detect_pattern_3(self, conn=None):
         """
         Pattern 3: Merchants with more male than female customers (female > 100)
         Action: DEI-NEEDED
         """
-        conn = database.get_db_connection()
-        cur = conn.cursor()
-        
-        query = """
-        WITH gender_counts AS (
-            SELECT 
-                merchant_id,
-                SUM(CASE WHEN UPPER(gender) = 'FEMALE' THEN 1 ELSE 0 END) as female_count,
-                SUM(CASE WHEN UPPER(gender) = 'MALE' THEN 1 ELSE 0 END) as male_count
-            FROM (
-                SELECT DISTINCT merchant_id, customer_id, gender
-                FROM transactions
-            ) unique_customers
-            GROUP BY merchant_id
-        )
-        SELECT merchant_id
-        FROM gender_counts
-        WHERE female_count > 100
-          AND male_count > female_count
-          AND NOT EXISTS (
-              SELECT 1 FROM detections d
-              WHERE d.pattern_id = 'PatId3'
-                AND d.merchant_id = gender_counts.merchant_id
-          )
-        """
-        
-        cur.execute(query)
-        results = cur.fetchall()
+        query = pattern_query(3)
         
-        detections = []
         detection_time = self.get_ist_time()
+        detection_count = 0
         
-        for (merchant_id,) in results:
-            detection = (
-                self.y_start_time,
-                detection_time,
-                'PatId3',
-                'DEI-NEEDED',
-                '',  # No customer name for merchant-level pattern
-                merchant_id
-            )
-            database.insert_detection(detection)
-            detections.append(detection)
-        
-        cur.close()
-        conn.close()
+        # Server-side cursor: at most FETCH_SIZE result rows are held at a time
+        for results in database.stream_query(query, conn=conn):
+            detections = [
+                (self.y_start_time, detection_time, 'PatId3', 'DEI-NEEDED', '', merchant_id)
+                for (merchant_id,) in results
+            ]
+            database.insert_detections(detections)
+            detection_count += len(detections)
         
-        if detections:
-            print(f"Pattern 3: Detected {len(detections)} DEI-NEEDED cases")
+        if detection_count:
+            print(f"Pattern 3: Detected {detection_count} DEI-NEEDED cases")
         
-        return detections
+        return detection_count
     
     def detect_all_patterns(self):
-        """Run all pattern detections"""
-        all_detections = []
+        """
+        Run all pattern detections, returns the number of new detections.
+        The SQL detectors all read one exported snapshot, concurrently on
+        their own connections unless DETECTION_PARALLEL is off.
+        """
+        if self.detector is not None:
+            return len(self.detector.detect_all_patterns(self.y_start_time, self.get_ist_time()))
+        
+        detectors = [
+            ('PatId1', self.detect_pattern_1),
+            ('PatId2', self.detect_pattern_2),
+            ('PatId3', self.detect_pattern_3),
+        ]
+        timings = {}
+        started = time.monotonic()
         
-        all_detections.extend(self.detect_pattern_1())
-        all_detections.extend(self.detect_pattern_2())
-        all_detections.extend(self.detect_pattern_3())
+        def run(pattern_id, detect, conn):
+            detector_started = time.monotonic()
+            count = detect(conn)
+            timings[pattern_id] = time.monotonic() - detector_started
+            return count
         
-        return all_detections
+        if config.DETECTION_PARALLEL:
+            with database.snapshot_connections(len(detectors)) as connections:
+                with ThreadPoolExecutor(max_workers=len(detectors)) as pool:
+                    futures = [
+                        pool.submit(run, pattern_id, detect, conn)
+                        for (pattern_id, detect), conn in zip(detectors, connections)
+                    ]
+                    detection_count = sum(future.result() for future in futures)
+        else:
+            with database.snapshot_connections(1) as (conn,):
+                detection_count = sum(run(pattern_id, detect, conn) for pattern_id, detect in detectors)
+        
+        print(f"Detection cycle {time.monotonic() - started:.2f}s ("
+              + ', '.join(f"{pattern_id} {timings[pattern_id]:.2f}s" for pattern_id, _ in detectors)
+              + ")")
+        return detection_count
     
-    def upload_detection_batches(self):
-        """Upload pending detections to S3 in batches"""
+    def upload_detection_batches(self, upload=None):
+        """Upload pending detections to S3 (or the given upload function) in batches"""
+        upload = upload or s3_handler.upload_detections_to_s3
+        
+        # The in-memory detector exposes the same pending-detection API as database
+        store = self.detector if self.detector is not None else database
+        
         while True:
-            detections = database.get_unuploaded_detections(config.DETECTION_BATCH_SIZE)
+            detections = store.get_unuploaded_detections(config.DETECTION_BATCH_SIZE)
             
             if not detections:
                 break
             
             # Upload to S3
-            s3_handler.upload_detections_to_s3(detections)
+            upload(detections)
             
             # Mark as uploaded
             detection_ids = [d[0] for d in detections]
-            database.mark_detections_uploaded(detection_ids)
+            store.mark_detections_uploaded(detection_ids)
+    
+    def start_listening(self):
+        """Subscribe to chunk notifications, falling back to polling on failure"""
+        try:
+            self.listen_conn = database.listen_for_chunks()
+            # Anything uploaded while we were not listening must be found in the manifest
+            self.needs_listing = True
+        except Exception as e:
+            print(f"Chunk notifications unavailable, polling S3 instead: {e}")
+            self.listen_retry_at = time.time() + config.CHUNK_NOTIFY_TIMEOUT
+    
+    def stop_listening(self):
+        """Drop the notification connection (re-established on the next cycle)"""
+        if self.listen_conn is not None:
+            try:
+                self.listen_conn.close()
+            except Exception:
+                pass
+            self.listen_conn = None
+    
+    def find_new_files(self, wait=True):
+        """
+        Return chunk keys that have not been processed yet.
+        Blocks on Mechanism X's notifications when listening (only polls them
+        if wait is False); reads the chunk manifest on startup, after a
+        notification timeout (missed notifications) and when notifications
+        are unavailable.
+        """
+        if (config.CHUNK_NOTIFICATIONS and self.listen_conn is None
+                and time.time() >= self.listen_retry_at):
+            self.start_listening()
+        
+        if self.listen_conn is not None and not self.needs_listing:
+            notifications = database.wait_for_chunk_notifications(
+                self.listen_conn, config.CHUNK_NOTIFY_TIMEOUT if wait else 0
+            )
+            if notifications or not wait:
+                for notification in notifications:
+                    self.chunk_checksums[notification['key']] = notification.get('checksum')
+                    self.chunk_sizes[notification['key']] = (
+                        notification.get('row_count', config.CHUNK_SIZE),
+                        notification.get('byte_size', 0)
+                    )
+                return [n['key'] for n in notifications if n['key'] not in self.processed_files]
+        
+        # Read the manifest (one GET, compacted segments are cached)
+        self.needs_listing = False
+        chunks = s3_handler.list_manifest_chunks(self.manifest_segments)
+        new_chunks = [c for c in chunks if c['key'] not in self.processed_files]
+        for chunk in new_chunks:
+            self.chunk_checksums[chunk['key']] = chunk['checksum']
+            self.chunk_sizes[chunk['key']] = (chunk['row_count'], chunk['byte_size'])
+        return list(dict.fromkeys(c['key'] for c in new_chunks))
+    
+    def next_ingest_batch(self):
+        """Leading queued chunk keys that fit the row/byte budget (at least one)"""
+        batch = []
+        rows = 0
+        size = 0
+        for s3_key in self.pending_files:
+            chunk_rows, chunk_bytes = self.chunk_sizes.get(s3_key, (config.CHUNK_SIZE, 0))
+            if batch and (rows + chunk_rows > config.INGEST_BATCH_MAX_ROWS or
+                          size + chunk_bytes > config.INGEST_BATCH_MAX_BYTES):
+                break
+            batch.append(s3_key)
+            rows += chunk_rows
+            size += chunk_bytes
+        
+        if len(batch) > 1:
+            print(f"Coalescing {len(batch)} chunks ({rows} rows) into one ingest batch")
+        return batch
     
     def run(self):
         """Main execution loop"""
         print("Starting Mechanism Y...")
         self.y_start_time = self.get_ist_time()
         
+        if self.detector is None:
+            # Chunks ingested by earlier runs are not re-delivered (archived ids
+            # are only kept for RETENTION_DEDUP_HOURS)
+            self.processed_files.update(database.get_ingested_chunk_keys())
+        
         while True:
             try:
-                # List files in S3
-                s3_files = s3_handler.list_s3_transaction_files()
-                
-                # Process new files
-                new_files = [f for f in s3_files if f not in self.processed_files]
+                # Queue new files (only block for notifications when nothing is queued)
+                for s3_key in self.find_new_files(wait=not self.pending_files):
+                    if s3_key not in self.pending_files:
+                        self.pending_files.append(s3_key)
                 
-                for s3_key in new_files:
-                    # Process transaction chunk
-                    self.process_transaction_chunk(s3_key)
-                    self.processed_files.add(s3_key)
+                if self.pending_files:
+                    # Ingest every queued chunk within the budget in one transaction
+                    batch = self.next_ingest_batch()
+                    with profiling.stage('y_ingest'):
+                        self.process_transaction_batch(batch)
+                    self.processed_files.update(batch)
+                    del self.pending_files[:len(batch)]
                     
-                    # Detect patterns
-                    self.detect_all_patterns()
-                    
-                    # Upload detections
-                    self.upload_detection_batches()
+                    # Detect once per batch when caught up, otherwise at least
+                    # every DETECTION_MAX_INTERVAL while the backlog drains
+                    if (not self.pending_files or
+                            time.monotonic() - self.last_detection >= config.DETECTION_MAX_INTERVAL):
+                        with profiling.stage('y_detect'):
+                            self.detect_all_patterns()
+                        self.last_detection = time.monotonic()
+                        
+                        # Upload detections
+                        with profiling.stage('y_upload'):
+                            self.upload_detection_batches()
                 
-                # Wait before checking again
-                time.sleep(config.PROCESSING_INTERVAL)
+                # Wait before checking again (notifications block instead)
+                if self.listen_conn is None and not self.pending_files:
+                    time.sleep(config.PROCESSING_INTERVAL)
                 
             except KeyboardInterrupt:
                 print("\nMechanism Y stopped by user")
                 break
+            except resilience.CircuitOpenError as e:
+                # Dependency is down: wait for the breaker's trial call, no traceback spam
+                print(f"Mechanism Y waiting: {e}")
+                time.sleep(max(e.retry_after, 0.1))
             except Exception as e:
                 print(f"Error in Mechanism Y: {e}")
                 import traceback
                 traceback.print_exc()
+                self.stop_listening()
                 time.sleep(config.PROCESSING_INTERVAL)
-                
-            except KeyboardInterrupt:
-                print("\nMechanism X stopped by user")
-                break
-            except Exception as e:
-                print(f"Error in Mechanism X: {e}")
-                time.sleep(config.PROCESSING_INTERVAL)
-
-def get_customer_importance_file_id(service):
-    """Get the file ID for CustomerImportance.csv"""
-    files = list_files_in_folder(service, config.GDRIVE_FOLDER_ID)
-    
-    for file in files:
-        if file['name'].lower() == 'customerimportance.csv':
-            return file['id']
-    
-    return None
-    print("Database initialized successfully")
-
-def insert_transactions(transactions_data):
-    """Insert transaction data into database"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    query = """
-        INSERT INTO transactions 
-        (transaction_id, customer_id, customer_name, gender, merchant_id, 
-        transaction_type, transaction_amount, transaction_date)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (transaction_id) DO NOTHING;
-    """
-    
-    execute_batch(cur, query, transactions_data)
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def insert_customer_importance(importance_data):
-    """Insert customer importance data into database"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    query = """
-        INSERT INTO customer_importance 
-        (customer_id, transaction_type, weightage)
-        VALUES (%s, %s, %s)
-        ON CONFLICT (customer_id, transaction_type) 
-        DO UPDATE SET weightage = EXCLUDED.weightage;
-    """
-    
-    execute_batch(cur, query, importance_data)
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def get_last_processed_row():
-    """Get the last processed row number"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT last_processed_row FROM processing_state ORDER BY id DESC LIMIT 1")
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
-    return result[0] if result else 0
-
-def update_last_processed_row(row_number):
-    """Update the last processed row number"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE processing_state 
-        SET last_processed_row = %s, updated_at = CURRENT_TIMESTAMP 
-        WHERE id = (SELECT id FROM processing_state ORDER BY id DESC LIMIT 1)
-    """, (row_number,))
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def insert_detection(detection_data):
-    """Insert detection data into database"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    query = """
-        INSERT INTO detections 
-        (y_start_time, detection_time, pattern_id, action_type, customer_name, merchant_id)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """
-    
-    cur.execute(query, detection_data)
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def get_unuploaded_detections(limit=50):
-    """Get detections that haven't been uploaded to S3"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT id, y_start_time, detection_time, pattern_id, 
-            action_type, customer_name, merchant_id
-        FROM detections
-        WHERE uploaded_to_s3 = FALSE
-        ORDER BY created_at
-        LIMIT %s
-    """, (limit,))
-    
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
-    return results
-
-def mark_detections_uploaded(detection_ids):
-    """Mark detections as uploaded to S3"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        UPDATE detections 
-        SET uploaded_to_s3 = TRUE 
-        WHERE id = ANY(%s)
-    """, (detection_ids,))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
\ No newline at end of file
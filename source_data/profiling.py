@@ -0,0 +1,181 @@
+# profiling.py
+"""
+Opt-in profiling for the X and Y chunk cycle.
+
+Stage profiling wraps a named stage (see PROFILE_STAGES) with cProfile and
+tracemalloc on every PROFILE_EVERY_N-th run and writes, per profiled run:
+    <stage>_<run>_<time>.prof   cProfile stats (snakeviz, pstats, gprof2dot)
+    <stage>_<run>_<time>.txt    top allocation growth during the stage
+The sampler is a background thread that snapshots every thread's stack each
+PROFILE_SAMPLE_INTERVAL seconds and writes collapsed stacks
+(sampler_<time>.folded) for flamegraph.pl, inferno or speedscope.
+
+Both can be switched at runtime: SIGUSR1 toggles stage profiling and SIGUSR2
+toggles the sampler (kill -USR1 <pid>).
+"""
+import atexit
+import cProfile
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+import config
+
+class StageProfiler:
+    """cProfile + tracemalloc around selected stages, one stage at a time"""
+
+    def __init__(self):
+        self.enabled = config.PROFILE_ENABLED
+        self.stages = {s.strip() for s in config.PROFILE_STAGES.split(',') if s.strip()}
+        self.every_n = max(1, config.PROFILE_EVERY_N)
+        self.run_counts = Counter()
+        # cProfile can only trace one stage at a time; overlapping stages are skipped
+        self.lock = threading.Lock()
+
+    def wants(self, name):
+        """Count a run of the stage and decide whether to profile it"""
+        if not self.enabled:
+            return False
+        if self.stages and 'all' not in self.stages and name not in self.stages:
+            return False
+        self.run_counts[name] += 1
+        return (self.run_counts[name] - 1) % self.every_n == 0
+
+    @contextmanager
+    def stage(self, name):
+        if not self.wants(name) or not self.lock.acquire(blocking=False):
+            yield
+            return
+
+        try:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            profile = cProfile.Profile()
+            started = time.time()
+
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                elapsed = time.time() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                after = tracemalloc.take_snapshot()
+                if started_tracing:
+                    tracemalloc.stop()
+                self.dump(name, profile, before, after, elapsed, peak)
+        finally:
+            self.lock.release()
+
+    def dump(self, name, profile, before, after, elapsed, peak):
+        """Write the .prof and allocation report for one profiled run"""
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        base = os.path.join(
+            config.PROFILE_DIR,
+            f"{name}_{self.run_counts[name]:06d}_{time.strftime('%Y%m%d_%H%M%S')}"
+        )
+        profile.dump_stats(base + '.prof')
+
+        # Tracing is process wide, so allocations by other threads show up too
+        top = after.compare_to(before, 'lineno')[:config.PROFILE_TOP_N]
+        with open(base + '.txt', 'w') as f:
+            f.write(f"stage {name} run {self.run_counts[name]} took {elapsed:.3f}s, "
+                    f"peak traced memory {peak / 1024 / 1024:.1f} MB\n")
+            f.write(f"top {len(top)} allocation changes by line:\n")
+            for stat in top:
+                f.write(f"{stat}\n")
+
+class StackSampler:
+    """Low-overhead statistical profiler: periodic stack snapshots of all threads"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.stacks = Counter()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="StackSampler", daemon=True)
+        self.thread.start()
+        print(f"Stack sampler started ({self.interval * 1000:.0f}ms interval)")
+
+    def stop(self):
+        """Stop sampling and write the collapsed stacks, returns the file path"""
+        if not self.running:
+            return None
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        return self.dump()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self):
+        """Write samples in collapsed-stack format ('a;b;c count' per line)"""
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(config.PROFILE_DIR, f"sampler_{time.strftime('%Y%m%d_%H%M%S')}.folded")
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Stack sampler wrote {sum(self.stacks.values())} samples to {path}")
+        return path
+
+profiler = StageProfiler()
+sampler = StackSampler(config.PROFILE_SAMPLE_INTERVAL or 0.01)
+
+def stage(name):
+    """Context manager profiling one run of a named stage, if selected"""
+    return profiler.stage(name)
+
+def toggle_stage_profiling(signum=None, frame=None):
+    profiler.enabled = not profiler.enabled
+    print(f"Stage profiling {'enabled' if profiler.enabled else 'disabled'} "
+          f"(output in {config.PROFILE_DIR})")
+
+def toggle_sampler(signum=None, frame=None):
+    if sampler.running:
+        # Write from a helper thread: joining the sampler inside a signal handler could block
+        threading.Thread(target=sampler.stop, name="StackSamplerDump").start()
+    else:
+        sampler.start()
+
+def install():
+    """Register the runtime toggles and start the sampler if configured (main thread only)"""
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, toggle_stage_profiling)
+        signal.signal(signal.SIGUSR2, toggle_sampler)
+
+    # Samples collected so far are written on normal exit
+    atexit.register(sampler.stop)
+
+    if config.PROFILE_SAMPLE_INTERVAL > 0:
+        sampler.start()
@@ -0,0 +1,186 @@
+# resilience.py
+"""
+Retries and circuit breaking for calls to S3, Postgres and Google Drive.
+
+@retry('s3') / @retry('postgres') / @retry('gdrive') retries a call on transient errors
+(connection failures, throttling, 5xx, serialization failures) with jittered
+exponential backoff, until RETRY_ATTEMPTS or RETRY_DEADLINE is reached.
+Only operations that are safe to repeat are retried; idempotent=False keeps
+the circuit breaker but never retries. Calls to the same dependency nested
+inside a retried call run once, so retries never multiply.
+
+Each dependency has a circuit breaker: after BREAKER_FAILURE_THRESHOLD
+consecutive transient failures it opens and calls fail fast with
+CircuitOpenError for BREAKER_RESET_TIMEOUT seconds, then one trial call is let
+through (half-open) and its outcome closes or re-opens the circuit.
+"""
+import functools
+import random
+import threading
+import time
+import config
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or config.BREAKER_RESET_TIMEOUT
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self.lock:
+            if self.state == OPEN:
+                if self.retry_after() > 0:
+                    raise CircuitOpenError(self.name, self.retry_after())
+                self.state = HALF_OPEN
+                self.trial_running = False
+            if self.state == HALF_OPEN:
+                # One trial call at a time, everyone else keeps failing fast
+                if self.trial_running:
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                print(f"Circuit {self.name}: closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"Circuit {self.name}: open after {self.failures} failures, "
+                          f"retrying in {self.reset_timeout:g}s")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def status(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'retry_after': round(self.retry_after(), 1) if self.state == OPEN else 0,
+        }
+
+def _s3_transient(error):
+    from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+    if isinstance(error, (ConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code', '')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return status >= 500 or code in ('SlowDown', 'Throttling', 'ThrottlingException',
+                                         'RequestTimeout', 'RequestTimeTooSkewed')
+    return False
+
+def _postgres_transient(error):
+    import psycopg2
+
+    # Connection loss, server shutdown, too many connections, deadlocks and
+    # serialization failures are all OperationalError subclasses
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+def _gdrive_transient(error):
+    import httplib2
+    from googleapiclient.errors import HttpError
+
+    if isinstance(error, HttpError):
+        return error.resp.status >= 500 or error.resp.status == 429
+    # Connection resets, timeouts, TLS errors and short range reads
+    return isinstance(error, (OSError, httplib2.HttpLib2Error))
+
+TRANSIENT = {
+    's3': _s3_transient,
+    'postgres': _postgres_transient,
+    'gdrive': _gdrive_transient,
+}
+
+breakers = {name: CircuitBreaker(name) for name in TRANSIENT}
+
+_local = threading.local()
+
+def status():
+    """Circuit state per dependency, e.g. {'s3': {'state': 'closed', ...}}"""
+    return {name: breaker.status() for name, breaker in breakers.items()}
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given (0-based) retry"""
+    return random.uniform(0, min(config.RETRY_MAX_DELAY, config.RETRY_BASE_DELAY * 2 ** attempt))
+
+def call(dependency, fn, idempotent=True):
+    """Run fn() through the dependency's circuit breaker, retrying transient errors"""
+    active = _local.__dict__.setdefault('active', set())
+    if dependency in active:
+        # Already inside a retried call: the outer call owns retries and the breaker
+        return fn()
+
+    breaker = breakers[dependency]
+    is_transient = TRANSIENT[dependency]
+    attempts = config.RETRY_ATTEMPTS if idempotent else 1
+    deadline = time.monotonic() + config.RETRY_DEADLINE
+
+    attempt = 0
+    while True:
+        breaker.before_call()
+        if idempotent:
+            # Not-retried calls leave nested calls (e.g. the connect) their own retries
+            active.add(dependency)
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_transient(e):
+                # The dependency answered (missing key, constraint violation...)
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+
+            attempt += 1
+            delay = backoff_delay(attempt - 1)
+            if attempt >= attempts or time.monotonic() + delay > deadline:
+                raise
+            print(f"Transient {dependency} error ({type(e).__name__}: {e}), "
+                  f"retry {attempt}/{attempts - 1} in {delay:.2f}s")
+            time.sleep(delay)
+        except BaseException:
+            # Interrupted (Ctrl-C): no verdict on the dependency, free the trial slot
+            breaker.trial_running = False
+            raise
+        else:
+            breaker.record_success()
+            return result
+        finally:
+            active.discard(dependency)
+
+def retry(dependency, idempotent=True):
+    """Decorator form of call()"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return call(dependency, lambda: fn(*args, **kwargs), idempotent)
+        return wrapper
+    return decorator
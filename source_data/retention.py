@@ -0,0 +1,342 @@
+# retention.py
+"""
+Transaction retention: rows older than RETENTION_HORIZON_HOURS (by processed_at)
+are archived to date-partitioned Parquet files, folded into transaction_aggregates
+and deleted from the hot transactions table in small batches.
+
+The detectors read the transaction_facts view (hot rows UNION ALL aggregates), so
+detection results are the same as without retention. Archived transaction_ids are
+kept in a narrow table for RETENTION_DEDUP_HOURS so re-delivered chunks are still
+deduplicated; older ids are pruned so the table stays bounded too (chunks already
+recorded in ingested_chunks are never re-delivered by Y).
+"""
+import hashlib
+import io
+import os
+import time
+from collections import defaultdict
+import database
+import config
+
+AGGREGATE_KEY = ('customer_id', 'customer_name', 'gender', 'merchant_id', 'transaction_type')
+
+ARCHIVE_COLUMNS = ('transaction_id', 'customer_id', 'customer_name', 'gender', 'merchant_id',
+                   'transaction_type', 'transaction_amount', 'transaction_date', 'processed_at')
+
+def create_tables(cur):
+    """Create the aggregate and archived-id tables and the transaction_facts view"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS transaction_aggregates (
+            customer_id VARCHAR(100),
+            customer_name VARCHAR(200),
+            gender VARCHAR(10),
+            merchant_id VARCHAR(100),
+            transaction_type VARCHAR(50),
+            transaction_count BIGINT NOT NULL,
+            amount_sum DECIMAL(20, 2) NOT NULL,
+            PRIMARY KEY (customer_id, customer_name, gender, merchant_id, transaction_type)
+        );
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS archived_transaction_ids (
+            transaction_id VARCHAR(100) PRIMARY KEY,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    # Tables created before pruning existed start their dedup horizon now
+    cur.execute("""
+        ALTER TABLE archived_transaction_ids
+        ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_archived_transaction_ids_archived_at
+        ON archived_transaction_ids(archived_at);
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_processed_at
+        ON transactions(processed_at);
+    """)
+
+    # Every transaction exactly once: hot rows individually, archived rows aggregated
+    cur.execute("""
+        CREATE OR REPLACE VIEW transaction_facts AS
+        SELECT customer_id, customer_name, gender, merchant_id, transaction_type,
+               1::BIGINT AS transaction_count, transaction_amount AS amount_sum
+        FROM transactions
+        UNION ALL
+        SELECT customer_id, customer_name, gender, merchant_id, transaction_type,
+               transaction_count, amount_sum
+        FROM transaction_aggregates;
+    """)
+
+def _archive_batch(rows):
+    """Write one batch of rows as Parquet, one file per transaction_date partition"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    partitions = defaultdict(list)
+    for row in rows:
+        transaction_date = row[7]
+        partitions[transaction_date.strftime('%Y-%m-%d') if transaction_date else 'unknown'].append(row)
+
+    written = []
+    for date, partition_rows in sorted(partitions.items()):
+        columns = list(zip(*partition_rows))
+        table = pa.table({
+            name: pa.array([float(v) if name == 'transaction_amount' and v is not None else v
+                            for v in values])
+            for name, values in zip(ARCHIVE_COLUMNS, columns)
+        })
+
+        # Same rows give the same file name, so a retried batch overwrites its file
+        ids = sorted(row[0] for row in partition_rows)
+        batch_id = hashlib.md5('\n'.join(ids).encode('utf-8')).hexdigest()[:16]
+        relative_path = f"date={date}/part-{batch_id}.parquet"
+
+        if config.ARCHIVE_S3_PREFIX:
+            import s3_handler
+            buffer = io.BytesIO()
+            pq.write_table(table, buffer, compression='zstd')
+            key = f"{config.ARCHIVE_S3_PREFIX}{relative_path}"
+            s3_handler.get_s3_client().put_object(
+                Bucket=config.S3_BUCKET, Key=key, Body=buffer.getvalue()
+            )
+            written.append(key)
+        else:
+            path = os.path.join(config.ARCHIVE_PATH, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pq.write_table(table, path + '.tmp', compression='zstd')
+            os.replace(path + '.tmp', path)
+            written.append(path)
+
+    return written
+
+def retain_batch(horizon_hours, batch_size):
+    """
+    Archive, fold and delete up to batch_size rows older than the horizon.
+    Returns the number of rows moved out of the hot table.
+    """
+    conn = database.get_db_connection()
+    cur = conn.cursor()
+
+    # Cutoff on the database clock, the same one that set processed_at.
+    # Row locks only: ingest keeps inserting while old rows are moved out
+    cur.execute(f"""
+        SELECT {', '.join(ARCHIVE_COLUMNS)}
+        FROM transactions
+        WHERE processed_at < LOCALTIMESTAMP - %s * INTERVAL '1 hour'
+        ORDER BY processed_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    """, (horizon_hours, batch_size))
+    rows = cur.fetchall()
+
+    if not rows:
+        conn.rollback()
+        cur.close()
+        conn.close()
+        return 0
+
+    # Archive first: if the fold below fails the rows stay hot and the
+    # retried batch overwrites the same files
+    _archive_batch(rows)
+
+    ids = [row[0] for row in rows]
+    cur.execute(f"""
+        INSERT INTO transaction_aggregates
+        ({', '.join(AGGREGATE_KEY)}, transaction_count, amount_sum)
+        SELECT {', '.join(AGGREGATE_KEY)}, COUNT(*), SUM(transaction_amount)
+        FROM transactions
+        WHERE transaction_id = ANY(%s)
+        GROUP BY {', '.join(AGGREGATE_KEY)}
+        ON CONFLICT ({', '.join(AGGREGATE_KEY)})
+        DO UPDATE SET
+            transaction_count = transaction_aggregates.transaction_count + EXCLUDED.transaction_count,
+            amount_sum = transaction_aggregates.amount_sum + EXCLUDED.amount_sum
+    """, (ids,))
+
+    cur.execute("""
+        INSERT INTO archived_transaction_ids (transaction_id)
+        SELECT unnest(%s::text[])
+        ON CONFLICT (transaction_id) DO NOTHING
+    """, (ids,))
+
+    cur.execute("DELETE FROM transactions WHERE transaction_id = ANY(%s)", (ids,))
+
+    conn.commit()
+    cur.close()
+    conn.close()
+    return len(rows)
+
+def prune_archived_ids(dedup_hours, batch_size):
+    """
+    Delete up to batch_size archived ids older than the dedup horizon.
+    Returns the number of ids deleted.
+    """
+    conn = database.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        DELETE FROM archived_transaction_ids
+        WHERE transaction_id IN (
+            SELECT transaction_id FROM archived_transaction_ids
+            WHERE archived_at < LOCALTIMESTAMP - %s * INTERVAL '1 hour'
+            LIMIT %s
+        )
+    """, (dedup_hours, batch_size))
+    deleted = cur.rowcount
+    conn.commit()
+    cur.close()
+    conn.close()
+    return deleted
+
+def run_retention(horizon_hours=None, batch_size=None):
+    """Move every row older than the horizon out of the hot table, batch by batch"""
+    horizon_hours = config.RETENTION_HORIZON_HOURS if horizon_hours is None else horizon_hours
+    batch_size = batch_size or config.RETENTION_BATCH_SIZE
+
+    total = 0
+    while True:
+        moved = retain_batch(horizon_hours, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+
+    pruned = 0
+    while True:
+        deleted = prune_archived_ids(config.RETENTION_DEDUP_HOURS, batch_size)
+        pruned += deleted
+        if deleted < batch_size:
+            break
+
+    if total:
+        print(f"Retention: archived {total} transactions older than {horizon_hours}h")
+    if pruned:
+        print(f"Retention: pruned {pruned} archived ids older than {config.RETENTION_DEDUP_HOURS}h")
+    return total
+
+def run_forever():
+    """Periodic retention loop"""
+    if config.SCHEMA_MODE == 'compact':
+        print("Retention only supports the legacy schema, not starting")
+        return
+
+    print("Starting retention...")
+    while True:
+        try:
+            run_retention()
+            time.sleep(config.RETENTION_INTERVAL)
+        except KeyboardInterrupt:
+            print("\nRetention stopped by user")
+            break
+        except Exception as e:
+            print(f"Error in retention: {e}")
+            time.sleep(config.RETENTION_INTERVAL)
+
+# Detection queries over transaction_facts (hot rows + archived aggregates)
+
+PATTERN_1_QUERY = """
+WITH merchant_stats AS (
+    SELECT
+        merchant_id,
+        SUM(transaction_count) as total_transactions
+    FROM transaction_facts
+    GROUP BY merchant_id
+    HAVING SUM(transaction_count) > 50000
+),
+customer_merchant_stats AS (
+    SELECT
+        t.customer_id,
+        t.customer_name,
+        t.merchant_id,
+        t.transaction_type,
+        SUM(t.transaction_count) as transaction_count,
+        COALESCE(ci.weightage, 0) as weightage
+    FROM transaction_facts t
+    LEFT JOIN customer_importance ci
+        ON t.customer_id = ci.customer_id
+        AND t.transaction_type = ci.transaction_type
+    WHERE t.merchant_id IN (SELECT merchant_id FROM merchant_stats)
+    GROUP BY t.customer_id, t.customer_name, t.merchant_id,
+             t.transaction_type, ci.weightage
+),
+customer_avg_weight AS (
+    SELECT
+        customer_id,
+        customer_name,
+        merchant_id,
+        SUM(transaction_count) as total_transactions,
+        AVG(weightage) as avg_weightage
+    FROM customer_merchant_stats
+    GROUP BY customer_id, customer_name, merchant_id
+),
+merchant_percentiles AS (
+    SELECT
+        merchant_id,
+        PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY total_transactions) as tx_90th,
+        PERCENTILE_CONT(0.1) WITHIN GROUP (ORDER BY avg_weightage) as weight_10th
+    FROM customer_avg_weight
+    GROUP BY merchant_id
+)
+SELECT DISTINCT
+    caw.customer_name,
+    caw.merchant_id
+FROM customer_avg_weight caw
+JOIN merchant_percentiles mp ON caw.merchant_id = mp.merchant_id
+WHERE caw.total_transactions >= mp.tx_90th
+  AND caw.avg_weightage <= mp.weight_10th
+  AND NOT EXISTS (
+      SELECT 1 FROM detections d
+      WHERE d.pattern_id = 'PatId1'
+        AND d.customer_name = caw.customer_name
+        AND d.merchant_id = caw.merchant_id
+  )
+"""
+
+# AVG(amount) < 23 written as SUM(amount) < 23 * COUNT so it stays exact
+PATTERN_2_QUERY = """
+SELECT
+    t.customer_name,
+    t.merchant_id,
+    SUM(t.amount_sum) / SUM(t.transaction_count) as avg_amount,
+    SUM(t.transaction_count) as transaction_count
+FROM transaction_facts t
+GROUP BY t.customer_name, t.merchant_id
+HAVING SUM(t.transaction_count) >= 80
+  AND SUM(t.amount_sum) < 23 * SUM(t.transaction_count)
+  AND NOT EXISTS (
+      SELECT 1 FROM detections d
+      WHERE d.pattern_id = 'PatId2'
+        AND d.customer_name = t.customer_name
+        AND d.merchant_id = t.merchant_id
+  )
+"""
+
+PATTERN_3_QUERY = """
+WITH gender_counts AS (
+    SELECT
+        merchant_id,
+        SUM(CASE WHEN UPPER(gender) = 'FEMALE' THEN 1 ELSE 0 END) as female_count,
+        SUM(CASE WHEN UPPER(gender) = 'MALE' THEN 1 ELSE 0 END) as male_count
+    FROM (
+        SELECT DISTINCT merchant_id, customer_id, gender
+        FROM transaction_facts
+    ) unique_customers
+    GROUP BY merchant_id
+)
+SELECT merchant_id
+FROM gender_counts
+WHERE female_count > 100
+  AND male_count > female_count
+  AND NOT EXISTS (
+      SELECT 1 FROM detections d
+      WHERE d.pattern_id = 'PatId3'
+        AND d.merchant_id = gender_counts.merchant_id
+  )
+"""
+
+if __name__ == "__main__":
+    run_forever()
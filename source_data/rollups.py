@@ -0,0 +1,164 @@
+# rollups.py
+"""
+Analytics rollups behind the analyst queries in query_examples.sql:
+    merchant_daily_rollup       per merchant and transaction day
+    customer_merchant_rollup    per customer, name, gender and merchant
+    detection_hourly_rollup     per detection hour, pattern and action
+They are updated from each inserted batch (only rows that were actually new)
+and each detection batch, in the same transaction as the insert, so analyst
+queries never scan the transactions or detections tables.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from psycopg2.extras import execute_values
+import compact_schema
+
+TABLES = ('merchant_daily_rollup', 'customer_merchant_rollup', 'detection_hourly_rollup')
+
+def create_tables(cur):
+    """Create the rollup tables, returns True if they did not exist yet"""
+    cur.execute("SELECT to_regclass('merchant_daily_rollup') IS NULL")
+    created = cur.fetchone()[0]
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS merchant_daily_rollup (
+            merchant_id VARCHAR(100),
+            day DATE,
+            transaction_count BIGINT NOT NULL,
+            amount_sum DECIMAL(20, 2) NOT NULL,
+            PRIMARY KEY (merchant_id, day)
+        );
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS customer_merchant_rollup (
+            merchant_id VARCHAR(100),
+            customer_id VARCHAR(100),
+            customer_name VARCHAR(200),
+            gender VARCHAR(10),
+            transaction_count BIGINT NOT NULL,
+            amount_sum DECIMAL(20, 2) NOT NULL,
+            amount_min DECIMAL(15, 2),
+            amount_max DECIMAL(15, 2),
+            PRIMARY KEY (merchant_id, customer_id, customer_name, gender)
+        );
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS detection_hourly_rollup (
+            hour TIMESTAMP,
+            pattern_id VARCHAR(20),
+            action_type VARCHAR(50),
+            detection_count BIGINT NOT NULL,
+            PRIMARY KEY (hour, pattern_id, action_type)
+        );
+    """)
+    return created
+
+def _cents_to_amount(cents):
+    return Decimal(cents) / 100
+
+def apply_transactions(cur, transactions_data, inserted_ids):
+    """
+    Fold newly inserted transaction tuples (database.insert_transactions layout)
+    into the rollups within the caller's transaction. Rows whose id is not in
+    inserted_ids were duplicates and are ignored; an id repeated within the
+    batch was inserted once and is folded in once.
+    """
+    pending_ids = set(inserted_ids)
+    merchant_days = defaultdict(lambda: [0, 0])
+    customers = defaultdict(lambda: [0, 0, None, None])
+
+    for (transaction_id, customer_id, customer_name, gender, merchant_id,
+         _, amount, transaction_date) in transactions_data:
+        if transaction_id not in pending_ids:
+            continue
+        pending_ids.discard(transaction_id)
+        # Integer cents, rounded the same way as DECIMAL(15, 2)
+        cents = compact_schema.to_cents(amount)
+
+        totals = merchant_days[(merchant_id, transaction_date.date())]
+        totals[0] += 1
+        totals[1] += cents
+
+        totals = customers[(merchant_id, customer_id, customer_name, gender)]
+        totals[0] += 1
+        totals[1] += cents
+        totals[2] = cents if totals[2] is None else min(totals[2], cents)
+        totals[3] = cents if totals[3] is None else max(totals[3], cents)
+
+    if not merchant_days:
+        return
+
+    # Sorted so concurrent writers lock rollup rows in the same order
+    execute_values(cur, """
+        INSERT INTO merchant_daily_rollup (merchant_id, day, transaction_count, amount_sum)
+        VALUES %s
+        ON CONFLICT (merchant_id, day)
+        DO UPDATE SET transaction_count = merchant_daily_rollup.transaction_count + EXCLUDED.transaction_count,
+                      amount_sum = merchant_daily_rollup.amount_sum + EXCLUDED.amount_sum
+    """, sorted((merchant_id, day, count, _cents_to_amount(cents))
+                for (merchant_id, day), (count, cents) in merchant_days.items()))
+
+    execute_values(cur, """
+        INSERT INTO customer_merchant_rollup
+        (merchant_id, customer_id, customer_name, gender,
+        transaction_count, amount_sum, amount_min, amount_max)
+        VALUES %s
+        ON CONFLICT (merchant_id, customer_id, customer_name, gender)
+        DO UPDATE SET transaction_count = customer_merchant_rollup.transaction_count + EXCLUDED.transaction_count,
+                      amount_sum = customer_merchant_rollup.amount_sum + EXCLUDED.amount_sum,
+                      amount_min = LEAST(customer_merchant_rollup.amount_min, EXCLUDED.amount_min),
+                      amount_max = GREATEST(customer_merchant_rollup.amount_max, EXCLUDED.amount_max)
+    """, sorted(key + (count, _cents_to_amount(cents), _cents_to_amount(low), _cents_to_amount(high))
+                for key, (count, cents, low, high) in customers.items()))
+
+def apply_detections(cur, detections):
+    """Count a batch of detection tuples per hour within the caller's transaction"""
+    hours = defaultdict(int)
+    for _, detection_time, pattern_id, action_type, _, _ in detections:
+        hours[(detection_time.replace(minute=0, second=0, microsecond=0), pattern_id, action_type)] += 1
+
+    if not hours:
+        return
+
+    execute_values(cur, """
+        INSERT INTO detection_hourly_rollup (hour, pattern_id, action_type, detection_count)
+        VALUES %s
+        ON CONFLICT (hour, pattern_id, action_type)
+        DO UPDATE SET detection_count = detection_hourly_rollup.detection_count + EXCLUDED.detection_count
+    """, sorted((hour, pattern_id, action_type, count)
+                for (hour, pattern_id, action_type), count in hours.items()))
+
+def rebuild(cur, source):
+    """
+    Recompute all rollups from the base tables (one-off full scan). source is
+    the transactions relation with the legacy column layout; under retention
+    only the rows still in it are counted.
+    """
+    for table in TABLES:
+        cur.execute(f"DELETE FROM {table}")
+
+    cur.execute(f"""
+        INSERT INTO merchant_daily_rollup (merchant_id, day, transaction_count, amount_sum)
+        SELECT merchant_id, transaction_date::DATE, COUNT(*), SUM(transaction_amount)
+        FROM {source}
+        GROUP BY merchant_id, transaction_date::DATE
+    """)
+
+    cur.execute(f"""
+        INSERT INTO customer_merchant_rollup
+        (merchant_id, customer_id, customer_name, gender,
+        transaction_count, amount_sum, amount_min, amount_max)
+        SELECT merchant_id, customer_id, customer_name, gender,
+               COUNT(*), SUM(transaction_amount), MIN(transaction_amount), MAX(transaction_amount)
+        FROM {source}
+        GROUP BY merchant_id, customer_id, customer_name, gender
+    """)
+
+    cur.execute("""
+        INSERT INTO detection_hourly_rollup (hour, pattern_id, action_type, detection_count)
+        SELECT DATE_TRUNC('hour', detection_time), pattern_id, action_type, COUNT(*)
+        FROM detections
+        GROUP BY DATE_TRUNC('hour', detection_time), pattern_id, action_type
+    """)
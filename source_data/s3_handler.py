@@ -1,53 +1,253 @@
 # s3_handler.py
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 import json
 import csv
+import gzip
+import hashlib
+import pandas as pd
 import io
-from datetime import datetime
 import config
+import resilience
+import storage
 
 def get_s3_client():
-    """Create and return S3 client"""
+    """Create and return S3 client (a storage.LocalObjectStore with STORAGE_BACKEND=local)"""
+    if config.STORAGE_BACKEND == 'local':
+        return storage.LocalObjectStore(config.LOCAL_STORAGE_PATH)
     return boto3.client(
         's3',
         aws_access_key_id=config.AWS_ACCESS_KEY,
         aws_secret_access_key=config.AWS_SECRET_KEY,
-        region_name=config.AWS_REGION
+        region_name=config.AWS_REGION,
+        # resilience.py owns retries; timeouts bound each attempt
+        config=Config(
+            connect_timeout=config.S3_CONNECT_TIMEOUT,
+            read_timeout=config.S3_READ_TIMEOUT,
+            retries={'total_max_attempts': 1}
+        )
     )
 
-def upload_transactions_to_s3(transactions_df, chunk_number):
-    """Upload transaction chunk to S3"""
-    s3_client = get_s3_client()
+class S3StreamWriter(io.RawIOBase):
+    """
+    Writable binary stream feeding an S3 object through a bounded buffer.
+    Objects smaller than one part go up with a single PUT; larger ones are
+    sent as a multipart upload, one part per S3_PART_SIZE bytes, so peak
+    memory stays around one part regardless of object size.
+    Tracks the MD5 checksum and size of the bytes sent, and optionally copies
+    them to a second binary file (copy_to).
+    """
     
-    # Convert DataFrame to CSV
-    csv_buffer = io.StringIO()
-    transactions_df.to_csv(csv_buffer, index=False)
+    def __init__(self, s3_client, key, content_type='text/csv', content_encoding=None,
+                 part_size=None, copy_to=None):
+        super().__init__()
+        self.s3_client = s3_client
+        self.key = key
+        self.part_size = part_size or config.S3_PART_SIZE
+        self.object_args = {'ContentType': content_type}
+        if content_encoding:
+            self.object_args['ContentEncoding'] = content_encoding
+        self.buffer = bytearray()
+        self.md5 = hashlib.md5()
+        self.byte_size = 0
+        self.upload_id = None
+        self.parts = []
+        self.copy_to = copy_to
     
-    # Generate unique filename
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"{config.S3_INPUT_PREFIX}chunk_{chunk_number}_{timestamp}.csv"
+    def writable(self):
+        return True
     
-    # Upload to S3
-    s3_client.put_object(
-        Bucket=config.S3_BUCKET,
-        Key=filename,
-        Body=csv_buffer.getvalue()
-    )
+    def write(self, data):
+        self.buffer += data
+        self.md5.update(data)
+        self.byte_size += len(data)
+        if self.copy_to is not None:
+            self.copy_to.write(data)
+        
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        
+        return len(data)
+    
+    def _upload_part(self, data):
+        """Send one multipart part, starting the upload on the first call"""
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=config.S3_BUCKET, Key=self.key, **self.object_args
+            )
+            self.upload_id = response['UploadId']
+        
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=config.S3_BUCKET,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+    
+    @property
+    def checksum(self):
+        return self.md5.hexdigest()
+    
+    def close(self):
+        """Flush the remaining buffer and complete the upload"""
+        if self.closed:
+            return
+        
+        if self.upload_id is None:
+            # Small object: one PUT, checksum can go in the metadata
+            self.s3_client.put_object(
+                Bucket=config.S3_BUCKET,
+                Key=self.key,
+                Body=bytes(self.buffer),
+                Metadata={'checksum': self.checksum},
+                **self.object_args
+            )
+        else:
+            if self.buffer:
+                self._upload_part(bytes(self.buffer))
+            self.s3_client.complete_multipart_upload(
+                Bucket=config.S3_BUCKET,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+        
+        self.buffer = bytearray()
+        super().close()
+    
+    def abort(self):
+        """Abandon the upload without creating the object"""
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=config.S3_BUCKET, Key=self.key, UploadId=self.upload_id
+            )
+        self.buffer = bytearray()
+        super().close()
     
-    print(f"Uploaded chunk {chunk_number} to S3: {filename}")
-    return filename
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
 
-def upload_detections_to_s3(detections):
-    """Upload detections to S3"""
-    s3_client = get_s3_client()
+class HashingReader(io.RawIOBase):
+    """Readable stream that computes the MD5 of the bytes read through it"""
     
-    # Convert detections to CSV format
-    csv_buffer = io.StringIO()
-    writer = csv.writer(csv_buffer)
+    def __init__(self, raw):
+        super().__init__()
+        self.raw = raw
+        self.md5 = hashlib.md5()
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        self.md5.update(data)
+        buffer[:len(data)] = data
+        return len(data)
+    
+    def drain(self):
+        """Read (and hash) whatever the consumer left unread"""
+        while data := self.raw.read(1 << 20):
+            self.md5.update(data)
+        return self.md5.hexdigest()
+
+def _compressing_writer(raw, encoding):
+    """Wrap a binary writer with the given Content-Encoding compressor"""
+    if encoding == 'gzip':
+        # mtime=0 keeps re-uploads of the same rows byte-identical (same checksum)
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=config.COMPRESSION_LEVEL,
+                             mtime=0)
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=config.COMPRESSION_LEVEL).stream_writer(
+            raw, closefd=False
+        )
+    return raw
+
+def _decompressing_reader(raw, encoding):
+    """Wrap a binary reader according to the object's Content-Encoding"""
+    if encoding == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    return raw
+
+def stream_text_to_s3(s3_client, key, write_fn, encoding=None, copy_to=None):
+    """
+    Stream text produced by write_fn(text_file) to S3, compressed with the
+    given encoding ('gzip', 'zstd' or None). Returns the S3StreamWriter so
+    callers can read its checksum and byte size.
+    """
+    encoding = encoding if encoding != 'none' else None
+    
+    with S3StreamWriter(s3_client, key, content_encoding=encoding, copy_to=copy_to) as raw:
+        compressed = _compressing_writer(raw, encoding)
+        text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+        write_fn(text)
+        text.flush()
+        text.detach()
+        if compressed is not raw:
+            compressed.close()
+    
+    return raw
+
+def chunk_key(start_row, end_row):
+    """Deterministic, lexicographically ordered key for a source row range"""
+    return f"{config.S3_INPUT_PREFIX}rows_{start_row:012d}_{end_row:012d}.csv"
+
+@resilience.retry('s3')
+def upload_transactions_to_s3(transactions_df, start_row, end_row, s3_client=None,
+                              copy_to=None):
+    """
+    Upload the chunk for source rows [start_row, end_row) to S3 (pass a shared
+    client when uploading from threads). Returns a dict with the chunk key,
+    row range, row count, byte size and MD5 checksum. The uploaded (compressed)
+    bytes are also written to copy_to if given.
+    """
+    s3_client = s3_client or get_s3_client()
+    
+    # Same rows always map to the same key, so re-uploads overwrite
+    filename = chunk_key(start_row, end_row)
+    if copy_to is not None:
+        # A retried upload starts the copy over
+        copy_to.seek(0)
+        copy_to.truncate()
+    
+    # Encode, compress and upload in bounded parts without building the whole CSV string
+    upload = stream_text_to_s3(
+        s3_client, filename,
+        lambda f: transactions_df.to_csv(f, index=False),
+        config.CHUNK_COMPRESSION,
+        copy_to
+    )
+    
+    print(f"Uploaded rows {start_row} to {end_row} to S3: {filename}")
+    return {
+        'key': filename,
+        'start_row': start_row,
+        'end_row': end_row,
+        'row_count': len(transactions_df),
+        'byte_size': upload.byte_size,
+        'checksum': upload.checksum
+    }
+
+DETECTION_COLUMNS = ['YStartTime(IST)', 'DetectionTime(IST)', 'PatternId',
+                     'ActionType', 'CustomerName', 'MerchantId']
+
+def write_detections_csv(detections, file_obj):
+    """Write detection rows (get_unuploaded_detections layout) as CSV"""
+    writer = csv.writer(file_obj)
     
     # Write header
-    writer.writerow(['YStartTime(IST)', 'DetectionTime(IST)', 'PatternId', 
-                    'ActionType', 'CustomerName', 'MerchantId'])
+    writer.writerow(DETECTION_COLUMNS)
     
     # Write data
     for detection in detections:
@@ -65,23 +265,271 @@ def upload_detections_to_s3(detections):
             cust_name or '',
             merchant_id or ''
         ])
+
+def detections_to_parquet(detections):
+    """Encode detection rows (get_unuploaded_detections layout) as Parquet bytes"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
     
-    # Generate unique filename
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-    filename = f"{config.S3_OUTPUT_PREFIX}detections_{timestamp}.csv"
+    columns = list(zip(*detections)) or [()] * 7
+    table = pa.table({
+        DETECTION_COLUMNS[0]: pa.array(columns[1], pa.timestamp('s')),
+        DETECTION_COLUMNS[1]: pa.array(columns[2], pa.timestamp('s')),
+        DETECTION_COLUMNS[2]: pa.array([v or '' for v in columns[3]], pa.string()),
+        DETECTION_COLUMNS[3]: pa.array([v or '' for v in columns[4]], pa.string()),
+        DETECTION_COLUMNS[4]: pa.array([v or '' for v in columns[5]], pa.string()),
+        DETECTION_COLUMNS[5]: pa.array([v or '' for v in columns[6]], pa.string()),
+    })
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression='zstd')
+    return buffer.getvalue()
+
+@resilience.retry('s3')
+def _put_detections(s3_client, key_base, detections):
+    """Write one detection object in DETECTION_OUTPUT_FORMAT, returns (key, byte size)"""
+    if config.DETECTION_OUTPUT_FORMAT == 'parquet':
+        key = f"{key_base}.parquet"
+        data = detections_to_parquet(detections)
+        s3_client.put_object(
+            Bucket=config.S3_BUCKET, Key=key, Body=data,
+            ContentType='application/vnd.apache.parquet'
+        )
+        return key, len(data)
     
-    # Upload to S3
+    key = f"{key_base}.csv"
+    upload = stream_text_to_s3(
+        s3_client, key,
+        lambda f: write_detections_csv(detections, f),
+        config.OUTPUT_COMPRESSION
+    )
+    return key, upload.byte_size
+
+def detection_partition_prefix(pattern_id, date):
+    """Hive-style prefix of one pattern's detections for one day (YYYY-MM-DD)"""
+    return f"{config.S3_OUTPUT_PREFIX}pattern_id={pattern_id}/date={date}/"
+
+def detection_batch_name(detections):
+    """
+    Deterministic object name for a batch, from its detection id range. The
+    earliest Y start time is included since in-memory detector ids restart at
+    1 with every run.
+    """
+    ids = [d[0] for d in detections]
+    starts = [d[1] for d in detections if d[1]]
+    run = min(starts).strftime('%Y%m%d_%H%M%S') if starts else 'unknown'
+    return f"detections_{run}_{min(ids):012d}_{max(ids):012d}"
+
+def upload_detections_to_s3(detections):
+    """
+    Upload detections to S3. With DETECTION_OUTPUT_LAYOUT=partitioned the batch
+    is split by pattern and detection day, each part goes under its partition
+    prefix and is recorded by its own entry under the partition's _manifest/.
+    Object names come from the detection ids, so a batch retried after a
+    partial failure skips the parts already recorded instead of duplicating them.
+    Returns the keys written.
+    """
+    s3_client = get_s3_client()
+    name = detection_batch_name(detections)
+    
+    if config.DETECTION_OUTPUT_LAYOUT != 'partitioned':
+        key, _ = _put_detections(s3_client, f"{config.S3_OUTPUT_PREFIX}{name}", detections)
+        print(f"Uploaded {len(detections)} detections to S3: {key}")
+        return [key]
+    
+    partitions = {}
+    for detection in detections:
+        detect_time = detection[2]
+        date = detect_time.strftime('%Y-%m-%d') if detect_time else 'unknown'
+        partitions.setdefault((detection[3] or 'unknown', date), []).append(detection)
+    
+    keys = []
+    for (pattern_id, date), rows in sorted(partitions.items()):
+        prefix = detection_partition_prefix(pattern_id, date)
+        entry_prefix = f"{prefix}_manifest/{name}."
+        # One entry object per part (never read-modify-write), so concurrent
+        # uploaders cannot lose each other's entries
+        if _list_keys(s3_client, entry_prefix):
+            continue
+        
+        key, byte_size = _put_detections(s3_client, f"{prefix}{name}", rows)
+        
+        # Object first, then its entry: a crash in between leaves an unrecorded
+        # object that readers skip, and the batch is uploaded again
+        detection_times = [d[2] for d in rows if d[2]]
+        _put_json(s3_client, f"{prefix}_manifest/{key[len(prefix):]}.json", {
+            'key': key,
+            'row_count': len(rows),
+            'byte_size': byte_size,
+            'first_detection': min(detection_times).isoformat() if detection_times else None,
+            'last_detection': max(detection_times).isoformat() if detection_times else None,
+        })
+        keys.append(key)
+    
+    print(f"Uploaded {len(detections)} detections to S3: {len(keys)} partition objects")
+    return keys
+
+@resilience.retry('s3')
+def _list_keys(s3_client, prefix):
+    """All object keys under a prefix"""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    return [
+        obj['Key']
+        for page in paginator.paginate(Bucket=config.S3_BUCKET, Prefix=prefix)
+        for obj in page.get('Contents', [])
+    ]
+
+def list_detection_objects(pattern_id, date, s3_client=None):
+    """
+    Keys of one partition's detection objects, from the entries under its
+    _manifest/ (one LIST; an entry is named after its object). Objects recorded
+    in an older _index.json are included; partitions with neither are listed.
+    """
+    s3_client = s3_client or get_s3_client()
+    prefix = detection_partition_prefix(pattern_id, date)
+    manifest_prefix = f"{prefix}_manifest/"
+    
+    keys = [prefix + entry[len(manifest_prefix):-len('.json')]
+            for entry in _list_keys(s3_client, manifest_prefix)]
+    index = _get_json(s3_client, f"{prefix}_index.json")
+    if index is not None:
+        keys.extend(entry['key'] for entry in index['objects'])
+    if keys:
+        return sorted(set(keys))
+    
+    return [key for key in _list_keys(s3_client, prefix) if not key.endswith('_index.json')]
+
+def read_detection_partition(pattern_id, date, s3_client=None):
+    """Read one pattern's detections for one day into a DataFrame"""
+    s3_client = s3_client or get_s3_client()
+    
+    frames = []
+    for key in list_detection_objects(pattern_id, date, s3_client):
+        obj = s3_client.get_object(Bucket=config.S3_BUCKET, Key=key)
+        if key.endswith('.parquet'):
+            frames.append(pd.read_parquet(io.BytesIO(obj['Body'].read())))
+        else:
+            stream = _decompressing_reader(io.BufferedReader(obj['Body']), obj.get('ContentEncoding'))
+            frames.append(pd.read_csv(stream, dtype=str, keep_default_na=False))
+    
+    if not frames:
+        return pd.DataFrame(columns=DETECTION_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+@resilience.retry('s3')
+def _get_json(s3_client, key):
+    """GET a JSON object, None if it does not exist"""
+    try:
+        obj = s3_client.get_object(Bucket=config.S3_BUCKET, Key=key)
+    except storage.NoSuchKey:
+        return None
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+    return json.loads(obj['Body'].read())
+
+@resilience.retry('s3')
+def _put_json(s3_client, key, data):
+    """PUT a JSON object"""
     s3_client.put_object(
         Bucket=config.S3_BUCKET,
-        Key=filename,
-        Body=csv_buffer.getvalue()
+        Key=key,
+        Body=json.dumps(data).encode('utf-8'),
+        ContentType='application/json'
     )
+
+def load_manifest(s3_client=None):
+    """
+    Read the chunk manifest head with a single GET.
+    The head holds recent chunk entries plus the keys of immutable, compacted
+    segments holding older entries.
+    """
+    s3_client = s3_client or get_s3_client()
+    manifest = _get_json(s3_client, f"{config.S3_MANIFEST_PREFIX}manifest.json")
+    return manifest or {'version': 1, 'chunk_count': 0, 'segments': [], 'entries': []}
+
+def load_manifest_segment(segment_key, s3_client=None):
+    """Read the entries of one compacted manifest segment"""
+    s3_client = s3_client or get_s3_client()
+    return _get_json(s3_client, segment_key)['entries']
+
+def append_to_manifest(manifest, chunk_info, s3_client=None):
+    """
+    Record an uploaded chunk in the manifest (single writer: Mechanism X).
+    Entries are kept in row order; a re-uploaded range replaces its entry.
+    Once the head reaches MANIFEST_COMPACT_EVERY entries they are written to
+    an immutable segment first, then the head is rewritten to reference it.
+    A re-upload of a compacted chunk whose entry changed (e.g. a different
+    CHUNK_COMPRESSION) writes the segment again under a new key, so cached
+    segments stay valid and readers pick up the new checksum.
+    """
+    s3_client = s3_client or get_s3_client()
+    entry = {field: chunk_info[field] for field in
+             ('key', 'start_row', 'end_row', 'row_count', 'byte_size', 'checksum')}
     
-    print(f"Uploaded {len(detections)} detections to S3: {filename}")
-    return filename
+    # Segments may interleave, so a covering range only means "maybe present"
+    for segment in manifest['segments']:
+        if not segment['start_row'] <= entry['start_row'] < segment['end_row']:
+            continue
+        segment_entries = load_manifest_segment(segment['key'], s3_client)
+        if not any(e['key'] == entry['key'] for e in segment_entries):
+            continue
+        if entry in segment_entries:
+            return manifest
+        
+        segment_entries = [entry if e['key'] == entry['key'] else e for e in segment_entries]
+        revision = hashlib.md5(json.dumps(segment_entries).encode('utf-8')).hexdigest()[:8]
+        segment['key'] = (f"{config.S3_MANIFEST_PREFIX}segment_"
+                          f"{segment['start_row']:012d}_{segment['end_row']:012d}_{revision}.json")
+        _put_json(s3_client, segment['key'], {'entries': segment_entries})
+        _put_json(s3_client, f"{config.S3_MANIFEST_PREFIX}manifest.json", manifest)
+        return manifest
+    
+    entries = [e for e in manifest['entries'] if e['key'] != entry['key']]
+    if len(entries) == len(manifest['entries']):
+        manifest['chunk_count'] += 1
+    entries.append(entry)
+    entries.sort(key=lambda e: e['start_row'])
+    manifest['entries'] = entries
+    
+    if len(entries) >= config.MANIFEST_COMPACT_EVERY:
+        segment_key = (f"{config.S3_MANIFEST_PREFIX}segment_"
+                       f"{entries[0]['start_row']:012d}_{entries[-1]['end_row']:012d}.json")
+        _put_json(s3_client, segment_key, {'entries': entries})
+        manifest['segments'].append({
+            'key': segment_key,
+            'start_row': entries[0]['start_row'],
+            'end_row': entries[-1]['end_row']
+        })
+        manifest['entries'] = []
+    
+    _put_json(s3_client, f"{config.S3_MANIFEST_PREFIX}manifest.json", manifest)
+    return manifest
+
+def list_manifest_chunks(segment_cache=None, s3_client=None):
+    """
+    Return all chunk entries from the manifest, ordered by start row.
+    Segments are immutable, so a caller-supplied segment_cache dict makes
+    steady-state reads a single GET of the manifest head.
+    """
+    s3_client = s3_client or get_s3_client()
+    manifest = load_manifest(s3_client)
+    segment_cache = segment_cache if segment_cache is not None else {}
+    
+    chunks = []
+    for segment in manifest['segments']:
+        if segment['key'] not in segment_cache:
+            segment_cache[segment['key']] = load_manifest_segment(segment['key'], s3_client)
+        chunks.extend(segment_cache[segment['key']])
+    chunks.extend(manifest['entries'])
+    
+    # Catch-up uploads can complete out of order, so segments may interleave
+    chunks.sort(key=lambda c: c['start_row'])
+    return chunks
 
+@resilience.retry('s3')
 def list_s3_transaction_files():
-    """List all transaction files in S3"""
+    """List all transaction files in S3 (prefer list_manifest_chunks, which needs no LIST)"""
     s3_client = get_s3_client()
     
     response = s3_client.list_objects_v2(
@@ -96,11 +544,74 @@ def list_s3_transaction_files():
     
     return files
 
-def download_s3_file_to_dataframe(s3_key):
-    """Download S3 file and convert to DataFrame"""
+@resilience.retry('s3')
+def download_s3_file_to_dataframe(s3_key, expected_checksum=None):
+    """
+    Download S3 file and convert to DataFrame, optionally verifying its MD5 checksum.
+    The body is decompressed and parsed as it streams in; objects without a
+    Content-Encoding (older chunks) are read as plain CSV.
+    """
     s3_client = get_s3_client()
     
+    if isinstance(s3_client, storage.LocalObjectStore):
+        return _read_mapped_chunk(s3_client, s3_key, expected_checksum)
+    
     obj = s3_client.get_object(Bucket=config.S3_BUCKET, Key=s3_key)
-    df = pd.read_csv(io.BytesIO(obj['Body'].read()))
+    return _read_chunk(obj['Body'], obj.get('ContentEncoding'), s3_key, expected_checksum)
+
+def _read_mapped_chunk(store, s3_key, expected_checksum):
+    """
+    Parse a chunk of the local backend straight from its memory-mapped file:
+    the checksum is computed over the mapping and the parser reads from it,
+    so the object is never copied into Python bytes.
+    """
+    with store.open_mapped(config.S3_BUCKET, s3_key) as (mapped, head):
+        if expected_checksum and hashlib.md5(mapped).hexdigest() != expected_checksum:
+            raise ValueError(f"Checksum mismatch for {s3_key}")
+        
+        reader = MappedReader(mapped)
+        try:
+            stream = _decompressing_reader(io.BufferedReader(reader), head.get('ContentEncoding'))
+            return pd.read_csv(stream)
+        finally:
+            # The mapping cannot be closed while a view of it is alive
+            reader.close()
+
+class MappedReader(io.RawIOBase):
+    """Readable stream over a buffer (e.g. an mmap), copying only into the reader's buffer"""
+    
+    def __init__(self, buffer):
+        super().__init__()
+        self.view = memoryview(buffer)
+        self.position = 0
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        data = self.view[self.position:self.position + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+    
+    def close(self):
+        # Release the view so the mapping can be closed
+        self.view.release()
+        super().close()
+
+def read_chunk_bytes(data, s3_key, content_encoding=None, expected_checksum=None):
+    """Parse a chunk from a copy of its S3 object bytes (e.g. handed over in shared memory)"""
+    encoding = content_encoding if content_encoding != 'none' else None
+    return _read_chunk(io.BytesIO(data), encoding, s3_key, expected_checksum)
+
+def _read_chunk(raw, content_encoding, s3_key, expected_checksum):
+    """Decompress and parse a chunk stream, verifying the checksum of the raw bytes"""
+    body = HashingReader(raw)
+    stream = _decompressing_reader(io.BufferedReader(body), content_encoding)
+    
+    df = pd.read_csv(stream)
+    
+    if expected_checksum and body.drain() != expected_checksum:
+        raise ValueError(f"Checksum mismatch for {s3_key}")
     
     return df
@@ -0,0 +1,148 @@
+# sliding_window.py
+"""
+Sliding-window detection (DETECTION_WINDOW_DAYS > 0): PatId1/2/3 only look at
+transactions whose transaction_date falls in the last DETECTION_WINDOW_DAYS
+days, counted back from the newest transaction_date seen.
+
+window_buckets keeps one aggregate row per day and (customer, name, gender,
+merchant, type), updated from each inserted batch in the same transaction.
+Days that fall out of the window are deleted by range on the leading primary
+key column, so the table and every detection query over it stay bounded by the
+window size instead of growing with the transactions table.
+
+The window size the buckets were built for is kept as the window_days row of
+system_counters (0 while the window is off and the buckets are not maintained).
+Growing the window, or turning it back on, needs a rebuild since the missing
+days were already expired or never recorded.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from psycopg2.extras import execute_values
+import compact_schema
+import config
+import retention
+
+def create_tables(cur):
+    """Create window_buckets and the window_facts view, returns True if the table is new"""
+    cur.execute("SELECT to_regclass('window_buckets') IS NULL")
+    created = cur.fetchone()[0]
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS window_buckets (
+            day DATE,
+            customer_id VARCHAR(100),
+            customer_name VARCHAR(200),
+            gender VARCHAR(10),
+            merchant_id VARCHAR(100),
+            transaction_type VARCHAR(50),
+            transaction_count BIGINT NOT NULL,
+            amount_sum DECIMAL(20, 2) NOT NULL,
+            PRIMARY KEY (day, customer_id, customer_name, gender, merchant_id, transaction_type)
+        );
+    """)
+
+    # Recreated on every start so a smaller DETECTION_WINDOW_DAYS applies at once
+    # (a larger one is rebuilt, see needs_rebuild); same columns as retention's transaction_facts
+    cur.execute(f"""
+        CREATE OR REPLACE VIEW window_facts AS
+        SELECT customer_id, customer_name, gender, merchant_id, transaction_type,
+               transaction_count, amount_sum
+        FROM window_buckets
+        WHERE day > (SELECT MAX(day) FROM window_buckets) - {int(config.DETECTION_WINDOW_DAYS)};
+    """)
+    return created
+
+def stored_window_days(cur):
+    """Window size the buckets are maintained for, None if never recorded"""
+    cur.execute("SELECT value FROM system_counters WHERE name = 'window_days'")
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def record_window_days(cur, days):
+    """Record the window size the buckets are maintained for (0 = not maintained)"""
+    cur.execute("""
+        INSERT INTO system_counters (name, value)
+        VALUES ('window_days', %s)
+        ON CONFLICT (name)
+        DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP
+    """, (int(days),))
+
+def needs_rebuild(cur):
+    """
+    True when the buckets cover fewer days than DETECTION_WINDOW_DAYS: the
+    window grew, or it was off (or never recorded) so inserts were missed.
+    A smaller window only needs the new size recorded.
+    """
+    stored = stored_window_days(cur)
+    if not stored or stored < config.DETECTION_WINDOW_DAYS:
+        return True
+    if stored != config.DETECTION_WINDOW_DAYS:
+        record_window_days(cur, config.DETECTION_WINDOW_DAYS)
+    return False
+
+def apply_transactions(cur, transactions_data, inserted_ids):
+    """
+    Fold newly inserted transaction tuples (database.insert_transactions layout)
+    into their day buckets and expire the days that left the window, within the
+    caller's transaction. Rows already older than the window are skipped, as
+    are repeats of an id within the batch (inserted only once).
+    """
+    pending_ids = set(inserted_ids)
+    cur.execute("SELECT MAX(day) FROM window_buckets")
+    newest = cur.fetchone()[0]
+
+    buckets = defaultdict(lambda: [0, 0])
+    for (transaction_id, customer_id, customer_name, gender, merchant_id,
+         transaction_type, amount, transaction_date) in transactions_data:
+        if transaction_id not in pending_ids:
+            continue
+        pending_ids.discard(transaction_id)
+        totals = buckets[(transaction_date.date(), customer_id, customer_name, gender,
+                          merchant_id, transaction_type)]
+        totals[0] += 1
+        totals[1] += compact_schema.to_cents(amount)
+
+    if not buckets:
+        return
+
+    batch_newest = max(key[0] for key in buckets)
+    newest = max(newest, batch_newest) if newest else batch_newest
+    cutoff = newest - timedelta(days=config.DETECTION_WINDOW_DAYS)
+
+    rows = sorted(key + (count, Decimal(cents) / 100)
+                  for key, (count, cents) in buckets.items() if key[0] > cutoff)
+    # Sorted so concurrent writers lock bucket rows in the same order
+    execute_values(cur, """
+        INSERT INTO window_buckets
+        (day, customer_id, customer_name, gender, merchant_id, transaction_type,
+        transaction_count, amount_sum)
+        VALUES %s
+        ON CONFLICT (day, customer_id, customer_name, gender, merchant_id, transaction_type)
+        DO UPDATE SET transaction_count = window_buckets.transaction_count + EXCLUDED.transaction_count,
+                      amount_sum = window_buckets.amount_sum + EXCLUDED.amount_sum
+    """, rows)
+
+    cur.execute("DELETE FROM window_buckets WHERE day <= %s", (cutoff,))
+
+def rebuild(cur, source):
+    """Recompute the window from the transactions relation (legacy column layout)"""
+    cur.execute("DELETE FROM window_buckets")
+    cur.execute(f"""
+        INSERT INTO window_buckets
+        (day, customer_id, customer_name, gender, merchant_id, transaction_type,
+        transaction_count, amount_sum)
+        SELECT transaction_date::DATE, customer_id, customer_name, gender, merchant_id,
+               transaction_type, COUNT(*), SUM(transaction_amount)
+        FROM {source}
+        WHERE transaction_date::DATE > (SELECT MAX(transaction_date)::DATE FROM {source})
+                                       - %s
+        GROUP BY transaction_date::DATE, customer_id, customer_name, gender, merchant_id,
+                 transaction_type
+    """, (int(config.DETECTION_WINDOW_DAYS),))
+    record_window_days(cur, config.DETECTION_WINDOW_DAYS)
+
+# The aggregate-aware queries of retention.py, over the window instead of all history
+PATTERN_1_QUERY = retention.PATTERN_1_QUERY.replace('transaction_facts', 'window_facts')
+PATTERN_2_QUERY = retention.PATTERN_2_QUERY.replace('transaction_facts', 'window_facts')
+PATTERN_3_QUERY = retention.PATTERN_3_QUERY.replace('transaction_facts', 'window_facts')
@@ -0,0 +1,224 @@
+# storage.py
+"""
+Local filesystem storage backends, selected by config:
+    STORAGE_BACKEND=local   LocalObjectStore replaces the S3 client
+    SOURCE_BACKEND=local    LocalSourceFolder replaces the Google Drive service
+so the pipeline runs on one box without cloud credentials or network round trips.
+
+LocalObjectStore implements the subset of the boto3 S3 client that s3_handler
+and its callers use (put/get_object, multipart uploads, list_objects_v2 and
+its paginator), so every s3_handler function works unchanged on either
+backend. Objects live at <root>/<bucket>/<key>, their content type, encoding
+and metadata in <root>/.meta/<bucket>/<key>.json. Every write goes to a
+temporary file that is renamed into place, so readers never see a partial
+object. open_mapped() memory-maps an object for reads without copying it
+into Python bytes.
+"""
+import hashlib
+import json
+import mmap
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+class NoSuchKey(KeyError):
+    """Raised by LocalObjectStore for a missing object (S3's NoSuchKey)"""
+
+def _replace_atomically(path, data=None, source=None):
+    """Write data (or move the file source) to path through a rename"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if source is None:
+        source = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(source, 'wb') as f:
+            f.write(data)
+    os.replace(source, path)
+
+class LocalObjectStore:
+    def __init__(self, root):
+        self.root = root
+
+    def object_path(self, bucket, key):
+        if key.startswith('.') or '..' in key.split('/'):
+            raise ValueError(f"Invalid key: {key}")
+        return os.path.join(self.root, bucket, key)
+
+    def _meta_path(self, bucket, key):
+        return os.path.join(self.root, '.meta', bucket, key + '.json')
+
+    def _upload_path(self, upload_id):
+        return os.path.join(self.root, '.uploads', upload_id)
+
+    def _write_meta(self, bucket, key, content_type, content_encoding, metadata):
+        meta = {'ContentType': content_type, 'Metadata': metadata or {}}
+        if content_encoding:
+            meta['ContentEncoding'] = content_encoding
+        _replace_atomically(self._meta_path(bucket, key), json.dumps(meta).encode('utf-8'))
+
+    def head_object(self, Bucket, Key):
+        path = self.object_path(Bucket, Key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise NoSuchKey(Key) from None
+
+        try:
+            with open(self._meta_path(Bucket, Key), 'rb') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {'ContentType': 'binary/octet-stream', 'Metadata': {}}
+        meta['ContentLength'] = stat.st_size
+        meta['LastModified'] = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        return meta
+
+    def put_object(self, Bucket, Key, Body, ContentType='binary/octet-stream',
+                   ContentEncoding=None, Metadata=None):
+        data = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+        # Metadata first: a reader never sees an object without its encoding
+        self._write_meta(Bucket, Key, ContentType, ContentEncoding, Metadata)
+        _replace_atomically(self.object_path(Bucket, Key), data)
+        return {'ETag': f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def get_object(self, Bucket, Key):
+        response = self.head_object(Bucket, Key)
+        try:
+            response['Body'] = open(self.object_path(Bucket, Key), 'rb')
+        except FileNotFoundError:
+            raise NoSuchKey(Key) from None
+        return response
+
+    @contextmanager
+    def open_mapped(self, Bucket, Key):
+        """
+        Yield (buffer, head) with the object memory-mapped read-only. The file
+        stays open, so a concurrent overwrite (a rename) does not affect it.
+        """
+        head = self.head_object(Bucket, Key)
+        try:
+            f = open(self.object_path(Bucket, Key), 'rb')
+        except FileNotFoundError:
+            raise NoSuchKey(Key) from None
+
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # mmap cannot map an empty file
+                yield memoryview(b''), head
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped, head
+
+    def create_multipart_upload(self, Bucket, Key, ContentType='binary/octet-stream',
+                                ContentEncoding=None):
+        upload_id = uuid.uuid4().hex
+        path = self._upload_path(upload_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb'):
+            pass
+        with open(path + '.json', 'w') as f:
+            json.dump({'ContentType': ContentType, 'ContentEncoding': ContentEncoding,
+                       'parts': 0}, f)
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        """Append a part; parts must arrive in order, as S3StreamWriter sends them"""
+        path = self._upload_path(UploadId)
+        with open(path + '.json') as f:
+            upload = json.load(f)
+        if PartNumber != upload['parts'] + 1:
+            raise ValueError(f"Part {PartNumber} out of order (expected {upload['parts'] + 1})")
+
+        with open(path, 'ab') as f:
+            f.write(Body)
+        upload['parts'] = PartNumber
+        with open(path + '.json', 'w') as f:
+            json.dump(upload, f)
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        path = self._upload_path(UploadId)
+        with open(path + '.json') as f:
+            upload = json.load(f)
+        if len(MultipartUpload['Parts']) != upload['parts']:
+            raise ValueError(f"Upload {UploadId} has {upload['parts']} parts, "
+                             f"{len(MultipartUpload['Parts'])} listed")
+
+        self._write_meta(Bucket, Key, upload['ContentType'], upload['ContentEncoding'], None)
+        _replace_atomically(self.object_path(Bucket, Key), source=path)
+        os.remove(path + '.json')
+        return {'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        path = self._upload_path(UploadId)
+        for leftover in (path, path + '.json'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        """All keys under Prefix in key order, in one page"""
+        bucket_root = os.path.join(self.root, Bucket)
+        # Only walk the deepest directory the prefix pins down
+        start = os.path.join(bucket_root, os.path.dirname(Prefix))
+
+        contents = []
+        for directory, subdirectories, files in os.walk(start):
+            subdirectories[:] = [d for d in subdirectories if not d.startswith('.')]
+            for name in files:
+                if '.tmp-' in name:
+                    continue
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, bucket_root).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    stat = os.stat(path)
+                    contents.append({
+                        'Key': key,
+                        'Size': stat.st_size,
+                        'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+                    })
+
+        contents.sort(key=lambda obj: obj['Key'])
+        response = {'KeyCount': len(contents), 'IsTruncated': False, 'Prefix': Prefix}
+        if contents:
+            response['Contents'] = contents
+        return response
+
+    def get_paginator(self, operation_name):
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(operation_name)
+        return _SinglePagePaginator(self.list_objects_v2)
+
+    def list_buckets(self):
+        names = sorted(d for d in os.listdir(self.root) if not d.startswith('.')) \
+            if os.path.isdir(self.root) else []
+        return {'Buckets': [{'Name': name} for name in names]}
+
+    def create_bucket(self, Bucket, **kwargs):
+        os.makedirs(os.path.join(self.root, Bucket), exist_ok=True)
+        return {}
+
+class _SinglePagePaginator:
+    def __init__(self, operation):
+        self.operation = operation
+
+    def paginate(self, **kwargs):
+        yield self.operation(**kwargs)
+
+class LocalSourceFolder:
+    """
+    Stand-in for the Google Drive service: the source folder is a local
+    directory and file ids are file names in it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def list_files(self):
+        if not os.path.isdir(self.path):
+            return []
+        return [
+            {'id': name, 'name': name, 'mimeType': 'text/csv'}
+            for name in sorted(os.listdir(self.path))
+            if os.path.isfile(os.path.join(self.path, name))
+        ]
+
+    def file_path(self, file_id):
+        return os.path.join(self.path, file_id)
@@ -0,0 +1,368 @@
+# supervisor.py
+"""
+Multiprocess runner: Mechanism X, Y_WORKERS Y ingest workers and one detector
+each run in their own process, so CSV encoding, decoding and detection use
+separate cores instead of sharing one GIL.
+
+X hands every published chunk to the ingest workers through a queue; the
+chunk's uploaded (compressed) bytes travel in a shared memory block, so the
+workers skip the S3 download but still verify the same checksum. Workers fall
+back to S3 when the block is missing; chunks already queued are ingested
+together in one insert. Ingested chunks are reported to the detector, which
+runs one detection/upload pass per batch of chunks.
+
+Crashed processes are restarted with exponential backoff and the chunks a
+crashed worker was holding are queued again (inserts are idempotent), also
+while draining. On start, manifest chunks not yet recorded as ingested (lost
+with the queue of a previous supervisor) are queued before X hands off new ones.
+SIGTERM/SIGINT drain: X stops, workers finish the queue, the detector runs a
+last pass, then everything exits.
+
+Run with: python supervisor.py  (or RUNNER=processes python main.py)
+"""
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from multiprocessing import shared_memory
+import config
+
+def _child_setup(name):
+    """Common process start: ignore terminal signals (the supervisor drains us), enable profiling"""
+    import profiling
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    profiling.install()
+    print(f"{name} started (pid {os.getpid()})")
+
+def run_x(chunk_queue):
+    """Mechanism X process: upload chunks, hand each one to the ingest workers"""
+    from mechanism_x import MechanismX
+    import profiling
+
+    profiling.install()
+    # SIGTERM from the supervisor stops X the same way Ctrl-C does
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    def handoff(chunk_info, data):
+        message = {
+            'key': chunk_info['key'],
+            'checksum': chunk_info['checksum'],
+            'encoding': config.CHUNK_COMPRESSION,
+            'shm': None,
+            'size': len(data),
+            'rows': chunk_info['row_count'],
+        }
+        if config.HANDOFF_SHARED_MEMORY and data:
+            block = shared_memory.SharedMemory(create=True, size=len(data))
+            block.buf[:len(data)] = data
+            message['shm'] = block.name
+            # The worker that ingests the chunk unlinks the block
+            block.close()
+        chunk_queue.put(message)
+
+    mechanism_x = MechanismX()
+    mechanism_x.handoff = handoff
+    mechanism_x.run()
+
+def _read_handoff(message):
+    """Parse a chunk from its shared memory block, None if the block is gone"""
+    import s3_handler
+
+    try:
+        block = shared_memory.SharedMemory(name=message['shm'])
+    except FileNotFoundError:
+        return None
+
+    try:
+        return s3_handler.read_chunk_bytes(
+            bytes(block.buf[:message['size']]), message['key'],
+            message['encoding'], message['checksum']
+        )
+    finally:
+        block.close()
+
+def _unlink(shm_name):
+    try:
+        block = shared_memory.SharedMemory(name=shm_name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+def _wait_for_circuit(fn):
+    """Run fn, waiting out open circuits instead of crashing the process"""
+    import resilience
+
+    while True:
+        try:
+            return fn()
+        except resilience.CircuitOpenError as e:
+            print(f"{multiprocessing.current_process().name} waiting: {e}")
+            time.sleep(max(e.retry_after, 0.1))
+
+def run_ingest_worker(worker_id, chunk_queue, event_queue):
+    """
+    Y ingest worker process: parse and insert chunks until a None sentinel.
+    Chunks already queued are coalesced into one insert within the
+    INGEST_BATCH_MAX_ROWS/INGEST_BATCH_MAX_BYTES budget (at least one chunk).
+    """
+    _child_setup(f"Y ingest worker {worker_id}")
+    from mechanism_y import MechanismY
+
+    mechanism_y = MechanismY(backend='sql')
+
+    carried = None  # taken off the queue but over the last batch's budget
+    stopping = False
+    while not stopping:
+        message = carried if carried is not None else chunk_queue.get()
+        carried = None
+        if message is None:
+            break
+
+        batch = [message]
+        rows = message['rows']
+        size = message['size']
+        while True:
+            try:
+                message = chunk_queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is None:
+                stopping = True
+                break
+            if (rows + message['rows'] > config.INGEST_BATCH_MAX_ROWS or
+                    size + message['size'] > config.INGEST_BATCH_MAX_BYTES):
+                carried = message
+                break
+            batch.append(message)
+            rows += message['rows']
+            size += message['size']
+
+        # The carried chunk counts as in flight too, so a crash requeues it
+        event_queue.put(('start', worker_id, batch + ([carried] if carried else [])))
+        chunk_dfs = [_read_handoff(m) if m['shm'] else None for m in batch]
+        for message, chunk_df in zip(batch, chunk_dfs):
+            if chunk_df is None:
+                mechanism_y.chunk_checksums[message['key']] = message['checksum']
+        _wait_for_circuit(lambda: mechanism_y.process_transaction_batch(
+            [m['key'] for m in batch], chunk_dfs
+        ))
+
+        for message in batch:
+            if message['shm']:
+                _unlink(message['shm'])
+        event_queue.put(('done', worker_id, batch))
+
+def run_detector(detect_queue):
+    """Detector process: one detection and upload pass per batch of ingested chunks"""
+    _child_setup("Y detector")
+    from mechanism_y import MechanismY
+    import profiling
+
+    mechanism_y = MechanismY(backend='sql')
+    mechanism_y.y_start_time = mechanism_y.get_ist_time()
+
+    def detect_and_upload():
+        with profiling.stage('y_detect'):
+            _wait_for_circuit(mechanism_y.detect_all_patterns)
+        with profiling.stage('y_upload'):
+            _wait_for_circuit(mechanism_y.upload_detection_batches)
+
+    # Keys a crashed detector had taken off the queue are gone; catch up on
+    # whatever was ingested before blocking for the next ingest
+    detect_and_upload()
+
+    stopping = False
+    while not stopping:
+        keys = [detect_queue.get()]
+        # Coalesce everything ingested meanwhile into the same pass
+        while True:
+            try:
+                keys.append(detect_queue.get_nowait())
+            except queue.Empty:
+                break
+        stopping = None in keys
+        detect_and_upload()
+
+def run_retention():
+    _child_setup("Retention")
+    import retention
+    retention.run_forever()
+
+class Supervisor:
+    def __init__(self, workers=None):
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = workers or config.Y_WORKERS
+        self.chunk_queue = self.context.Queue()
+        self.event_queue = self.context.Queue()
+        self.detect_queue = self.context.Queue()
+        self.processes = {}
+        self.restarts = {}
+        self.started_at = {}
+        self.restart_at = {}
+        self.in_flight = {}
+        self.finished = set()
+        self.stopping = False
+
+    def specs(self):
+        """name -> (target, args) for every supervised process"""
+        specs = {'x': (run_x, (self.chunk_queue,)),
+                 'detector': (run_detector, (self.detect_queue,))}
+        for worker_id in range(self.workers):
+            specs[f'ingest_{worker_id}'] = (
+                run_ingest_worker, (worker_id, self.chunk_queue, self.event_queue)
+            )
+        if config.RETENTION_ENABLED:
+            specs['retention'] = (run_retention, ())
+        return specs
+
+    def start(self, name):
+        target, args = self.specs()[name]
+        process = self.context.Process(target=target, args=args, name=name, daemon=False)
+        process.start()
+        self.processes[name] = process
+        self.started_at[name] = time.time()
+
+    def handle_events(self, timeout):
+        """Track chunks in flight per worker and forward ingested chunks to the detector"""
+        try:
+            event, worker_id, batch = self.event_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        worker = f'ingest_{worker_id}'
+        if event == 'start':
+            self.in_flight[worker] = batch
+        else:
+            self.in_flight.pop(worker, None)
+            for message in batch:
+                self.detect_queue.put(message['key'])
+
+    def backfill(self):
+        """Queue manifest chunks that were published but never recorded as ingested"""
+        import database
+        import s3_handler
+
+        ingested = database.get_ingested_chunk_keys()
+        missing = [c for c in s3_handler.list_manifest_chunks() if c['key'] not in ingested]
+        for chunk in missing:
+            # No shared memory block: the worker downloads the chunk from S3
+            self.chunk_queue.put({
+                'key': chunk['key'],
+                'checksum': chunk['checksum'],
+                'encoding': config.CHUNK_COMPRESSION,
+                'shm': None,
+                'size': chunk['byte_size'],
+                'rows': chunk['row_count'],
+            })
+        if missing:
+            print(f"Supervisor: queued {len(missing)} published chunks not yet ingested")
+
+    def check_processes(self):
+        """Restart processes that died, with exponential backoff"""
+        now = time.time()
+        for name, process in list(self.processes.items()):
+            if process.is_alive() or name in self.finished:
+                continue
+
+            # Pick up the dead worker's last events before deciding what it held
+            while not self.event_queue.empty():
+                self.handle_events(timeout=0.1)
+
+            if process.exitcode == 0 and (name == 'x' or self.stopping):
+                # X ran out of rows, or the process finished its drain: nothing to restart
+                self.finished.add(name)
+                continue
+
+            if name not in self.restart_at:
+                # A process that stayed up for a while starts the backoff again
+                if now - self.started_at[name] > config.SUPERVISOR_BACKOFF_RESET:
+                    self.restarts[name] = 0
+                delay = min(config.SUPERVISOR_BACKOFF_BASE * 2 ** self.restarts.get(name, 0),
+                            config.SUPERVISOR_BACKOFF_MAX)
+                self.restart_at[name] = now + delay
+                print(f"Supervisor: {name} exited with code {process.exitcode}, "
+                      f"restarting in {delay:.0f}s")
+
+                # Whatever the worker was ingesting goes back on the queue
+                for message in self.in_flight.pop(name, []):
+                    self.chunk_queue.put(message)
+                if self.stopping and name.startswith('ingest_'):
+                    # The crashed worker may have taken its sentinel already
+                    self.chunk_queue.put(None)
+
+            if now >= self.restart_at[name]:
+                del self.restart_at[name]
+                self.restarts[name] = self.restarts.get(name, 0) + 1
+                self.start(name)
+
+    def request_stop(self, signum=None, frame=None):
+        if not self.stopping:
+            print("\nSupervisor: draining...")
+        self.stopping = True
+
+    def drain(self):
+        """Stop X, let workers finish the queue, run a last detection pass"""
+        x = self.processes['x']
+        if x.is_alive():
+            os.kill(x.pid, signal.SIGTERM)
+        x.join()
+        self.finished.add('x')
+
+        for _ in range(self.workers):
+            self.chunk_queue.put(None)
+        # Workers that die while draining are restarted and their chunks requeued
+        workers = [name for name in self.processes if name.startswith('ingest_')]
+        while not all(name in self.finished for name in workers):
+            self.handle_events(timeout=0.2)
+            self.check_processes()
+        while not self.event_queue.empty():
+            self.handle_events(timeout=0.2)
+
+        self.detect_queue.put(None)
+        self.processes['detector'].join()
+
+        if 'retention' in self.processes:
+            self.processes['retention'].terminate()
+            self.processes['retention'].join()
+
+        # Blocks of chunks nobody ingested (e.g. a worker died during drain)
+        for batch in self.in_flight.values():
+            for message in batch:
+                if message['shm']:
+                    _unlink(message['shm'])
+
+    def run(self):
+        if config.DETECTION_BACKEND != 'sql':
+            print("Supervisor needs DETECTION_BACKEND=sql (workers share the database)")
+            return 1
+
+        import database
+        database.init_database()
+        self.backfill()
+
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+        for name in self.specs():
+            self.start(name)
+        print(f"Supervisor: started X, {self.workers} ingest workers and the detector")
+
+        while not self.stopping:
+            self.handle_events(timeout=0.5)
+            self.check_processes()
+
+        self.drain()
+        print("Supervisor: stopped")
+        return 0
+
+def main():
+    print("=" * 60)
+    print("Transaction Processing System (multiprocess)")
+    print("=" * 60)
+    return Supervisor().run()
+
+if __name__ == "__main__":
+    sys.exit(main())
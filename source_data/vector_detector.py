@@ -0,0 +1,328 @@
+# vector_detector.py
+"""
+Database-free detection backend: keeps transactions in a columnar, dictionary-encoded
+in-memory store and evaluates PatId1/PatId2/PatId3 with NumPy/pandas group-bys.
+Produces the same detections as the SQL detectors in mechanism_y.py.
+"""
+import numpy as np
+import pandas as pd
+
+STRING_COLUMNS = ('customer_id', 'customer_name', 'gender', 'merchant_id', 'transaction_type')
+
+# Gender classes after UPPER(gender) normalisation
+GENDER_OTHER = 0
+GENDER_FEMALE = 1
+GENDER_MALE = 2
+
+def to_cents(amounts):
+    """Convert float amounts to integer cents the way DECIMAL(_, 2) rounds them"""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    # Round away the float noise first so e.g. 0.145 rounds half-up like Postgres does
+    scaled = np.round(np.abs(amounts) * 100, 6)
+    return (np.sign(amounts) * np.floor(scaled + 0.5)).astype(np.int64)
+
+def percentile_cont(group_codes, values, fraction):
+    """
+    Per-group PERCENTILE_CONT with Postgres interpolation semantics.
+    Returns a dict of group code -> percentile.
+    """
+    if len(values) == 0:
+        return {}
+
+    order = np.lexsort((values, group_codes))
+    sorted_groups = group_codes[order]
+    sorted_values = values[order].astype(np.float64)
+
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    counts = np.diff(np.r_[starts, len(sorted_values)])
+
+    position = fraction * (counts - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    proportion = position - lower
+
+    first = sorted_values[starts + lower]
+    second = sorted_values[starts + upper]
+    result = np.where(lower == upper, first, first + proportion * (second - first))
+
+    return dict(zip(sorted_groups[starts].tolist(), result.tolist()))
+
+class ColumnStore:
+    """Append-only columnar store with dictionary-encoded string columns"""
+
+    def __init__(self, initial_capacity=1 << 16):
+        self.dictionaries = {column: {} for column in STRING_COLUMNS}
+        self.values = {column: [] for column in STRING_COLUMNS}
+        self.transaction_ids = set()
+        self.size = 0
+        self.capacity = 0
+        self.columns = {}
+        self._allocate(initial_capacity)
+
+    def _allocate(self, capacity):
+        """Grow column arrays (amortised doubling)"""
+        new_columns = {column: np.empty(capacity, dtype=np.int32) for column in STRING_COLUMNS}
+        new_columns['amount_cents'] = np.empty(capacity, dtype=np.int64)
+        new_columns['transaction_date'] = np.empty(capacity, dtype='datetime64[ns]')
+
+        for name, array in self.columns.items():
+            new_columns[name][:self.size] = array[:self.size]
+
+        self.columns = new_columns
+        self.capacity = capacity
+
+    def encode(self, column, raw_values):
+        """Dictionary-encode a batch of strings, adding unseen values to the dictionary"""
+        local_codes, uniques = pd.factorize(pd.Series(raw_values, dtype=object), sort=False)
+        dictionary = self.dictionaries[column]
+        values = self.values[column]
+
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = dictionary.get(value)
+            if code is None:
+                code = len(values)
+                dictionary[value] = code
+                values.append(value)
+            mapping[i] = code
+
+        return mapping[local_codes]
+
+    def decode(self, column, codes):
+        """Map codes back to their string values"""
+        values = self.values[column]
+        return [values[code] for code in codes]
+
+    def column(self, name):
+        """Return a view of the populated part of a column"""
+        return self.columns[name][:self.size]
+
+    def append(self, transactions_data):
+        """
+        Append rows in the same tuple layout as database.insert_transactions.
+        Rows whose transaction_id is already stored are skipped (ON CONFLICT DO NOTHING).
+        Returns the number of rows inserted.
+        """
+        new_rows = []
+        for row in transactions_data:
+            if row[0] not in self.transaction_ids:
+                self.transaction_ids.add(row[0])
+                new_rows.append(row)
+
+        if not new_rows:
+            return 0
+
+        (_, customer_ids, customer_names, genders, merchant_ids,
+         transaction_types, amounts, dates) = zip(*new_rows)
+
+        count = len(new_rows)
+        if self.size + count > self.capacity:
+            self._allocate(max(self.capacity * 2, self.size + count))
+
+        end = self.size + count
+        raw = {
+            'customer_id': customer_ids,
+            'customer_name': customer_names,
+            'gender': genders,
+            'merchant_id': merchant_ids,
+            'transaction_type': transaction_types,
+        }
+        for column in STRING_COLUMNS:
+            self.columns[column][self.size:end] = self.encode(column, raw[column])
+
+        self.columns['amount_cents'][self.size:end] = to_cents(amounts)
+        self.columns['transaction_date'][self.size:end] = pd.to_datetime(
+            pd.Series(dates), cache=False
+        ).to_numpy(dtype='datetime64[ns]')
+
+        self.size = end
+        return count
+
+class VectorDetector:
+    def __init__(self):
+        self.store = ColumnStore()
+        self.importance = pd.DataFrame(
+            {'customer_id': np.empty(0, np.int32),
+             'transaction_type': np.empty(0, np.int32),
+             'weight_cents': np.empty(0, np.int64)}
+        )
+        # Keys of detections already emitted, mirrors the NOT EXISTS checks
+        self.detected = {'PatId1': set(), 'PatId2': set(), 'PatId3': set()}
+        self.pending_detections = []
+        self.next_detection_id = 1
+
+    def load_customer_importance(self, importance_data):
+        """Load (customer_id, transaction_type, weightage) rows, later rows win"""
+        if not importance_data:
+            return
+
+        customer_ids, transaction_types, weights = zip(*importance_data)
+        new_rows = pd.DataFrame({
+            'customer_id': self.store.encode('customer_id', [str(c) for c in customer_ids]),
+            'transaction_type': self.store.encode('transaction_type', [str(t) for t in transaction_types]),
+            'weight_cents': to_cents([float(w) for w in weights]),
+        })
+
+        self.importance = pd.concat([self.importance, new_rows], ignore_index=True).drop_duplicates(
+            subset=['customer_id', 'transaction_type'], keep='last'
+        ).reset_index(drop=True)
+
+    def load_existing_detections(self, detections):
+        """Seed dedup state from (pattern_id, customer_name, merchant_id) rows"""
+        for pattern_id, customer_name, merchant_id in detections:
+            if pattern_id == 'PatId3':
+                self.detected[pattern_id].add(merchant_id)
+            elif pattern_id in self.detected:
+                self.detected[pattern_id].add((customer_name, merchant_id))
+
+    def add_transactions(self, transactions_data):
+        """Ingest a chunk of transaction tuples, returns rows inserted"""
+        return self.store.append(transactions_data)
+
+    def find_pattern_1(self):
+        """Return new (customer_name, merchant_id) pairs matching PatId1"""
+        store = self.store
+        merchants = store.column('merchant_id')
+        if len(merchants) == 0:
+            return []
+
+        merchant_counts = np.bincount(merchants)
+        eligible = merchant_counts[merchants] > 50000
+        if not eligible.any():
+            return []
+
+        frame = pd.DataFrame({
+            'customer_id': store.column('customer_id')[eligible],
+            'customer_name': store.column('customer_name')[eligible],
+            'merchant_id': merchants[eligible],
+            'transaction_type': store.column('transaction_type')[eligible],
+        })
+
+        # customer_merchant_stats: one row per transaction type with its weightage
+        per_type = frame.groupby(
+            ['customer_id', 'customer_name', 'merchant_id', 'transaction_type'], sort=False
+        ).size().rename('transaction_count').reset_index()
+        per_type = per_type.merge(self.importance, how='left', on=['customer_id', 'transaction_type'])
+        per_type['weight_cents'] = per_type['weight_cents'].fillna(0)
+
+        # customer_avg_weight: totals and unweighted average over transaction types
+        per_customer = per_type.groupby(
+            ['customer_id', 'customer_name', 'merchant_id'], sort=False
+        ).agg(
+            total_transactions=('transaction_count', 'sum'),
+            weight_sum=('weight_cents', 'sum'),
+            type_count=('weight_cents', 'size'),
+        ).reset_index()
+        avg_weightage = (per_customer['weight_sum'] / (per_customer['type_count'] * 100.0)).to_numpy()
+        totals = per_customer['total_transactions'].to_numpy()
+        merchant_codes = per_customer['merchant_id'].to_numpy()
+
+        # merchant_percentiles
+        tx_90th = percentile_cont(merchant_codes, totals, 0.9)
+        weight_10th = percentile_cont(merchant_codes, avg_weightage, 0.1)
+        tx_threshold = np.array([tx_90th[m] for m in merchant_codes.tolist()])
+        weight_threshold = np.array([weight_10th[m] for m in merchant_codes.tolist()])
+
+        matched = per_customer[(totals >= tx_threshold) & (avg_weightage <= weight_threshold)]
+        pairs = matched[['customer_name', 'merchant_id']].drop_duplicates()
+
+        return self._new_pairs('PatId1', pairs)
+
+    def find_pattern_2(self):
+        """Return new (customer_name, merchant_id) pairs matching PatId2"""
+        store = self.store
+        if store.size == 0:
+            return []
+
+        frame = pd.DataFrame({
+            'customer_name': store.column('customer_name'),
+            'merchant_id': store.column('merchant_id'),
+            'amount_cents': store.column('amount_cents'),
+        })
+        grouped = frame.groupby(['customer_name', 'merchant_id'], sort=False)['amount_cents'].agg(
+            ['size', 'sum']
+        ).reset_index()
+
+        # AVG(amount) < 23 evaluated exactly in cents
+        matched = grouped[(grouped['size'] >= 80) & (grouped['sum'] < 2300 * grouped['size'])]
+
+        return self._new_pairs('PatId2', matched[['customer_name', 'merchant_id']])
+
+    def find_pattern_3(self):
+        """Return new merchant_ids matching PatId3"""
+        store = self.store
+        if store.size == 0:
+            return []
+
+        # Distinct on the raw gender value, then classify like UPPER(gender)
+        unique_customers = pd.DataFrame({
+            'merchant_id': store.column('merchant_id'),
+            'customer_id': store.column('customer_id'),
+            'gender': store.column('gender'),
+        }).drop_duplicates()
+
+        gender_class = np.array(
+            [GENDER_FEMALE if g.upper() == 'FEMALE' else GENDER_MALE if g.upper() == 'MALE' else GENDER_OTHER
+             for g in store.values['gender']],
+            dtype=np.int8
+        )
+        classes = gender_class[unique_customers['gender'].to_numpy()]
+        merchant_codes = unique_customers['merchant_id'].to_numpy()
+
+        num_merchants = len(store.values['merchant_id'])
+        female_count = np.bincount(merchant_codes[classes == GENDER_FEMALE], minlength=num_merchants)
+        male_count = np.bincount(merchant_codes[classes == GENDER_MALE], minlength=num_merchants)
+
+        matched = np.flatnonzero((female_count > 100) & (male_count > female_count))
+        merchants = store.decode('merchant_id', matched)
+
+        new_merchants = []
+        for merchant_id in merchants:
+            if merchant_id not in self.detected['PatId3']:
+                self.detected['PatId3'].add(merchant_id)
+                new_merchants.append(merchant_id)
+        return new_merchants
+
+    def _new_pairs(self, pattern_id, pairs):
+        """Decode (customer_name, merchant_id) code pairs and drop already detected ones"""
+        names = self.store.decode('customer_name', pairs['customer_name'].to_numpy())
+        merchants = self.store.decode('merchant_id', pairs['merchant_id'].to_numpy())
+
+        seen = self.detected[pattern_id]
+        new_pairs = []
+        for pair in zip(names, merchants):
+            if pair not in seen:
+                seen.add(pair)
+                new_pairs.append(pair)
+        return new_pairs
+
+    def detect_all_patterns(self, y_start_time, detection_time):
+        """
+        Run all pattern detections, returns detection tuples in the same layout
+        as the rows MechanismY inserts into detections
+        """
+        detections = []
+
+        for customer_name, merchant_id in self.find_pattern_1():
+            detections.append((y_start_time, detection_time, 'PatId1', 'UPGRADE', customer_name, merchant_id))
+
+        for customer_name, merchant_id in self.find_pattern_2():
+            detections.append((y_start_time, detection_time, 'PatId2', 'CHILD', customer_name, merchant_id))
+
+        for merchant_id in self.find_pattern_3():
+            detections.append((y_start_time, detection_time, 'PatId3', 'DEI-NEEDED', '', merchant_id))
+
+        for detection in detections:
+            self.pending_detections.append((self.next_detection_id,) + detection)
+            self.next_detection_id += 1
+
+        return detections
+
+    def get_unuploaded_detections(self, limit=50):
+        """Same layout as database.get_unuploaded_detections"""
+        return self.pending_detections[:limit]
+
+    def mark_detections_uploaded(self, detection_ids):
+        """Drop uploaded detections from the pending list"""
+        uploaded = set(detection_ids)
+        self.pending_detections = [d for d in self.pending_detections if d[0] not in uploaded]
@@ -21,6 +21,44 @@ def test_imports():
         print(f"❌ Import error: {e}")
         return False
 
+# Modules the quick commands must not load, and their cold-start budget (seconds)
+HEAVY_MODULES = ['pandas', 'numpy', 'boto3', 'botocore', 'googleapiclient', 'pyarrow']
+IMPORT_BUDGET = 0.5
+
+def test_import_budget():
+    """Check that cli.py and the monitor/status commands start without heavy imports"""
+    print("\nTesting import time of quick commands...")
+    import subprocess
+    
+    probe = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import cli, monitor\n"
+        "cli.build_parser()\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(elapsed, ','.join(heavy))\n"
+    )
+    try:
+        # Fresh interpreter: nothing imported by this script counts
+        output = subprocess.run(
+            [sys.executable, '-c', probe], capture_output=True, text=True, check=True
+        ).stdout.split()
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Import failed: {e.stderr.strip().splitlines()[-1]}")
+        return False
+    
+    elapsed = float(output[0])
+    heavy = output[1] if len(output) > 1 else ''
+    if heavy:
+        print(f"❌ cli/monitor import heavy modules at load: {heavy}")
+        return False
+    if elapsed > IMPORT_BUDGET:
+        print(f"❌ cli/monitor import took {elapsed:.3f}s (budget {IMPORT_BUDGET}s)")
+        return False
+    print(f"✅ cli/monitor import in {elapsed:.3f}s, no heavy modules loaded")
+    return True
+
 def test_config():
     """Test if configuration is set"""
     print("\nTesting configuration...")
@@ -75,14 +113,19 @@ def test_s3():
     print("\nTesting S3 connection...")
     try:
         import s3_handler
+        import config
         s3_client = s3_handler.get_s3_client()
         
+        if config.STORAGE_BACKEND == 'local':
+            s3_client.create_bucket(Bucket=config.S3_BUCKET)
+            print(f"✅ Local storage backend: {config.LOCAL_STORAGE_PATH}/{config.S3_BUCKET}/")
+            return True
+        
         # Try to list buckets
         response = s3_client.list_buckets()
         print(f"✅ S3 connection successful (found {len(response['Buckets'])} buckets)")
         
         # Check if our bucket exists
-        import config
         buckets = [b['Name'] for b in response['Buckets']]
         if config.S3_BUCKET in buckets:
             print(f"✅ Bucket '{config.S3_BUCKET}' exists")
@@ -102,6 +145,15 @@ def test_google_drive():
         import os
         import config
         
+        if config.SOURCE_BACKEND == 'local':
+            names = {name.lower() for name in os.listdir(config.SOURCE_PATH)} \
+                if os.path.isdir(config.SOURCE_PATH) else set()
+            if 'transactions.csv' not in names:
+                print(f"❌ transactions.csv not found in local source folder {config.SOURCE_PATH}")
+                return False
+            print(f"✅ Local source folder: {config.SOURCE_PATH}")
+            return True
+        
         if os.path.exists(config.CREDENTIALS_FILE):
             print(f"✅ Credentials file found: {config.CREDENTIALS_FILE}")
         else:
@@ -129,6 +181,7 @@ def main():
     
     results.append(("Imports", test_imports()))
     results.append(("Configuration", test_config()))
+    results.append(("Import budget", test_import_budget()))
     results.append(("Database", test_database()))
     results.append(("S3", test_s3()))
     results.append(("Google Drive", test_google_drive()))
@@ -145,7 +198,7 @@ def main():
     
     if all_passed:
         print("\n🎉 All tests passed! System is ready.")
-        print("Run 'python main.py' to start processing.")
+        print("Run 'python cli.py run-all' to start processing.")
         return 0
     else:
         print("\n⚠️  Some tests failed. Fix the issues above before running.")